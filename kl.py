@@ -2,6 +2,7 @@
 """
 启动脚本
 """
+import os
 import sys
 from pathlib import Path
 
@@ -12,7 +13,19 @@ if __name__ == "__main__":
     if len(sys.argv) > 1 and sys.argv[1] == "serve":
         # 启动 API 服务
         import uvicorn
-        uvicorn.run("src.api:app", host="0.0.0.0", port=8080, reload=True)
+
+        # KL_DEV=1 时热重载，否则不启动文件监视
+        # 默认单 worker：每个 worker 各有一个数据库连接和状态推送轮询，
+        # 后台任务也只在接收上传的 worker 里执行；需要时用 KL_WORKERS 显式指定
+        # loop/http 默认 auto，装了 uvloop/httptools 会自动使用
+        dev = os.environ.get("KL_DEV") == "1"
+        uvicorn.run(
+            "src.api:app",
+            host="0.0.0.0",
+            port=8080,
+            reload=dev,
+            workers=1 if dev else int(os.environ.get("KL_WORKERS", "1")),
+        )
     else:
         # 启动 CLI
         from src.cli import main
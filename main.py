@@ -4,12 +4,31 @@ Video Knowledge Extractor v2.0
 支持本地 Ollama 和 API
 """
 
-import re
+import asyncio
+import hashlib
+import io
 import json
+import os
+import socket
+import threading
 import tkinter as tk
+from collections import OrderedDict
+from urllib.parse import urlsplit
 from tkinter import ttk, filedialog, messagebox, scrolledtext, simpledialog
 from pathlib import Path
-from src.llm_client import LLMConfig, OllamaClient
+from typing import NamedTuple
+from src.llm_client import AsyncOllamaClient, LLMConfig
+
+_MARKDOWN_FOOTER = f"*生成时间: {Path(__file__).stem}*"
+_PRESET_NAMES = {k: v.get('name', k) for k, v in LLMConfig.PRESETS.items()}
+
+
+class SubtitleEntry(NamedTuple):
+    """字幕条目（元组，比 dict 省内存）"""
+    seq: int
+    start: str
+    end: str
+    text: str
 
 
 class SRTParser:
@@ -17,16 +36,45 @@ class SRTParser:
     
     @staticmethod
     def parse(content: str) -> list:
-        """返回字幕条目列表"""
-        entries = []
-        pattern = r'(\d+)\n(\d{2}:\d{2}:\d{2},\d{3}) --> (\d{2}:\d{2}:\d{2},\d{3})\n(.+?)(?=\n\n|\Z)'
-        matches = re.findall(pattern, content, re.DOTALL)
-        
-        for match in matches:
-            seq, start, end, text = match
-            text = text.replace('\n', ' ').strip()
-            entries.append({'seq': int(seq), 'start': start, 'end': end, 'text': text})
-        return entries
+        """返回字幕条目列表（与 iter_file 同一套分块规则，只含空白的行也算分隔）"""
+        return list(SRTParser.iter_file(io.StringIO(content, newline=None)))
+    
+    @staticmethod
+    def iter_file(f):
+        """从文件对象逐行读取，逐条产出字幕条目，调用方可随时中断"""
+        lines = []
+        for line in f:
+            line = line.rstrip('\n')
+            if line.strip():
+                lines.append(line)
+                continue
+            if lines:
+                entry = SRTParser._parse_block(lines)
+                if entry:
+                    yield entry
+                lines = []
+        
+        if lines:
+            entry = SRTParser._parse_block(lines)
+            if entry:
+                yield entry
+    
+    @staticmethod
+    def _parse_block(lines: list):
+        """解析单个字幕块，格式不对返回 None"""
+        if len(lines) < 3:
+            return None
+        
+        seq = lines[0].strip()
+        if not seq.isdigit():
+            return None
+        
+        start, sep, end = lines[1].partition(' --> ')
+        if not sep:
+            return None
+        
+        text = ' '.join(lines[2:]).strip()
+        return SubtitleEntry(int(seq), start.strip(), end.strip(), text)
 
 
 class ConfigDialog:
@@ -120,6 +168,10 @@ class ConfigDialog:
 class MainWindow:
     """主窗口"""
     
+    PREVIEW_CHARS = 10000  # 原文区最多显示的字符数
+    EXTRACT_CACHE_SIZE = 64  # 提取结果缓存条数
+    INSERT_CHUNK = 4096  # 文本框分块插入的字符数
+    
     def __init__(self, root):
         self.root = root
         self.root.title("视频知识提取器 v2.0")
@@ -128,9 +180,32 @@ class MainWindow:
         self.current_file = None
         self.llm_config = {"preset": "ollama", "api_key": ""}
         self.llm_client = None
+        self._extract_cache = OrderedDict()  # 内容哈希 -> 提取结果
+        self._insert_jobs = {}  # 文本框 -> 当前分块插入任务编号
+        self._pending_text = {}  # 文本框 -> 尚未插入完的完整文本
+        self._clients = {}  # (preset, api_key, base_url) -> 客户端
+        self._ollama_ok = False
+        # LLM 请求在后台线程的事件循环里执行，客户端的连接池在多次提取间复用
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, daemon=True).start()
+        self._extract_future = None
         
         self._create_ui()
         self._init_llm()
+        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
+    
+    def _on_close(self):
+        """关闭窗口：取消进行中的提取，关闭连接池并停止后台事件循环，不等待其完成"""
+        if self._extract_future is not None:
+            self._extract_future.cancel()
+        asyncio.run_coroutine_threadsafe(self._shutdown_loop(), self._loop)
+        self.root.destroy()
+    
+    async def _shutdown_loop(self):
+        """在后台事件循环中关闭所有客户端，然后停止循环"""
+        for client in {self.llm_client, *self._clients.values()}:
+            await client.aclose()
+        self._loop.stop()
     
     def _create_ui(self):
         """创建界面"""
@@ -171,14 +246,32 @@ class MainWindow:
         self.status.pack(fill='x', padx=10, pady=5)
     
     def _init_llm(self):
-        """初始化 LLM"""
+        """初始化 LLM，后台检测 Ollama 是否在运行，不阻塞窗口显示"""
+        self.llm_client = AsyncOllamaClient()
+        url = urlsplit(self.llm_client.base_url)
+        # 未写端口时：https 走 443，其余按 Ollama 默认端口 11434
+        port = url.port or (443 if url.scheme == 'https' else 11434)
+        probe = threading.Thread(
+            target=self._probe_ollama, args=(url.hostname or 'localhost', port), daemon=True
+        )
+        probe.start()
+        self._check_ollama(probe)
+    
+    def _probe_ollama(self, host: str, port: int):
+        """TCP 探测端口（后台线程）"""
         try:
-            self.llm_client = OllamaClient()
-            # 测试连接
-            import urllib.request
-            urllib.request.urlopen("http://localhost:11434", timeout=2)
+            socket.create_connection((host, port), timeout=0.2).close()
+            self._ollama_ok = True
+        except OSError:
+            self._ollama_ok = False
+    
+    def _check_ollama(self, probe: threading.Thread):
+        """在 Tk 线程中等待探测结果"""
+        if probe.is_alive():
+            self.root.after(50, self._check_ollama, probe)
+        elif self._ollama_ok:
             self.status.config(text="就绪 | Ollama 已连接")
-        except:
+        else:
             self.status.config(text="就绪 | Ollama 未运行，请配置其他 LLM")
     
     def _config_llm(self):
@@ -188,20 +281,29 @@ class MainWindow:
         
         if result:
             self.llm_config = result
-            preset_name = LLMConfig.PRESETS.get(result['preset'], {}).get('name', result['preset'])
+            preset_name = _PRESET_NAMES.get(result['preset'], result['preset'])
             self.llm_label.config(text=f"LLM: {preset_name}")
             
-            # 创建客户端
+            # 创建客户端（相同配置复用已有实例）
             try:
-                kwargs = {}
-                if result.get('base_url'):
-                    kwargs['base_url'] = result['base_url']
+                key = (result['preset'], result.get('api_key'), result.get('base_url'))
+                client = self._clients.get(key)
+                if client is None:
+                    kwargs = {}
+                    if result.get('base_url'):
+                        kwargs['base_url'] = result['base_url']
+                    
+                    client = LLMConfig.create_client(
+                        result['preset'],
+                        api_key=result.get('api_key'),
+                        use_async=True,
+                        **kwargs
+                    )
+                    self._clients[key] = client
                 
-                self.llm_client = LLMConfig.create_client(
-                    result['preset'],
-                    api_key=result.get('api_key'),
-                    **kwargs
-                )
+                if client is not self.llm_client:
+                    self.llm_client = client
+                    self._extract_cache.clear()
                 self.status.config(text=f"就绪 | 已切换到 {preset_name}")
             except Exception as e:
                 messagebox.showerror("配置错误", str(e))
@@ -217,22 +319,34 @@ class MainWindow:
         try:
             path = Path(filepath)
             
-            if path.suffix.lower() == '.srt':
-                content = path.read_text(encoding='utf-8')
-                entries = SRTParser.parse(content)
-                text = '\n'.join([f"[{e['start']}] {e['text']}" for e in entries])
-            else:
-                text = path.read_text(encoding='utf-8')
+            # 流式读一遍：只保留 PREVIEW_CHARS 字符做预览，同时统计全文长度
+            with path.open(encoding='utf-8') as f:
+                if path.suffix.lower() == '.srt':
+                    text, total = self._preview_text(
+                        f"[{e.start}] {e.text}" for e in SRTParser.iter_file(f)
+                    )
+                else:
+                    text = f.read(self.PREVIEW_CHARS)
+                    total = len(text) + sum(map(len, iter(lambda: f.read(1 << 16), '')))
             
             self.current_file = filepath
-            self.source_text.delete('1.0', 'end')
-            self.source_text.insert('1.0', text[:10000])
+            self._set_text(self.source_text, text)
             self.file_label.config(text=path.name)
-            self.status.config(text=f"已加载: {len(text)} 字符")
+            self.status.config(text=f"已加载: {total} 字符")
             
         except Exception as e:
             messagebox.showerror("错误", f"加载失败: {e}")
     
+    def _preview_text(self, lines):
+        """拼接前 PREVIEW_CHARS 字符作预览，返回 (预览, 全文按行拼接后的长度)"""
+        parts, kept, total = [], 0, -1
+        for line in lines:
+            total += len(line) + 1
+            if kept < self.PREVIEW_CHARS:
+                parts.append(line)
+                kept += len(line) + 1
+        return '\n'.join(parts)[:self.PREVIEW_CHARS], max(total, 0)
+    
     def _extract(self):
         """提取知识"""
         if not self.current_file:
@@ -243,20 +357,55 @@ class MainWindow:
             messagebox.showwarning("提示", "请先配置 LLM")
             return
         
+        if self._extract_future is not None and not self._extract_future.done():
+            return  # 上一次提取还没结束
+        
+        source = self._widget_text(self.source_text)
+        
+        # 相同内容直接用缓存
+        key = hashlib.blake2b(source.encode('utf-8'), digest_size=16).digest()
+        result = self._extract_cache.get(key)
+        if result is not None:
+            self._extract_cache.move_to_end(key)
+            self._show_result(result)
+            return
+        
+        # 调用 LLM 放到后台事件循环，Tk 线程轮询结果
+        self.status.config(text="正在提取知识...")
+        client = self.llm_client
+        self._extract_future = asyncio.run_coroutine_threadsafe(
+            client.extract_knowledge(source), self._loop
+        )
+        self.root.after(100, self._check_extract, self._extract_future, client, key)
+    
+    def _check_extract(self, future, client, key: bytes):
+        """轮询后台提取结果"""
+        if not future.done():
+            self.root.after(100, self._check_extract, future, client, key)
+            return
+        
+        try:
+            result = future.result()
+        except Exception as e:
+            messagebox.showerror("错误", f"提取失败: {e}")
+            self.status.config(text=f"错误: {str(e)[:50]}")
+            return
+        
+        # 出错时客户端返回空结果，不缓存；期间切换了 LLM 也不缓存
+        if client is self.llm_client and (result.get('concepts') or result.get('key_points')):
+            self._extract_cache[key] = result
+            if len(self._extract_cache) > self.EXTRACT_CACHE_SIZE:
+                self._extract_cache.popitem(last=False)
+        
+        self._show_result(result)
+    
+    def _show_result(self, result: dict):
+        """显示提取结果"""
         try:
-            self.status.config(text="正在提取知识...")
-            self.root.update()
-            
-            source = self.source_text.get('1.0', 'end')
-            
-            # 调用 LLM
-            result = self.llm_client.extract_knowledge(source)
-            
             # 生成 Markdown
             markdown = self._generate_markdown(result)
             
-            self.result_text.delete('1.0', 'end')
-            self.result_text.insert('1.0', markdown)
+            self._set_text(self.result_text, markdown)
             
             topic = result.get('topic', '提取完成')
             concepts = len(result.get('concepts', []))
@@ -267,38 +416,54 @@ class MainWindow:
             messagebox.showerror("错误", f"提取失败: {e}")
             self.status.config(text=f"错误: {str(e)[:50]}")
     
+    def _set_text(self, widget, text: str):
+        """替换文本框内容，大段文本分块插入，避免一次性排版卡住界面"""
+        job = self._insert_jobs.get(widget, 0) + 1
+        self._insert_jobs[widget] = job
+        self._pending_text[widget] = text
+        
+        widget.config(state='normal', wrap='none')
+        widget.delete('1.0', 'end')
+        self._insert_chunked(widget, text, job, 0)
+    
+    def _widget_text(self, widget) -> str:
+        """文本框的完整内容；分块插入还没结束时框里只有前几块，改用待插入的原文"""
+        text = self._pending_text.get(widget)
+        if text is None:
+            return widget.get('1.0', 'end')
+        return text + '\n'  # 与 Text.get 一致，末尾带换行
+    
+    def _insert_chunked(self, widget, text: str, job: int, idx: int):
+        """插入一块，剩余部分排到空闲时继续；期间禁止编辑"""
+        if self._insert_jobs.get(widget) != job:
+            return  # 已被新的内容替换
+        
+        widget.config(state='normal')
+        widget.insert('end', text[idx:idx + self.INSERT_CHUNK])
+        idx += self.INSERT_CHUNK
+        
+        if idx < len(text):
+            widget.config(state='disabled')
+            self.root.after_idle(self._insert_chunked, widget, text, job, idx)
+        else:
+            widget.config(wrap='word')
+            self._pending_text.pop(widget, None)
+    
     def _generate_markdown(self, result: dict) -> str:
-        """生成 Markdown"""
-        lines = [
-            f"# {result.get('topic', '知识提取结果')}",
-            "",
-            "## 关键概念",
-            ""
+        """生成 Markdown（分段拼接，最后一次 join）"""
+        parts = [
+            f"# {result.get('topic', '知识提取结果')}\n\n## 关键概念\n\n",
+            ''.join(f"- {concept}\n" for concept in result.get('concepts', [])),
+            "\n## 重要知识点\n\n",
+            ''.join(f"{i}. {point}\n" for i, point in enumerate(result.get('key_points', []), 1)),
+            f"\n## 总结\n\n{result.get('summary', '')}\n\n---\n",
+            _MARKDOWN_FOOTER,
         ]
-        
-        for concept in result.get('concepts', []):
-            lines.append(f"- {concept}")
-        
-        lines.extend(["", "## 重要知识点", ""])
-        
-        for i, point in enumerate(result.get('key_points', []), 1):
-            lines.append(f"{i}. {point}")
-        
-        lines.extend([
-            "",
-            "## 总结",
-            "",
-            result.get('summary', ''),
-            "",
-            "---",
-            f"*生成时间: {Path(__file__).stem}*"
-        ])
-        
-        return '\n'.join(lines)
+        return ''.join(parts)
     
     def _save(self):
         """保存结果"""
-        if not self.result_text.get('1.0', 'end').strip():
+        if not self._widget_text(self.result_text).strip():
             messagebox.showwarning("提示", "没有内容可保存")
             return
         
@@ -310,8 +475,15 @@ class MainWindow:
             return
         
         try:
-            content = self.result_text.get('1.0', 'end')
-            Path(filepath).write_text(content, encoding='utf-8')
+            data = self._widget_text(self.result_text).encode('utf-8')
+            # 直接写字节，跳过文本 I/O 层的编码和换行转换
+            fd = os.open(filepath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o644)
+            try:
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(fd, view):]
+            finally:
+                os.close(fd)
             self.status.config(text=f"已保存: {Path(filepath).name}")
             messagebox.showinfo("成功", "文件已保存")
         except Exception as e:
@@ -2,29 +2,44 @@
 API - FastAPI 服务
 """
 
-from fastapi import FastAPI, UploadFile, File, BackgroundTasks
+from fastapi import FastAPI, UploadFile, File, BackgroundTasks, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
 from pathlib import Path
+from typing import List, Optional
+import asyncio
 import json
+import shutil
 import sqlite3
+import threading
+import time
 from .workflow import ProgressTracker
 
+try:
+    from orjson import loads as _json_loads  # 可选加速
+except ImportError:
+    from json import loads as _json_loads
+
 app = FastAPI(title="视频知识提取器")
 
 # 配置
 DB_PATH = "knowledge.db"
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
+UPLOAD_CHUNK_SIZE = 1 << 20  # 上传分块写盘，1MB
+STATUS_CHECK_INTERVAL = 0.5  # 状态推送检查间隔（秒）
+STATUS_STREAM_TTL = 300  # 单次推送连接最长时间（秒），到时结束，EventSource 会自动重连
+
+# 进程内共享的只读连接，避免每个请求重新 connect
+_db: Optional[sqlite3.Connection] = None
+_db_lock = threading.Lock()
 
 # 挂载静态文件 (Web UI)
 app.mount("/static", StaticFiles(directory="web"), name="static")
 
 
-@app.get("/", response_class=HTMLResponse)
-async def index():
-    """首页 - 返回 Web UI"""
-    return """
+# 首页在导入时编码一次，每次请求直接返回字节
+_INDEX_HTML = """
 <!DOCTYPE html>
 <html>
 <head>
@@ -93,39 +108,55 @@ async def index():
             
             document.getElementById('status').textContent = '上传中...';
             
+            // 一次请求上传全部文件
+            const formData = new FormData();
             for (const file of files) {
-                const formData = new FormData();
-                formData.append('file', file);
-                
-                await fetch('/upload', {
-                    method: 'POST',
-                    body: formData
-                });
+                formData.append('files', file);
             }
             
+            await fetch('/upload/batch', {
+                method: 'POST',
+                body: formData
+            });
+            
             document.getElementById('status').textContent = '已上传，正在处理...';
             pollProgress();
         }
         
-        async function pollProgress() {
-            const resp = await fetch('/api/status');
-            const data = await resp.json();
-            
-            document.getElementById('progress').innerHTML = `
-                <p>总文档: ${data.total}, 完成: ${data.done}</p>
-                <ul>${data.recent.map(r => `<li>${r.path}: ${r.status}</li>`).join('')}</ul>
-            `;
-            
-            if (data.pending > 0) {
-                setTimeout(pollProgress, 2000);
-            } else {
-                document.getElementById('status').textContent = '处理完成！';
-            }
+        function pollProgress() {
+            // 服务端有状态变化时才推送
+            const source = new EventSource('/api/status/stream');
+            source.onmessage = (event) => {
+                const data = JSON.parse(event.data);
+                
+                document.getElementById('progress').innerHTML = `
+                    <p>总文档: ${data.total}, 完成: ${data.done}</p>
+                    <ul>${data.recent.map(r => `<li>${r.path}: ${r.status}</li>`).join('')}</ul>
+                `;
+                
+                if (data.pending === 0) {
+                    source.close();
+                    document.getElementById('status').textContent = '处理完成！';
+                }
+            };
         }
     </script>
 </body>
 </html>
     """
+_INDEX_BYTES = _INDEX_HTML.encode("utf-8")
+
+
+@app.get("/", response_class=HTMLResponse)
+async def index():
+    """首页 - 返回 Web UI"""
+    return Response(content=_INDEX_BYTES, media_type="text/html")
+
+
+def _save_upload(src, file_path: Path):
+    # Starlette 已把上传内容落到临时文件，直接分块拷贝到目标文件
+    with open(file_path, "wb") as out:
+        shutil.copyfileobj(src, out, UPLOAD_CHUNK_SIZE)
 
 
 @app.post("/upload")
@@ -135,12 +166,14 @@ async def upload_file(
     """上传文件并后台处理"""
     # 保存文件
     file_path = UPLOAD_DIR / file.filename
-    content = await file.read()
-    file_path.write_bytes(content)
+    await asyncio.to_thread(_save_upload, file.file, file_path)
 
     # 添加到队列
     tracker = ProgressTracker(DB_PATH)
-    tracker.add_document(str(file_path))
+    try:
+        tracker.add_document(str(file_path))
+    finally:
+        tracker.close()
 
     # 后台处理（简化版）
     # 实际应该用队列，这里简化
@@ -148,48 +181,110 @@ async def upload_file(
     return {"status": "uploaded", "path": str(file_path)}
 
 
-@app.get("/api/status")
-async def get_status():
-    """获取处理状态"""
-    conn = sqlite3.connect(DB_PATH)
+@app.post("/upload/batch")
+async def upload_batch(files: List[UploadFile] = File(...)):
+    """批量上传文件，一次请求、一个事务登记"""
+    paths = []
+    for file in files:
+        file_path = UPLOAD_DIR / file.filename
+        await asyncio.to_thread(_save_upload, file.file, file_path)
+        paths.append(str(file_path))
 
-    total = conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
-    done = conn.execute(
-        "SELECT COUNT(*) FROM documents WHERE status = 'done'"
-    ).fetchone()[0]
-    pending = conn.execute(
-        "SELECT COUNT(*) FROM documents WHERE status = 'pending'"
-    ).fetchone()[0]
+    tracker = ProgressTracker(DB_PATH)
+    try:
+        await asyncio.to_thread(tracker.add_documents, paths)
+    finally:
+        tracker.close()
 
-    recent = conn.execute(
-        "SELECT path, status, stage FROM documents ORDER BY created_at DESC LIMIT 10"
-    ).fetchall()
+    return {"status": "uploaded", "paths": paths}
 
-    conn.close()
+
+def _get_db() -> sqlite3.Connection:
+    """获取共享连接（首次调用时创建，调用方需持有 _db_lock）"""
+    global _db
+    if _db is None:
+        ProgressTracker(DB_PATH).close()  # 确保表已创建
+        _db = sqlite3.connect(DB_PATH, check_same_thread=False)
+        _db.row_factory = sqlite3.Row
+        _db.execute("PRAGMA temp_store=MEMORY")
+        _db.execute("PRAGMA mmap_size=268435456")  # 256MB
+    return _db
+
+
+def _read_status() -> dict:
+    with _db_lock:
+        conn = _get_db()
+        counts = dict(
+            conn.execute(
+                "SELECT status, COUNT(*) FROM documents GROUP BY status"
+            ).fetchall()
+        )
+        recent = conn.execute(
+            "SELECT path, status, stage FROM documents ORDER BY created_at DESC LIMIT 10"
+        ).fetchall()
 
     return {
-        "total": total,
-        "done": done,
-        "pending": pending,
+        "total": sum(counts.values()),
+        "done": counts.get("done", 0),
+        "pending": counts.get("pending", 0),
         "recent": [{"path": r[0], "status": r[1], "stage": r[2]} for r in recent],
     }
 
 
-@app.get("/api/points")
-async def get_knowledge_points():
-    """获取所有知识点"""
-    conn = sqlite3.connect(DB_PATH)
-    rows = conn.execute(
-        "SELECT title, content, video_markers, source_file FROM knowledge_points LIMIT 100"
-    ).fetchall()
-    conn.close()
+def _read_points() -> list:
+    # 截断和 JSON 解析都在工作线程完成，不占用事件循环
+    with _db_lock:
+        rows = (
+            _get_db()
+            .execute(
+                "SELECT title, substr(content, 1, 200), video_markers, source_file "
+                "FROM knowledge_points LIMIT 100"
+            )
+            .fetchall()
+        )
 
     return [
         {
             "title": r[0],
-            "content": r[1][:200],
-            "markers": json.loads(r[2]) if r[2] else [],
+            "content": r[1],
+            "markers": _json_loads(r[2]) if r[2] else [],
             "source": r[3],
         }
         for r in rows
     ]
+
+
+@app.get("/api/status")
+async def get_status():
+    """获取处理状态"""
+    return await asyncio.to_thread(_read_status)
+
+
+def _data_version() -> int:
+    # 其他连接（处理进程、上传）每次提交后都会变化，查询本身不扫表
+    with _db_lock:
+        return _get_db().execute("PRAGMA data_version").fetchone()[0]
+
+
+@app.get("/api/status/stream")
+async def status_stream(request: Request):
+    """推送处理状态 (SSE)，数据库有新提交时才重新统计"""
+
+    async def events():
+        version = None
+        deadline = time.monotonic() + STATUS_STREAM_TTL
+        while time.monotonic() < deadline and not await request.is_disconnected():
+            current = await asyncio.to_thread(_data_version)
+            if current != version:
+                version = current
+                status = await asyncio.to_thread(_read_status)
+                yield f"data: {json.dumps(status, ensure_ascii=False)}\n\n"
+            await asyncio.sleep(STATUS_CHECK_INTERVAL)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/api/points")
+async def get_knowledge_points():
+    """获取所有知识点"""
+    return await asyncio.to_thread(_read_points)
@@ -6,9 +6,11 @@ import asyncio
 import click
 from pathlib import Path
 from .workflow import (
+    BatchProcessor,
     WorkflowEngine,
     ProgressTracker,
     LLMClient,
+    CachingLLMClient,
     MockLLMClient,
 )
 from .srt_parser import SRTParser
@@ -17,12 +19,16 @@ from .srt_parser import SRTParser
 @click.group()
 @click.option("--api-key", envvar="KL_API_KEY", help="LLM API Key")
 @click.option("--db", default="knowledge.db", help="数据库路径")
+@click.option("--llm-cache", default=None, help="LLM 响应缓存路径 (相同提示词不再请求)")
 @click.pass_context
-def cli(ctx, api_key, db):
+def cli(ctx, api_key, db, llm_cache):
     """视频知识提取器 - CLI"""
     ctx.ensure_object(dict)
     ctx.obj["tracker"] = ProgressTracker(db)
-    ctx.obj["llm"] = LLMClient(api_key=api_key) if api_key else None
+    llm = LLMClient(api_key=api_key) if api_key else None
+    if llm and llm_cache:
+        llm = CachingLLMClient(llm, cache_path=llm_cache)
+    ctx.obj["llm"] = llm
 
 
 @cli.command()
@@ -56,14 +62,30 @@ def process(ctx, file_path, output):
 @cli.command()
 @click.argument("directory")
 @click.option("--workers", "-w", default=3, help="并行数")
+@click.option("--bundle-size", default=1, help="每次合并调用 LLM 的文档数")
+@click.option(
+    "--pipelined", is_flag=True, help="按阶段流水处理：所有文档一起进入下一阶段"
+)
 @click.option("--build", "-b", is_flag=True, help="处理后生成教材")
 @click.option(
     "--format", "-f", default="markdown", help="输出格式: markdown/epub/html/all"
 )
 @click.option("--output", "-o", default="./exports", help="输出目录")
 @click.option("--mock", is_flag=True, help="模拟模式 (不调用 API)")
+@click.option("--cluster-cache", default=None, help="聚类结果缓存目录 (默认不缓存)")
 @click.pass_context
-def batch(ctx, directory, workers, build, format, output, mock):
+def batch(
+    ctx,
+    directory,
+    workers,
+    bundle_size,
+    pipelined,
+    build,
+    format,
+    output,
+    mock,
+    cluster_cache,
+):
     """批量处理目录并生成教材"""
     from .parallel import ParallelProcessor
     from .clustering import CrossDocumentClusteringSkill
@@ -82,12 +104,27 @@ def batch(ctx, directory, workers, build, format, output, mock):
         llm = MockLLMClient()
 
     engine = WorkflowEngine(llm, tracker)
-    processor = ParallelProcessor(engine, max_workers=workers)
+    if pipelined:
+        # 忽略 --bundle-size：同一阶段的请求本来就一起发出
+        process_directory = BatchProcessor(
+            engine, max_workers=workers
+        ).process_directory_pipelined
+    else:
+        process_directory = ParallelProcessor(
+            engine, max_workers=workers, bundle_size=bundle_size
+        ).process_directory
 
     async def _run():
+        try:
+            await _pipeline()
+        finally:
+            if hasattr(llm, "aclose"):
+                await llm.aclose()
+
+    async def _pipeline():
         # 1. 批量处理文档
         click.echo("阶段 1: 处理文档...")
-        docs = await processor.process_directory(Path(directory))
+        docs = await process_directory(Path(directory))
         click.echo(f"完成: {len(docs)} 个文件")
 
         if not build:
@@ -109,7 +146,7 @@ def batch(ctx, directory, workers, build, format, output, mock):
 
         # 4. 聚类重组
         click.echo("\n阶段 4: 生成课程结构...")
-        clustering = CrossDocumentClusteringSkill(llm)
+        clustering = CrossDocumentClusteringSkill(llm, cache_dir=cluster_cache)
         structure = await clustering.cluster(merged_points)
         click.echo(f"课程: {structure.name}")
         click.echo(f"章节: {len(structure.chapters)} 个")
@@ -159,13 +196,12 @@ def status(db):
     conn = sqlite3.connect(db)
 
     # 统计
-    total = conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
-    done = conn.execute(
-        "SELECT COUNT(*) FROM documents WHERE status = 'done'"
-    ).fetchone()[0]
-    pending = conn.execute(
-        "SELECT COUNT(*) FROM documents WHERE status = 'pending'"
-    ).fetchone()[0]
+    counts = dict(
+        conn.execute("SELECT status, COUNT(*) FROM documents GROUP BY status")
+    )
+    total = sum(counts.values())
+    done = counts.get("done", 0)
+    pending = counts.get("pending", 0)
 
     click.echo("文档统计:")
     click.echo(f"  总数: {total}")
@@ -3,18 +3,140 @@ Cross-document clustering - 跨文档知识点聚类
 使用 LLM 进行智能主题聚类
 """
 
-import json
+import asyncio
+import hashlib
 import logging
 import re
+from collections import defaultdict
 from dataclasses import dataclass, field
-from typing import List, Dict
+from pathlib import Path
+from typing import List, Dict, Optional
+
+import httpx
 
 from .workflow import KnowledgePoint
 
+try:
+    import orjson  # 可选加速
+
+    _json_loads = orjson.loads
+
+    def _json_dumps(obj) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+
+except ImportError:
+    import json
+
+    _json_loads = json.loads
+
+    def _json_dumps(obj) -> str:
+        return json.dumps(obj, ensure_ascii=False)
+
+
 logger = logging.getLogger(__name__)
 
+# 压缩知识点内容：口头语/虚词不携带主题信息，去掉以节省 token
+_WHITESPACE_RE = re.compile(r"\s+")
+_FILLER_RE = re.compile(
+    r"(?:嗯+|呃+|啊+|那么|就是说|然后呢"
+    r"|\b(?:the|a|an|is|are|was|were|be|of|to|and|or|in|on|that|this|it)\b)\s*",
+    re.IGNORECASE,
+)
+
+# 聚类结果落盘缓存的版本号：修改提示词模板或解析逻辑时递增，让旧缓存失效
+_CACHE_VERSION = b"cluster-cache-v1"
+
+# LLM 调用失败后的最大重试次数
+_MAX_RETRIES = 3
+
+# 主题两两 Jaccard 相似度都低于该值时跳过 LLM 合并
+_MERGE_OVERLAP_THRESHOLD = 0.3
+_WORD_RE = re.compile(r"\w+")
+
+# 括号匹配时只关心这几个字符，其余内容交给正则引擎跳过
+_JSON_TOKEN_RE = re.compile(r'[{}"\\]')
+
+
+def _match_brace(text: str, start: int) -> int:
+    """从 text[start] 的 "{" 向后单遍扫描，返回与之匹配的 "}" 位置，找不到返回 -1"""
+    depth = 0
+    in_string = False
+    escaped = -1  # 被反斜杠转义的字符位置
+    for m in _JSON_TOKEN_RE.finditer(text, start):
+        pos = m.start()
+        if pos == escaped:
+            continue
+        ch = m.group()
+        if in_string:
+            if ch == "\\":
+                escaped = pos + 1
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return pos
+    return -1
+
+
+def _summarize_topics(topics, detail) -> str:
+    """主题列表摘要，一次 join 成提示词片段；detail(t) 给出每个主题的附加行"""
+    return "\n".join(f"{i}. {t.title}\n   {detail(t)}" for i, t in enumerate(topics))
+
+
+def _is_retryable(e: Exception) -> bool:
+    """限流、服务端错误和网络错误值得重试，其余错误直接抛出"""
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code == 429 or e.response.status_code >= 500
+    return isinstance(e, httpx.TransportError)
+
+
+def _topic_tokens(topic) -> set:
+    """主题标题 + 关键词的词集合；中文没有空格分词，按相邻两字切分"""
+    tokens = set()
+    text = " ".join([topic.title, *topic.keywords]).lower()
+    for word in _WORD_RE.findall(text):
+        if word.isascii() or len(word) < 2:
+            tokens.add(word)
+        else:
+            tokens.update(word[i : i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+def _max_overlap(topics) -> float:
+    """主题两两之间的最大 Jaccard 相似度"""
+    sigs = [_topic_tokens(t) for t in topics]
+    best = 0.0
+    for i, a in enumerate(sigs):
+        for b in sigs[i + 1 :]:
+            union = len(a | b)
+            if union:
+                best = max(best, len(a & b) / union)
+    return best
+
+
+def _extract_objects(buf: str, pos: int):
+    """取出 buf[pos:] 中已完整到达的 JSON 对象，返回 (对象列表, 下一个待解析位置)"""
+    objs = []
+    while True:
+        start = buf.find("{", pos)
+        if start < 0:
+            return objs, pos
+        end = _match_brace(buf, start)
+        if end < 0:
+            return objs, pos
+        try:
+            objs.append(_json_loads(buf[start : end + 1]))
+        except ValueError:
+            pass
+        pos = end + 1
+
 
-@dataclass
+@dataclass(slots=True)
 class TopicCluster:
     """主题聚类"""
 
@@ -34,7 +156,7 @@ class TopicCluster:
         }
 
 
-@dataclass
+@dataclass(slots=True)
 class CourseStructure:
     """课程结构"""
 
@@ -51,13 +173,36 @@ class CourseStructure:
             "prerequisites": self.prerequisites,
         }
 
+    def to_json(self) -> str:
+        # 章节里关联的知识点对象不落盘，读回后按 point_indices 重新关联
+        data = self.to_dict()
+        data["chapters"] = [
+            {k: v for k, v in ch.items() if k != "points"} for ch in self.chapters
+        ]
+        return _json_dumps(data)
+
 
 class CrossDocumentClusteringSkill:
     """跨文档知识点聚类 Skill - LLM 驱动"""
 
-    def __init__(self, llm_client, max_points_per_batch: int = 50):
+    def __init__(
+        self,
+        llm_client,
+        max_points_per_batch: int = 50,
+        max_concurrency: int = 4,
+        max_batch_chars: int = 8000,
+        cache_dir: Optional[str] = None,
+    ):
         self.llm = llm_client
         self.max_points_per_batch = max_points_per_batch
+        self.max_batch_chars = max_batch_chars  # 单批知识点摘要的字符上限
+        # 限制同时在途的 LLM 请求数（所有调用共用），避免触发服务端限流
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # 提示词 + 温度 -> LLM 输出，重复聚类时跳过相同请求
+        self._cache: Dict[bytes, str] = {}
+        # 聚类结果落盘缓存目录，None 表示不缓存
+        self.cache_dir = Path(cache_dir).expanduser() if cache_dir else None
+        self._degraded = False  # 本次聚类是否走了降级逻辑（降级结果不落盘）
         logger.info(
             f"初始化 CrossDocumentClusteringSkill (max_points={max_points_per_batch})"
         )
@@ -68,6 +213,7 @@ class CrossDocumentClusteringSkill:
 
         阶段1: LLM 识别主题聚类
         阶段2: 构建课程结构（章节 + 顺序）
+        （知识点一批装得下时两阶段合并为一次请求）
 
         Args:
             all_points: 所有文档的知识点列表
@@ -81,13 +227,30 @@ class CrossDocumentClusteringSkill:
 
         logger.info(f"开始聚类 {len(all_points)} 个知识点")
 
-        # 阶段1: 主题识别
-        topics = await self._identify_topics(all_points)
-        logger.info(f"识别到 {len(topics)} 个主题")
+        cache_path = self._result_cache_path(all_points)
+        structure = self._load_structure(cache_path)
+        if structure is not None:
+            logger.info(f"命中聚类缓存: {cache_path.name}")
+            self._assign_points_to_chapters(structure, all_points)
+            return structure
+
+        self._degraded = False
+        if len(self._create_batches(all_points)) == 1:
+            # 一批装得下时，主题识别和课程结构合并成一次请求
+            structure = await self._identify_and_structure(all_points)
+
+        if structure is None:
+            # 阶段1: 主题识别
+            topics = await self._identify_topics(all_points)
+            logger.info(f"识别到 {len(topics)} 个主题")
 
-        # 阶段2: 构建课程结构
-        structure = await self._build_course_structure(all_points, topics)
-        structure.topics = topics
+            # 阶段2: 构建课程结构
+            structure = await self._build_course_structure(all_points, topics)
+            structure.topics = topics
+
+        # 关联知识点之前落盘（章节里还没有 KnowledgePoint 对象）
+        if cache_path is not None and not self._degraded:
+            self._save_structure(cache_path, structure)
 
         # 关联知识点到章节
         self._assign_points_to_chapters(structure, all_points)
@@ -95,6 +258,138 @@ class CrossDocumentClusteringSkill:
         logger.info(f"聚类完成: {structure.name} - {len(structure.chapters)} 个章节")
         return structure
 
+    def _result_cache_path(self, all_points: List[KnowledgePoint]) -> Optional[Path]:
+        """按提示词版本、模型、分批参数和知识点内容（保持顺序）计算缓存路径"""
+        if self.cache_dir is None:
+            return None
+        sig = hashlib.blake2b(digest_size=16)
+        sig.update(_CACHE_VERSION)
+        sig.update(str(getattr(self.llm, "model", "")).encode("utf-8"))
+        sig.update(f"{self.max_points_per_batch}\0{self.max_batch_chars}".encode())
+        for p in all_points:
+            sig.update(p.title.encode("utf-8"))
+            sig.update(
+                hashlib.blake2b(p.content.encode("utf-8"), digest_size=16).digest()
+            )
+        return self.cache_dir / f"cluster-{sig.hexdigest()}.json"
+
+    def _load_structure(self, path: Optional[Path]) -> Optional[CourseStructure]:
+        if path is None or not path.exists():
+            return None
+        try:
+            data = _json_loads(path.read_bytes())
+            return CourseStructure(
+                name=data["name"],
+                chapters=data["chapters"],
+                topics=[TopicCluster(**t) for t in data["topics"]],
+                prerequisites=data["prerequisites"],
+            )
+        except Exception as e:
+            logger.warning(f"聚类缓存无法读取，重新聚类: {e}")
+            return None
+
+    def _save_structure(self, path: Path, structure: CourseStructure):
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(structure.to_json(), encoding="utf-8")
+        except OSError as e:
+            logger.warning(f"聚类缓存写入失败: {e}")
+
+    async def _identify_and_structure(self, all_points: List[KnowledgePoint]):
+        """
+        一次请求同时完成主题识别和课程结构
+
+        主题需要合并时，按合并后的主题再请求一次课程结构
+        解析失败（缺少主题或章节）时返回 None，由调用方退回两阶段流程
+        """
+        point_summaries = [
+            f"[{i}] {p.title}\n   {self._compress_point(p)}..."
+            for i, p in enumerate(all_points)
+        ]
+
+        prompt = f"""分析以下 {len(all_points)} 个知识点，识别主题聚类，并据此设计教材的章节结构。
+
+知识点列表:
+{chr(10).join(point_summaries)}
+
+任务:
+1. 识别主要主题（3-10个主题），为每个主题确定:
+   - 主题名称（简洁明确）
+   - 主题描述（1-2句话）
+   - 包含的知识点索引
+   - 关键词（3-5个）
+2. 将主题组织为教材章节（3-8章），确定章节顺序（考虑知识依赖关系）
+3. 识别章节间的前置关系
+
+按 JSON 输出:
+{{
+  "topics": [
+    {{
+      "id": "topic_1",
+      "title": "主题名称",
+      "description": "主题描述",
+      "point_indices": [0, 1, 2],
+      "keywords": ["关键词1", "关键词2"]
+    }}
+  ],
+  "course_name": "课程名称（简洁专业）",
+  "chapters": [
+    {{
+      "order": 1,
+      "title": "章节标题",
+      "topic_ids": ["topic_1", "topic_2"],
+      "description": "章节描述",
+      "learning_objectives": ["目标1", "目标2"]
+    }}
+  ],
+  "prerequisites": {{
+    "章节标题": ["前置章节标题1", "前置章节标题2"]
+  }}
+}}
+
+注意:
+- 一个知识点可以属于多个主题
+- 主题应该有明确的边界，避免过度重叠
+- 章节标题要专业、清晰，每章包含2-4个相关主题
+- 前置关系要合理
+
+只输出 JSON:"""
+
+        try:
+            result = await self._cached_generate(prompt, 0.3)
+        except Exception as e:
+            logger.error(f"主题识别与结构构建失败: {e}")
+            return None
+
+        data = self._parse_json_response(result)
+        if not data.get("topics") or not data.get("chapters"):
+            return None
+
+        topics = [
+            TopicCluster(
+                id=topic_data.get("id", f"topic_{i}"),
+                title=topic_data.get("title", "未命名主题"),
+                description=topic_data.get("description", ""),
+                point_indices=topic_data.get("point_indices", []),
+                keywords=topic_data.get("keywords", []),
+            )
+            for i, topic_data in enumerate(data["topics"])
+        ]
+        logger.info(f"识别到 {len(topics)} 个主题")
+
+        # 与两阶段流程一致地合并相似主题；合并后章节引用的主题 id 失效，
+        # 按合并结果重新构建课程结构
+        merged_topics = await self._merge_similar_topics(topics)
+        if merged_topics is not topics:
+            return await self._build_course_structure(all_points, merged_topics)
+
+        return CourseStructure(
+            name=data.get("course_name", "未命名课程"),
+            chapters=data["chapters"],
+            topics=topics,
+            prerequisites=data.get("prerequisites", {}),
+        )
+
     async def _identify_topics(
         self, all_points: List[KnowledgePoint]
     ) -> List[TopicCluster]:
@@ -103,20 +398,88 @@ class CrossDocumentClusteringSkill:
 
         分析知识点内容，识别主要主题
         """
-        # 分批处理避免上下文过长
+        # 分批处理避免上下文过长，各批次并发请求
         batches = self._create_batches(all_points)
+        offsets = [0]
+        for batch in batches[:-1]:
+            offsets.append(offsets[-1] + len(batch))
+        # 不用 generate_many 合并批次：每批已按 max_batch_chars 装满上下文，
+        # 两批合起来必然超过客户端的合并预算，且逐批请求才有重试和流式解析
+        results = await asyncio.gather(
+            *[
+                self._identify_topics_batch(i, offset, batch)
+                for i, (offset, batch) in enumerate(zip(offsets, batches))
+            ]
+        )
+
         all_topics = []
+        for batch_topics in results:
+            for topic in batch_topics:
+                if not topic.id:
+                    topic.id = f"topic_{len(all_topics)}"
+                all_topics.append(topic)
 
-        for batch_idx, batch_points in enumerate(batches):
-            logger.debug(f"处理批次 {batch_idx + 1}/{len(batches)}")
+        # 合并相似主题
+        merged_topics = await self._merge_similar_topics(all_topics)
+        return merged_topics
 
-            # 构建提示
-            point_summaries = [
-                f"[{i}] {p.title}\n   {p.content[:150]}..."
-                for i, p in enumerate(batch_points)
-            ]
+    async def _identify_topics_batch(
+        self, batch_idx: int, offset: int, batch_points: List[KnowledgePoint]
+    ) -> List[TopicCluster]:
+        """识别单个批次的主题"""
+        logger.debug(f"处理批次 {batch_idx + 1}")
+        prompt = self._topics_prompt(batch_points)
+
+        if (
+            hasattr(self.llm, "stream_generate")
+            and self._cache_key(prompt, 0.3) not in self._cache
+        ):
+            try:
+                return await self._stream_topics(offset, batch_points, prompt)
+            except Exception as e:
+                logger.warning(f"流式主题识别失败，改为普通请求: {e}")
 
-            prompt = f"""分析以下 {len(batch_points)} 个知识点，识别其中的主题聚类。
+        try:
+            result = await self._cached_generate(prompt, 0.3)
+        except Exception as e:
+            logger.error(f"主题识别失败 (批次 {batch_idx}): {e}")
+            return self._fallback_topics(offset, batch_points)
+
+        return self._parse_topics(batch_idx, offset, batch_points, result)
+
+    async def _stream_topics(
+        self, offset: int, batch_points: List[KnowledgePoint], prompt: str
+    ) -> List[TopicCluster]:
+        """流式接收主题识别结果，每个主题对象完整到达就立即解析"""
+        topics = []
+        buf = ""
+        pos = -1  # topics 数组内下一个待解析位置
+        async with self._semaphore:
+            async for chunk in self.llm.stream_generate(prompt, temperature=0.3):
+                buf += chunk
+                if pos < 0:
+                    key = buf.find('"topics"')
+                    start = buf.find("[", key) if key >= 0 else -1
+                    if start < 0:
+                        continue
+                    pos = start + 1
+                objs, pos = _extract_objects(buf, pos)
+                topics.extend(
+                    self._topic_from_data(offset, batch_points, d) for d in objs
+                )
+
+        self._cache[self._cache_key(prompt, 0.3)] = buf
+        return topics
+
+    def _topics_prompt(self, batch_points: List[KnowledgePoint]) -> str:
+        """单个批次的主题识别提示"""
+        # 构建提示
+        point_summaries = [
+            f"[{i}] {p.title}\n   {self._compress_point(p)}..."
+            for i, p in enumerate(batch_points)
+        ]
+
+        return f"""分析以下 {len(batch_points)} 个知识点，识别其中的主题聚类。
 
 知识点列表:
 {chr(10).join(point_summaries)}
@@ -149,47 +512,62 @@ class CrossDocumentClusteringSkill:
 
 只输出 JSON，不要有其他内容:"""
 
-            try:
-                result = await self.llm.generate(prompt, temperature=0.3)
-                data = self._parse_json_response(result)
-
-                for topic_data in data.get("topics", []):
-                    # 调整索引（如果是分批的）
-                    if batch_idx > 0:
-                        offset = batch_idx * self.max_points_per_batch
-                        topic_data["point_indices"] = [
-                            i + offset
-                            for i in topic_data.get("point_indices", [])
-                            if i < len(batch_points)
-                        ]
-
-                    topic = TopicCluster(
-                        id=topic_data.get("id", f"topic_{len(all_topics)}"),
-                        title=topic_data.get("title", "未命名主题"),
-                        description=topic_data.get("description", ""),
-                        point_indices=topic_data.get("point_indices", []),
-                        keywords=topic_data.get("keywords", []),
-                    )
-                    all_topics.append(topic)
+    def _parse_topics(
+        self,
+        batch_idx: int,
+        offset: int,
+        batch_points: List[KnowledgePoint],
+        result: str,
+    ) -> List[TopicCluster]:
+        """解析单个批次的主题识别结果"""
+        topics = []
+        try:
+            data = self._parse_json_response(result)
 
-            except Exception as e:
-                logger.error(f"主题识别失败 (批次 {batch_idx}): {e}")
-                # 降级：每个知识点作为一个独立主题
-                for i, p in enumerate(batch_points):
-                    offset = batch_idx * self.max_points_per_batch
-                    all_topics.append(
-                        TopicCluster(
-                            id=f"topic_{offset + i}",
-                            title=p.title,
-                            description=p.content[:100],
-                            point_indices=[offset + i],
-                            keywords=[],
-                        )
-                    )
+            for topic_data in data.get("topics", []):
+                topics.append(self._topic_from_data(offset, batch_points, topic_data))
 
-        # 合并相似主题
-        merged_topics = await self._merge_similar_topics(all_topics)
-        return merged_topics
+        except Exception as e:
+            logger.error(f"主题识别失败 (批次 {batch_idx}): {e}")
+            return self._fallback_topics(offset, batch_points)
+
+        return topics
+
+    def _topic_from_data(
+        self, offset: int, batch_points: List[KnowledgePoint], topic_data: Dict
+    ) -> TopicCluster:
+        """LLM 返回的单个主题 -> TopicCluster"""
+        # 调整索引（如果是分批的）
+        if offset > 0:
+            topic_data["point_indices"] = [
+                i + offset
+                for i in topic_data.get("point_indices", [])
+                if i < len(batch_points)
+            ]
+
+        return TopicCluster(
+            id=topic_data.get("id", ""),  # 缺省编号在汇总时分配
+            title=topic_data.get("title", "未命名主题"),
+            description=topic_data.get("description", ""),
+            point_indices=topic_data.get("point_indices", []),
+            keywords=topic_data.get("keywords", []),
+        )
+
+    def _fallback_topics(
+        self, offset: int, batch_points: List[KnowledgePoint]
+    ) -> List[TopicCluster]:
+        """降级：每个知识点作为一个独立主题"""
+        self._degraded = True
+        return [
+            TopicCluster(
+                id=f"topic_{offset + i}",
+                title=p.title,
+                description=p.content[:100],
+                point_indices=[offset + i],
+                keywords=[],
+            )
+            for i, p in enumerate(batch_points)
+        ]
 
     async def _merge_similar_topics(
         self, topics: List[TopicCluster]
@@ -198,16 +576,21 @@ class CrossDocumentClusteringSkill:
         if len(topics) <= 5:
             return topics
 
+        # 标题/关键词两两几乎不重叠时，不必请 LLM 合并
+        if _max_overlap(topics) < _MERGE_OVERLAP_THRESHOLD:
+            logger.info("主题之间无明显重叠，跳过合并")
+            return topics
+
         # 构建主题摘要
-        topic_summaries = [
-            f"{i}. {t.title}\n   关键词: {', '.join(t.keywords)}\n   描述: {t.description[:100]}"
-            for i, t in enumerate(topics)
-        ]
+        topic_summaries = _summarize_topics(
+            topics,
+            lambda t: f"关键词: {', '.join(t.keywords)}\n   描述: {t.description[:100]}",
+        )
 
         prompt = f"""分析以下 {len(topics)} 个主题，识别可以合并的相似主题。
 
 主题列表:
-{chr(10).join(topic_summaries)}
+{topic_summaries}
 
 任务:
 1. 识别标题或关键词高度相似的主题
@@ -235,7 +618,7 @@ class CrossDocumentClusteringSkill:
 只输出 JSON:"""
 
         try:
-            result = await self.llm.generate(prompt, temperature=0.2)
+            result = await self._cached_generate(prompt, 0.2)
             data = self._parse_json_response(result)
 
             merged = []
@@ -245,25 +628,23 @@ class CrossDocumentClusteringSkill:
                 indices = merge_data.get("original_indices", [])
 
                 # 收集所有相关知识点索引
-                all_point_indices = []
+                all_point_indices = set()
                 for idx in indices:
                     if idx < len(topics):
-                        all_point_indices.extend(topics[idx].point_indices)
+                        all_point_indices.update(topics[idx].point_indices)
                         used_indices.add(idx)
 
                 merged_topic = TopicCluster(
                     id=merge_data.get("id", f"merged_{len(merged)}"),
                     title=merge_data.get("title", "合并主题"),
                     description=merge_data.get("description", ""),
-                    point_indices=list(set(all_point_indices)),
+                    point_indices=list(all_point_indices),
                     keywords=merge_data.get("keywords", []),
                 )
                 merged.append(merged_topic)
 
             # 添加未合并的主题
-            for i, topic in enumerate(topics):
-                if i not in used_indices:
-                    merged.append(topic)
+            merged.extend(t for i, t in enumerate(topics) if i not in used_indices)
 
             logger.info(f"主题合并: {len(topics)} -> {len(merged)}")
             return merged
@@ -281,15 +662,15 @@ class CrossDocumentClusteringSkill:
         基于主题构建章节，确定学习顺序
         """
         # 构建主题摘要
-        topic_summaries = [
-            f"{i}. {t.title}\n   描述: {t.description[:80]}\n   知识点数: {len(t.point_indices)}"
-            for i, t in enumerate(topics)
-        ]
+        topic_summaries = _summarize_topics(
+            topics,
+            lambda t: f"描述: {t.description[:80]}\n   知识点数: {len(t.point_indices)}",
+        )
 
         prompt = f"""基于以下 {len(topics)} 个主题，设计教材的章节结构。
 
 主题列表:
-{chr(10).join(topic_summaries)}
+{topic_summaries}
 
 任务:
 1. 将主题组织为教材章节（3-8章）
@@ -322,7 +703,7 @@ class CrossDocumentClusteringSkill:
 只输出 JSON:"""
 
         try:
-            result = await self.llm.generate(prompt, temperature=0.3)
+            result = await self._cached_generate(prompt, 0.3)
             data = self._parse_json_response(result)
 
             structure = CourseStructure(
@@ -336,6 +717,7 @@ class CrossDocumentClusteringSkill:
 
         except Exception as e:
             logger.error(f"构建课程结构失败: {e}")
+            self._degraded = True
             # 降级：每个主题一章
             return CourseStructure(
                 name="未命名课程",
@@ -353,69 +735,99 @@ class CrossDocumentClusteringSkill:
                 prerequisites={},
             )
 
+    @staticmethod
+    def _cache_key(prompt: str, temperature: float) -> bytes:
+        return hashlib.blake2b(
+            f"{temperature}\0{prompt}".encode("utf-8"), digest_size=16
+        ).digest()
+
+    async def _cached_generate(self, prompt: str, temperature: float) -> str:
+        """按提示词内容缓存的 generate，失败不缓存"""
+        key = self._cache_key(prompt, temperature)
+        result = self._cache.get(key)
+        if result is None:
+            async with self._semaphore:
+                result = await self._generate(prompt, temperature)
+            self._cache[key] = result
+        return result
+
+    async def _generate(self, prompt: str, temperature: float) -> str:
+        """调用 LLM，限流 (429)、服务端错误和网络错误时指数退避重试"""
+        for attempt in range(_MAX_RETRIES + 1):
+            try:
+                return await self.llm.generate(prompt, temperature=temperature)
+            except Exception as e:
+                if attempt == _MAX_RETRIES or not _is_retryable(e):
+                    raise
+                delay = 0.5 * 2**attempt
+                logger.warning(f"LLM 调用失败，{delay}s 后重试: {e}")
+                await asyncio.sleep(delay)
+
     def _create_batches(
         self, all_points: List[KnowledgePoint]
     ) -> List[List[KnowledgePoint]]:
-        """创建处理批次"""
+        """创建处理批次（按知识点数和摘要字符数双重限制）"""
         batches = []
-        for i in range(0, len(all_points), self.max_points_per_batch):
-            batch = all_points[i : i + self.max_points_per_batch]
+        batch = []
+        batch_chars = 0
+        for p in all_points:
+            chars = len(p.title) + len(self._compress_point(p)) + 10
+            if batch and (
+                len(batch) >= self.max_points_per_batch
+                or batch_chars + chars > self.max_batch_chars
+            ):
+                batches.append(batch)
+                batch = []
+                batch_chars = 0
+            batch.append(p)
+            batch_chars += chars
+        if batch:
             batches.append(batch)
         return batches
 
+    @staticmethod
+    def _compress_point(p: KnowledgePoint, max_chars: int = 150) -> str:
+        """压缩知识点内容：去掉口头语和多余空白后截断"""
+        text = _FILLER_RE.sub("", p.content)
+        return _WHITESPACE_RE.sub(" ", text).strip()[:max_chars]
+
     def _assign_points_to_chapters(
         self, structure: CourseStructure, all_points: List[KnowledgePoint]
     ):
         """将知识点关联到章节"""
+        # 主题 id 可能重复（各批次各自编号），所以一个 id 对应多个主题
+        topics_by_id = defaultdict(list)
+        for topic in structure.topics:
+            topics_by_id[topic.id].append(topic)
+        n = len(all_points)
+
         for chapter in structure.chapters:
-            topic_ids = chapter.get("topic_ids", [])
             chapter_point_indices = set()
 
             # 收集该章节所有主题的知识点
-            for topic in structure.topics:
-                if topic.id in topic_ids:
+            for topic_id in set(chapter.get("topic_ids", [])):
+                for topic in topics_by_id.get(topic_id, ()):
                     chapter_point_indices.update(topic.point_indices)
 
             # 关联知识点对象
             chapter["points"] = [
-                all_points[i]
-                for i in sorted(chapter_point_indices)
-                if 0 <= i < len(all_points)
+                all_points[i] for i in sorted(chapter_point_indices) if 0 <= i < n
             ]
 
             chapter["point_count"] = len(chapter["points"])
 
     def _parse_json_response(self, text: str) -> Dict:
         """解析 LLM 返回的 JSON"""
-        # 尝试多种提取方式
-        patterns = [
-            r"```json\s*\n(.*?)\n```",  # Markdown code block
-            r"```\s*\n(.*?)\n```",  # Generic code block
-            r"(\{[\s\S]*\})",  # Raw JSON
-        ]
-
-        for pattern in patterns:
-            match = re.search(pattern, text, re.DOTALL)
-            if match:
-                try:
-                    return json.loads(match.group(1).strip())
-                except json.JSONDecodeError:
-                    continue
-
-        # 尝试直接解析
-        try:
-            return json.loads(text.strip())
-        except json.JSONDecodeError:
-            pass
-
-        # 提取最外层的大括号内容
+        # 从第一个 "{" 开始找完整对象，解析失败再试下一个 "{"
         start = text.find("{")
-        end = text.rfind("}")
-        if start >= 0 and end > start:
+        while start >= 0:
+            end = _match_brace(text, start)
+            if end < 0:
+                break
             try:
-                return json.loads(text[start : end + 1])
-            except json.JSONDecodeError:
-                pass
+                return _json_loads(text[start : end + 1])
+            except ValueError:
+                start = text.find("{", start + 1)
 
         logger.warning(f"无法解析 JSON 响应: {text[:200]}...")
         return {}
@@ -5,6 +5,9 @@ Export formats - Markdown, EPUB, HTML
 from pathlib import Path
 from typing import List, Dict
 
+# 一次遍历完成 HTML 转义和换行转 <br>
+_HTML_TR = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;", "\n": "<br>"})
+
 
 class TextbookExporter:
     """教材导出器"""
@@ -25,49 +28,53 @@ class TextbookExporter:
 
         chapters: [{"order": 1, "title": "...", "points": [MergedKnowledge]}]
         """
-        lines = [f"# {course_name}", "", "## 目录", ""]
+        # 保存（逐章写入文件，不在内存中拼接整本书）
+        if output_file is None:
+            output_file = f"{course_name}.md"
+
+        output_path = self.output_dir / output_file
+        with output_path.open("w", encoding="utf-8", buffering=1 << 20) as f:
+            self._write_markdown(f, course_name, chapters, transitions)
+
+        return str(output_path)
+
+    def _write_markdown(
+        self, f, course_name: str, chapters: List[Dict], transitions: Dict[int, str]
+    ):
+        """逐章写入 Markdown（直接写入带缓冲的文件，不维护行列表）"""
+        f.write(f"# {course_name}\n\n## 目录\n\n")
 
         # 目录
         for ch in chapters:
-            lines.append(f"{ch['order']}. {ch['title']}")
+            f.write(f"{ch['order']}. {ch['title']}\n")
 
-        lines.extend(["", "---", ""])
+        f.write("\n---\n")
 
         # 章节内容
         for i, ch in enumerate(chapters):
-            lines.extend([f"## 第{ch['order']}章 {ch['title']}", ""])
+            f.write(f"\n## 第{ch['order']}章 {ch['title']}\n")
 
             # 衔接段落
             if i in transitions:
-                lines.extend([f"*{transitions[i]}*", ""])
+                f.write(f"\n*{transitions[i]}*\n")
 
-            # 知识点
+            # 知识点：每个知识点拼成一段
             for point in ch.get("points", []):
-                lines.extend([f"### {point.title}", "", point.content, ""])
+                f.write(f"\n### {point.title}\n\n{point.content}\n")
 
                 # 视频标记
                 if point.video_markers:
-                    lines.append("> 📹 **需配合视频学习:**")
-                    for marker in point.video_markers:
-                        time = marker.get("time", "")
-                        desc = marker.get("description", "")
-                        lines.append(f"> - [{time}] {desc}")
-                    lines.append("")
-
-                lines.append("")
-
-            lines.extend(["---", ""])
-
-        content = "\n".join(lines)
-
-        # 保存
-        if output_file is None:
-            output_file = f"{course_name}.md"
+                    f.write("\n> 📹 **需配合视频学习:**\n")
+                    f.write(
+                        "".join(
+                            f"> - [{m.get('time', '')}] {m.get('description', '')}\n"
+                            for m in point.video_markers
+                        )
+                    )
 
-        output_path = self.output_dir / output_file
-        output_path.write_text(content, encoding="utf-8")
+                f.write("\n")
 
-        return str(output_path)
+            f.write("\n---\n")
 
     def export_epub(
         self,
@@ -108,7 +115,7 @@ class TextbookExporter:
             # 知识点
             for point in ch.get("points", []):
                 content_lines.append(f"<h3>{point.title}</h3>")
-                content_lines.append(f'<p>{point.content.replace(chr(10), "<br>")}</p>')
+                content_lines.append(f"<p>{point.content.translate(_HTML_TR)}</p>")
 
                 if point.video_markers:
                     content_lines.append('<div class="video-ref">📹 视频参考:</div>')
@@ -162,7 +169,21 @@ class TextbookExporter:
         output_file: str = None,
     ) -> str:
         """导出为 HTML"""
-        html = f"""<!DOCTYPE html>
+        # 保存（边生成边写入文件）
+        if output_file is None:
+            output_file = f"{course_name}.html"
+
+        output_path = self.output_dir / output_file
+        with output_path.open("w", encoding="utf-8", buffering=1 << 20) as f:
+            self._write_html(f, course_name, chapters, transitions)
+
+        return str(output_path)
+
+    def _write_html(
+        self, f, course_name: str, chapters: List[Dict], transitions: Dict[int, str]
+    ):
+        """逐段写入 HTML"""
+        f.write(f"""<!DOCTYPE html>
 <html lang="zh">
 <head>
     <meta charset="UTF-8">
@@ -213,54 +234,45 @@ class TextbookExporter:
     <div class="toc">
         <h2>目录</h2>
         <ul>
-"""
+""")
         # 目录
         for ch in chapters:
-            html += f'            <li>{ch["order"]}. {ch["title"]}</li>\n'
+            f.write(f'            <li>{ch["order"]}. {ch["title"]}</li>\n')
 
-        html += """        </ul>
+        f.write("""        </ul>
     </div>
     
     <hr>
-"""
+""")
 
         # 章节
         for i, ch in enumerate(chapters):
-            html += f"""
+            f.write(f"""
     <section>
         <h2>第{ch['order']}章 {ch['title']}</h2>
-"""
+""")
             # 衔接
             if i in transitions:
-                html += f'        <p class="transition">{transitions[i]}</p>\n'
+                f.write(f'        <p class="transition">{transitions[i]}</p>\n')
 
             # 知识点
             for point in ch.get("points", []):
-                html += f"""
+                f.write(f"""
         <h3>{point.title}</h3>
-        <p>{point.content.replace(chr(10), "<br>")}</p>
-"""
+        <p>{point.content.translate(_HTML_TR)}</p>
+""")
                 if point.video_markers:
-                    html += '        <div class="video-ref">\n'
-                    html += "            <strong>需配合视频学习:</strong><br>\n"
+                    f.write('        <div class="video-ref">\n')
+                    f.write("            <strong>需配合视频学习:</strong><br>\n")
                     for marker in point.video_markers:
                         time = marker.get("time", "")
                         desc = marker.get("description", "")
-                        html += f"            [{time}] {desc}<br>\n"
-                    html += "        </div>\n"
+                        f.write(f"            [{time}] {desc}<br>\n")
+                    f.write("        </div>\n")
 
-            html += "    </section>\n"
+            f.write("    </section>\n")
 
-        html += """
+        f.write("""
 </body>
 </html>
-"""
-
-        # 保存
-        if output_file is None:
-            output_file = f"{course_name}.html"
-
-        output_path = self.output_dir / output_file
-        output_path.write_text(html, encoding="utf-8")
-
-        return str(output_path)
+""")
@@ -3,19 +3,165 @@ Knowledge fusion - 知识融合与去重
 智能去重 + 内容整合 + 衔接生成
 """
 
+import asyncio
+import hashlib
 import json
 import logging
+import random
 import re
+import zlib
 from dataclasses import dataclass, field
-from typing import List, Dict
-from difflib import SequenceMatcher
+from typing import List, Dict, Optional
 
 from .workflow import KnowledgePoint
 
+try:
+    from orjson import loads as _json_loads  # 可选加速
+except ImportError:
+    from json import loads as _json_loads
+
+try:
+    import numpy as np  # rapidfuzz 的 cdist 依赖 numpy
+    from rapidfuzz import fuzz as _fuzz
+    from rapidfuzz import process as _process
+    from rapidfuzz.distance import Indel as _Indel
+except ImportError:
+    _process = None
+
 logger = logging.getLogger(__name__)
 
+# 预编译正则，避免每次清理都走 re 模块缓存查找
+_MERGED_PREFIX_RES = [
+    re.compile(p, re.IGNORECASE)
+    for p in (
+        r"^整合后的内容[:：]\s*",
+        r"^合并后的内容[:：]\s*",
+        r"^最终版本[:：]\s*",
+    )
+]
+_TRANSITION_PREFIX_RES = [
+    re.compile(p, re.IGNORECASE)
+    for p in (
+        r"^过渡段落[:：]\s*",
+        r"^衔接[:：]\s*",
+        r"^段落[:：]\s*",
+    )
+]
+_JSON_DECODER = json.JSONDecoder()
+# "例" 已覆盖 例题/示例/例子；英文只认 example/Example，与原关键词表一致
+_EXAMPLE_RE = re.compile(r"例|[Ee]xample")
+_JSON_FENCE_RE = re.compile(r"```(?:json)?\s*\n(.*?)\n```", re.DOTALL)
+
+# 一次 LLM 请求里合并确认的候选组数
+_CONFIRM_BATCH_SIZE = 8
+# 没装 rapidfuzz 时，超过该数量改用 MinHash/LSH 只比较候选对，否则直接两两比较
+_LSH_MIN_POINTS = 200
+# rapidfuzz cdist 每次计算的行数，得分矩阵内存随块大小而非 N² 增长
+_CDIST_ROWS = 1024
+# MinHash 签名 = _LSH_BANDS 个分段 × _LSH_ROWS 行；分段阈值约 (1/16)^(1/2) ≈ 0.25，
+# 字符 3-gram 的 Jaccard 远低于 SequenceMatcher 比值，阈值需放宽以保证召回
+_LSH_BANDS = 16
+_LSH_ROWS = 2
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(0x5EED)
+_MINHASH_PERMS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(_LSH_BANDS * _LSH_ROWS)
+]
+del _rng
+
+
+# 批量确认重复的提示词
+_CONFIRM_BATCH_TMPL = """分析以下 {count} 组知识点，分别判断每组内的知识点是否重复或高度相似。
+
+{sections}
+
+任务（对每一组）:
+1. 判断组内知识点是否重复（描述同一概念）
+2. 如果是重复的，选择最佳标题
+3. 给出置信度分数 (0.0-1.0)
+
+按 JSON 数组输出，每组一项:
+[
+  {{
+    "group": 1,
+    "is_duplicate": true,
+    "best_title": "最佳标题",
+    "confidence": 0.9,
+    "reason": "解释原因"
+  }}
+]
+
+注意:
+- 标题相似但内容不同不算重复
+- 同一概念的不同表述算重复
+- 置信度 > 0.8 才认为是重复
+
+只输出 JSON:"""
+
+# 单组确认重复的提示词
+_CONFIRM_TMPL = """分析以下知识点，判断它们是否重复或高度相似。
+
+知识点:
+{points}
+
+任务:
+1. 判断这些知识点是否重复（描述同一概念）
+2. 如果是重复的，选择最佳标题
+3. 给出置信度分数 (0.0-1.0)
+
+按 JSON 输出:
+{{
+  "is_duplicate": true,
+  "best_title": "最佳标题",
+  "confidence": 0.9,
+  "reason": "解释原因"
+}}
+
+注意:
+- 标题相似但内容不同不算重复
+- 同一概念的不同表述算重复
+- 置信度 > 0.8 才认为是重复
+
+只输出 JSON:"""
+
+# 合并知识点的提示词
+_MERGE_TMPL = """整合以下 {count} 个相似知识点，生成一个完整的版本。
+
+{contents}
+
+任务:
+1. 合并所有独特信息，删除重复内容
+2. 确保逻辑连贯，结构清晰
+3. 保留最重要的概念和细节
+4. 优化语言表达
 
-@dataclass
+输出整合后的完整内容（保持知识点的详细程度）:"""
+
+# 章节衔接段落的提示词
+_TRANSITION_TMPL = """为教材章节之间写一段衔接段落。
+
+上一章 "{prev_title}" 的内容:
+{prev_desc}
+
+本章 "{curr_title}" 将要介绍:
+{curr_desc}
+
+任务:
+写一段 2-3 句话的过渡段落，说明:
+1. 上一章的核心收获
+2. 本章与上一章的联系
+3. 本章的学习价值
+
+要求:
+- 语言流畅自然
+- 避免过于生硬
+- 激发学习兴趣
+
+直接输出段落内容:"""
+
+
+@dataclass(slots=True)
 class MergedKnowledge:
     """融合后的知识点"""
 
@@ -39,7 +185,7 @@ class MergedKnowledge:
         }
 
 
-@dataclass
+@dataclass(slots=True)
 class DuplicateGroup:
     """重复知识点组"""
 
@@ -49,12 +195,39 @@ class DuplicateGroup:
     reason: str
 
 
+def _length_bound(a: str, b: str) -> float:
+    """SequenceMatcher.ratio() 的长度上界（即 real_quick_ratio）"""
+    total = len(a) + len(b)
+    return 2.0 * min(len(a), len(b)) / total if total else 1.0
+
+
+def _point_digest(point: KnowledgePoint) -> bytes:
+    """标题与完整内容的摘要，用作相似度缓存键"""
+    h = hashlib.blake2b(point.title.encode("utf-8"), digest_size=16)
+    h.update(b"\0")
+    h.update(point.content.encode("utf-8"))
+    return h.digest()
+
+
 class KnowledgeFusionSkill:
     """知识融合 Skill - 智能去重 + 整合"""
 
-    def __init__(self, llm_client, similarity_threshold: float = 0.75):
+    def __init__(
+        self,
+        llm_client,
+        similarity_threshold: float = 0.75,
+        max_concurrency: int = 4,
+        lsh_min_points: Optional[int] = _LSH_MIN_POINTS,
+    ):
         self.llm = llm_client
         self.similarity_threshold = similarity_threshold
+        # LSH 只是近似，会漏掉部分相似对；传 None 则始终精确两两比较
+        self.lsh_min_points = lsh_min_points
+        # 限制同时在途的 LLM 请求数，避免触发服务端限流
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # 相似度缓存：键为两个知识点全文摘要的有序对加阈值（低于上界时按阈值记 0.0），
+        # 跨多次 merge_duplicates 复用
+        self._sim_cache: Dict[tuple, float] = {}
         logger.info(f"初始化 KnowledgeFusionSkill (threshold={similarity_threshold})")
 
     async def merge_duplicates(
@@ -103,52 +276,161 @@ class KnowledgeFusionSkill:
         使用简单的相似度计算快速找出候选重复组
         """
         n = len(points)
-        similarity_matrix = [[0.0] * n for _ in range(n)]
 
-        # 计算两两相似度
-        for i in range(n):
-            for j in range(i + 1, n):
-                sim = self._calculate_similarity(points[i], points[j])
-                similarity_matrix[i][j] = sim
-                similarity_matrix[j][i] = sim
+        # 并查集：相似对两端归入同一组
+        parent = list(range(n))
 
-        # 基于相似度构建候选组
-        visited = [False] * n
-        groups = []
+        def find(x: int) -> int:
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
 
+        for i, j in self._similar_pairs(points):
+            ri, rj = find(i), find(j)
+            if ri != rj:
+                parent[max(ri, rj)] = min(ri, rj)
+
+        members: Dict[int, List[int]] = {}
         for i in range(n):
-            if visited[i]:
-                continue
+            members.setdefault(find(i), []).append(i)
 
-            # 找出与 i 相似的点
-            group = [i]
-            visited[i] = True
+        return [group for group in members.values() if len(group) > 1]
 
-            for j in range(i + 1, n):
-                if (
-                    not visited[j]
-                    and similarity_matrix[i][j] >= self.similarity_threshold
-                ):
-                    group.append(j)
-                    visited[j] = True
+    def _similar_pairs(self, points: List[KnowledgePoint]):
+        """逐个产出相似度达到阈值的 (i, j) 对，i < j"""
+        n = len(points)
 
-            if len(group) > 1:
-                groups.append(group)
+        if _process is not None:
+            # cdist 足够快，任何规模都精确两两比较，不损失召回
+            yield from self._cdist_pairs(points)
+            return
+
+        if self.lsh_min_points is None or n < self.lsh_min_points:
+            # 逐对打分即判定，不保存 N×N 矩阵
+            for i in range(n):
+                for j in range(i + 1, n):
+                    if self._calculate_similarity(points[i], points[j]) >= (
+                        self.similarity_threshold
+                    ):
+                        yield i, j
+            return
+
+        # 大规模时先用 LSH 找候选对，只对候选对精确打分
+        for i, j in sorted(self._lsh_candidate_pairs(points)):
+            if self._calculate_similarity(points[i], points[j]) >= (
+                self.similarity_threshold
+            ):
+                yield i, j
+
+    def _lsh_candidate_pairs(self, points: List[KnowledgePoint]) -> set:
+        """MinHash 签名分段入桶，同桶即为候选对"""
+        buckets: Dict[tuple, List[int]] = {}
+        for idx, p in enumerate(points):
+            signature = self._minhash(f"{p.title} {p.content[:400]}".lower())
+            for band in range(_LSH_BANDS):
+                key = (band, *signature[band * _LSH_ROWS : (band + 1) * _LSH_ROWS])
+                buckets.setdefault(key, []).append(idx)
+
+        pairs = set()
+        for bucket in buckets.values():
+            for a in range(len(bucket)):
+                for b in range(a + 1, len(bucket)):
+                    pairs.add((bucket[a], bucket[b]))
+        return pairs
+
+    @staticmethod
+    def _minhash(text: str) -> List[int]:
+        """字符 3-gram 的 MinHash 签名"""
+        # 用 crc32 而非内置 hash()：后者按进程加盐，签名（及候选对）会每次运行都不同
+        shingles = {
+            zlib.crc32(text[k : k + 3].encode("utf-8"))
+            for k in range(max(len(text) - 2, 1))
+        }
+        return [
+            min((a * h + b) % _MERSENNE_PRIME for h in shingles)
+            for a, b in _MINHASH_PERMS
+        ]
 
-        return groups
+    def _cdist_pairs(self, points: List[KnowledgePoint]):
+        """
+        用 rapidfuzz 的 C++ 实现批量计算两两相似度（多线程）
+
+        按 _CDIST_ROWS 行分块计算 float32 得分矩阵，只取上三角中达到阈值的位置
+        """
+        titles = [p.title.lower() for p in points]
+        contents = [p.content[:200].lower() for p in points]
+        for start in range(0, len(points), _CDIST_ROWS):
+            stop = start + _CDIST_ROWS
+            title_sim = _process.cdist(
+                titles[start:stop],
+                titles,
+                scorer=_fuzz.ratio,
+                dtype=np.float32,
+                workers=-1,
+            )
+            content_sim = _process.cdist(
+                contents[start:stop],
+                contents,
+                scorer=_fuzz.ratio,
+                dtype=np.float32,
+                workers=-1,
+            )
+            # rapidfuzz 的分数为 0-100，阈值相应放大后加权比较
+            scores = title_sim * 0.6 + content_sim * 0.4
+            # 块内第 r 行对应全局第 start + r 个点，只保留列号更大的位置
+            hits = np.triu(scores >= self.similarity_threshold * 100, k=start + 1)
+            rows, cols = np.nonzero(hits)
+            yield from zip((rows + start).tolist(), cols.tolist())
 
     def _calculate_similarity(self, p1: KnowledgePoint, p2: KnowledgePoint) -> float:
-        """计算两个知识点的相似度"""
-        # 标题相似度（加权更高）
-        title_sim = SequenceMatcher(None, p1.title.lower(), p2.title.lower()).ratio()
+        """计算两个知识点的相似度（带缓存）"""
+        h1, h2 = _point_digest(p1), _point_digest(p2)
+        key = (*sorted((h1, h2)), self.similarity_threshold)
 
-        # 内容相似度（前200字符）
-        content_sim = SequenceMatcher(
-            None, p1.content[:200].lower(), p2.content[:200].lower()
-        ).ratio()
+        sim = self._sim_cache.get(key)
+        if sim is None:
+            sim = self._sim_cache[key] = self._compute_similarity(p1, p2)
+        return sim
 
-        # 加权平均
-        return title_sim * 0.6 + content_sim * 0.4
+    def _compute_similarity(self, p1: KnowledgePoint, p2: KnowledgePoint) -> float:
+        """
+        计算两个知识点的相似度
+
+        先用由粗到细的上界（长度比 → quick_ratio）排除不可能达到阈值的对，
+        此时返回 0.0，只有可能相似的对才跑 O(n*m) 的 ratio()。
+        装有 rapidfuzz 时改用其 C++ 实现的 Indel 相似度。
+        """
+        t1, t2 = p1.title.lower(), p2.title.lower()
+        c1, c2 = p1.content[:200].lower(), p2.content[:200].lower()
+        threshold = self.similarity_threshold
+
+        # 长度上界：ratio <= 2*min(len)/(len1+len2)，无需构造 SequenceMatcher
+        if _length_bound(t1, t2) * 0.6 + _length_bound(c1, c2) * 0.4 < threshold:
+            return 0.0
+
+        if _process is not None:
+            # rapidfuzz 的 Indel 相似度即 2*LCS/(len1+len2)，与 cdist 预筛选口径一致
+            return (
+                _Indel.normalized_similarity(t1, t2) * 0.6
+                + _Indel.normalized_similarity(c1, c2) * 0.4
+            )
+
+        # 只有没装 rapidfuzz 时才用得到 difflib，按需导入
+        from difflib import SequenceMatcher
+
+        title_matcher = SequenceMatcher(None, t1, t2)
+        content_matcher = SequenceMatcher(None, c1, c2)
+
+        # 字符多重集上界
+        if (
+            title_matcher.quick_ratio() * 0.6 + content_matcher.quick_ratio() * 0.4
+            < threshold
+        ):
+            return 0.0
+
+        # 标题相似度（加权更高）+ 内容相似度（前200字符）加权平均
+        return title_matcher.ratio() * 0.6 + content_matcher.ratio() * 0.4
 
     async def _confirm_duplicates(
         self, points: List[KnowledgePoint], candidate_groups: List[List[int]]
@@ -158,71 +440,105 @@ class KnowledgeFusionSkill:
 
         分析候选组，确认是否真正重复
         """
-        confirmed = []
+        groups = [g for g in candidate_groups if len(g) >= 2]
 
-        for group_indices in candidate_groups:
-            if len(group_indices) < 2:
-                continue
-
-            # 构建分析提示
-            group_points = [points[i] for i in group_indices]
-            point_descriptions = [
-                f"[{i}] 标题: {p.title}\n    内容: {p.content[:100]}..."
-                for i, p in zip(group_indices, group_points)
+        # 每 _CONFIRM_BATCH_SIZE 个候选组打包成一次请求，各批并发
+        batches = await asyncio.gather(
+            *[
+                self._confirm_batch(points, groups[k : k + _CONFIRM_BATCH_SIZE])
+                for k in range(0, len(groups), _CONFIRM_BATCH_SIZE)
             ]
+        )
+        return [group for batch in batches for group in batch if group is not None]
+
+    async def _confirm_batch(
+        self, points: List[KnowledgePoint], groups: List[List[int]]
+    ) -> List[Optional[DuplicateGroup]]:
+        """一次请求确认多个候选组，解析失败的组退回逐组确认"""
+        if len(groups) == 1:
+            return [await self._confirm_one(points, groups[0])]
+
+        sections = []
+        for n, group_indices in enumerate(groups, 1):
+            lines = [
+                f"  [{i}] 标题: {points[i].title}\n      内容: {points[i].content[:100]}..."
+                for i in group_indices
+            ]
+            sections.append(f"第 {n} 组:\n" + "\n".join(lines))
 
-            prompt = f"""分析以下知识点，判断它们是否重复或高度相似。
-
-知识点:
-{chr(10).join(point_descriptions)}
-
-任务:
-1. 判断这些知识点是否重复（描述同一概念）
-2. 如果是重复的，选择最佳标题
-3. 给出置信度分数 (0.0-1.0)
-
-按 JSON 输出:
-{{
-  "is_duplicate": true,
-  "best_title": "最佳标题",
-  "confidence": 0.9,
-  "reason": "解释原因"
-}}
+        prompt = _CONFIRM_BATCH_TMPL.format(
+            count=len(groups), sections="\n".join(sections)
+        )
 
-注意:
-- 标题相似但内容不同不算重复
-- 同一概念的不同表述算重复
-- 置信度 > 0.8 才认为是重复
+        verdicts = {}
+        try:
+            result = await self._generate(prompt, 0.2)
+            for data in self._parse_json_array(result):
+                if isinstance(data, dict) and isinstance(data.get("group"), int):
+                    verdicts[data["group"]] = data
+        except Exception as e:
+            logger.warning(f"批量确认重复失败，改为逐组确认: {e}")
+
+        results: List[Optional[DuplicateGroup]] = [None] * len(groups)
+        retry = []
+        for n, group_indices in enumerate(groups, 1):
+            if n in verdicts:
+                results[n - 1] = self._to_duplicate_group(
+                    verdicts[n], points, group_indices
+                )
+            else:
+                retry.append(n - 1)
+
+        if retry:
+            retried = await asyncio.gather(
+                *[self._confirm_one(points, groups[k]) for k in retry]
+            )
+            for k, group in zip(retry, retried):
+                results[k] = group
+
+        return results
+
+    async def _confirm_one(
+        self, points: List[KnowledgePoint], group_indices: List[int]
+    ) -> Optional[DuplicateGroup]:
+        """确认单个候选组，不重复时返回 None"""
+        # 构建分析提示
+        group_points = [points[i] for i in group_indices]
+        point_descriptions = [
+            f"[{i}] 标题: {p.title}\n    内容: {p.content[:100]}..."
+            for i, p in zip(group_indices, group_points)
+        ]
 
-只输出 JSON:"""
+        prompt = _CONFIRM_TMPL.format(points="\n".join(point_descriptions))
 
-            try:
-                result = await self.llm.generate(prompt, temperature=0.2)
-                data = self._parse_json_response(result)
-
-                if data.get("is_duplicate", False) and data.get("confidence", 0) > 0.8:
-                    confirmed.append(
-                        DuplicateGroup(
-                            best_title=data.get("best_title", group_points[0].title),
-                            indices=group_indices,
-                            similarity_scores=[1.0] * len(group_indices),
-                            reason=data.get("reason", ""),
-                        )
-                    )
-
-            except Exception as e:
-                logger.error(f"确认重复失败: {e}")
-                # 降级：使用第一点的标题
-                confirmed.append(
-                    DuplicateGroup(
-                        best_title=group_points[0].title,
-                        indices=group_indices,
-                        similarity_scores=[1.0] * len(group_indices),
-                        reason="自动合并（LLM确认失败）",
-                    )
-                )
+        try:
+            result = await self._generate(prompt, 0.2)
+            data = self._parse_json_response(result)
+            return self._to_duplicate_group(data, points, group_indices)
 
-        return confirmed
+        except Exception as e:
+            logger.error(f"确认重复失败: {e}")
+            # 降级：使用第一点的标题
+            return DuplicateGroup(
+                best_title=group_points[0].title,
+                indices=group_indices,
+                similarity_scores=[1.0] * len(group_indices),
+                reason="自动合并（LLM确认失败）",
+            )
+
+    @staticmethod
+    def _to_duplicate_group(
+        data: Dict, points: List[KnowledgePoint], group_indices: List[int]
+    ) -> Optional[DuplicateGroup]:
+        """把 LLM 判定结果转为 DuplicateGroup，不重复时返回 None"""
+        if data.get("is_duplicate", False) and data.get("confidence", 0) > 0.8:
+            return DuplicateGroup(
+                best_title=data.get("best_title", points[group_indices[0]].title),
+                indices=group_indices,
+                similarity_scores=[1.0] * len(group_indices),
+                reason=data.get("reason", ""),
+            )
+        return None
 
     async def _merge_all_groups(
         self, points: List[KnowledgePoint], confirmed_groups: List[DuplicateGroup]
@@ -231,17 +547,28 @@ class KnowledgeFusionSkill:
         merged = []
         used_indices = set()
 
+        # 多点组的 LLM 合并并发执行，结果按组顺序放回
+        pending = []
         for group in confirmed_groups:
             group_points = [points[i] for i in group.indices if i < len(points)]
 
             if len(group_points) > 1:
-                merged_point = await self._merge_group(group_points, group.best_title)
-                merged.append(merged_point)
+                pending.append((len(merged), group_points, group.best_title))
+                merged.append(None)
                 used_indices.update(group.indices)
             elif len(group_points) == 1:
                 merged.append(self._to_merged(group_points[0]))
                 used_indices.add(group.indices[0])
 
+        results = await asyncio.gather(
+            *[
+                self._merge_group(group_points, title)
+                for _, group_points, title in pending
+            ]
+        )
+        for (slot, _, _), merged_point in zip(pending, results):
+            merged[slot] = merged_point
+
         # 添加未分组的知识点
         for i, p in enumerate(points):
             if i not in used_indices:
@@ -265,20 +592,10 @@ class KnowledgeFusionSkill:
         for i, p in enumerate(points[:5]):  # 最多合并5个
             contents.append(f"版本 {i+1}:\n标题: {p.title}\n内容: {p.content[:1000]}")
 
-        prompt = f"""整合以下 {len(points)} 个相似知识点，生成一个完整的版本。
-
-{chr(10).join(contents)}
-
-任务:
-1. 合并所有独特信息，删除重复内容
-2. 确保逻辑连贯，结构清晰
-3. 保留最重要的概念和细节
-4. 优化语言表达
-
-输出整合后的完整内容（保持知识点的详细程度）:"""
+        prompt = _MERGE_TMPL.format(count=len(points), contents="\n".join(contents))
 
         try:
-            merged_content = await self.llm.generate(prompt, temperature=0.3)
+            merged_content = await self._generate(prompt, 0.3)
 
             # 提取核心内容（去除可能的装饰性文字）
             merged_content = self._clean_merged_content(merged_content)
@@ -309,17 +626,16 @@ class KnowledgeFusionSkill:
             merged_from=len(points),
         )
 
+    async def _generate(self, prompt: str, temperature: float) -> str:
+        """调用 LLM（受并发上限约束）"""
+        async with self._semaphore:
+            return await self.llm.generate(prompt, temperature=temperature)
+
     def _clean_merged_content(self, content: str) -> str:
         """清理合并后的内容"""
         # 去除可能的 "整合后内容:" 等前缀
-        prefixes = [
-            r"^整合后的内容[:：]\s*",
-            r"^合并后的内容[:：]\s*",
-            r"^最终版本[:：]\s*",
-        ]
-
-        for prefix in prefixes:
-            content = re.sub(prefix, "", content, flags=re.IGNORECASE)
+        for prefix_re in _MERGED_PREFIX_RES:
+            content = prefix_re.sub("", content)
 
         return content.strip()
 
@@ -329,28 +645,27 @@ class KnowledgeFusionSkill:
         unique = []
 
         for m in markers:
-            key = f"{m.get('time', '')}-{m.get('description', '')[:30]}"
+            key = (m.get("time", ""), m.get("description", "")[:30])
             if key not in seen:
                 seen.add(key)
                 unique.append(m)
+                if len(unique) == 5:  # 限制数量
+                    break
 
-        return unique[:5]  # 限制数量
+        return unique
 
     def _extract_examples(self, points: List[KnowledgePoint]) -> List[str]:
         """从知识点中提取例题"""
         examples = []
         for p in points:
             # 查找包含"例"、"例题"、"example"的段落
-            lines = p.content.split("\n")
-            for line in lines:
-                if any(
-                    kw in line
-                    for kw in ["例", "例题", "示例", "例子", "example", "Example"]
-                ):
-                    if len(line) > 20 and len(line) < 500:
-                        examples.append(line.strip())
+            for line in p.content.split("\n"):
+                if 20 < len(line) < 500 and _EXAMPLE_RE.search(line):
+                    examples.append(line.strip())
+                    if len(examples) == 3:  # 最多3个例题
+                        return examples
 
-        return examples[:3]  # 最多3个例题
+        return examples
 
     async def generate_transitions(self, chapters: List[Dict]) -> Dict[int, str]:
         """
@@ -362,48 +677,34 @@ class KnowledgeFusionSkill:
             return {}
 
         logger.info(f"生成 {len(chapters)-1} 个衔接段落")
-        transitions = {}
-
-        for i in range(1, len(chapters)):
-            prev_ch = chapters[i - 1]
-            curr_ch = chapters[i]
-
-            prev_desc = prev_ch.get("description", prev_ch.get("title", ""))
-            curr_desc = curr_ch.get("description", curr_ch.get("title", ""))
-
-            prompt = f"""为教材章节之间写一段衔接段落。
-
-上一章 "{prev_ch.get('title', '')}" 的内容:
-{prev_desc[:200]}
-
-本章 "{curr_ch.get('title', '')}" 将要介绍:
-{curr_desc[:200]}
-
-任务:
-写一段 2-3 句话的过渡段落，说明:
-1. 上一章的核心收获
-2. 本章与上一章的联系
-3. 本章的学习价值
-
-要求:
-- 语言流畅自然
-- 避免过于生硬
-- 激发学习兴趣
-
-直接输出段落内容:"""
+        # 各衔接段落互不依赖，并发生成
+        results = await asyncio.gather(
+            *[
+                self._transition_one(chapters[i - 1], chapters[i])
+                for i in range(1, len(chapters))
+            ]
+        )
+        return dict(enumerate(results, 1))
+
+    async def _transition_one(self, prev_ch: Dict, curr_ch: Dict) -> str:
+        """生成单个衔接段落"""
+        prev_desc = prev_ch.get("description", prev_ch.get("title", ""))
+        curr_desc = curr_ch.get("description", curr_ch.get("title", ""))
+
+        prompt = _TRANSITION_TMPL.format(
+            prev_title=prev_ch.get("title", ""),
+            prev_desc=prev_desc[:200],
+            curr_title=curr_ch.get("title", ""),
+            curr_desc=curr_desc[:200],
+        )
 
-            try:
-                transition = await self.llm.generate(prompt, temperature=0.4)
-                transition = self._clean_transition(transition)
-                transitions[i] = transition
-
-            except Exception as e:
-                logger.error(f"衔接段落生成失败: {e}")
-                transitions[i] = (
-                    f"接下来我们将学习 {curr_ch.get('title', '下一章内容')}。"
-                )
+        try:
+            transition = await self._generate(prompt, 0.4)
+            return self._clean_transition(transition)
 
-        return transitions
+        except Exception as e:
+            logger.error(f"衔接段落生成失败: {e}")
+            return f"接下来我们将学习 {curr_ch.get('title', '下一章内容')}。"
 
     def _clean_transition(self, text: str) -> str:
         """清理衔接段落"""
@@ -411,14 +712,8 @@ class KnowledgeFusionSkill:
         text = text.strip().strip('"').strip("'")
 
         # 去除 "过渡段落:" 等前缀
-        prefixes = [
-            r"^过渡段落[:：]\s*",
-            r"^衔接[:：]\s*",
-            r"^段落[:：]\s*",
-        ]
-
-        for prefix in prefixes:
-            text = re.sub(prefix, "", text, flags=re.IGNORECASE)
+        for prefix_re in _TRANSITION_PREFIX_RES:
+            text = prefix_re.sub("", text)
 
         return text.strip()
 
@@ -434,34 +729,44 @@ class KnowledgeFusionSkill:
             merged_from=1,
         )
 
-    def _parse_json_response(self, text: str) -> Dict:
-        """解析 JSON 响应"""
-        patterns = [
-            r"```json\s*\n(.*?)\n```",
-            r"```\s*\n(.*?)\n```",
-            r"(\{[\s\S]*\})",
-        ]
+    def _parse_json_array(self, text: str) -> List:
+        """解析 JSON 数组响应，失败时抛出 ValueError"""
+        match = _JSON_FENCE_RE.search(text)
+        if match:
+            text = match.group(1)
 
-        for pattern in patterns:
-            match = re.search(pattern, text, re.DOTALL)
-            if match:
-                try:
-                    return json.loads(match.group(1).strip())
-                except json.JSONDecodeError:
-                    continue
-
-        try:
-            return json.loads(text.strip())
-        except json.JSONDecodeError:
-            pass
+        start = text.find("[")
+        end = text.rfind("]")
+        if start >= 0 and end > start:
+            try:
+                data = _json_loads(text[start : end + 1])
+            except json.JSONDecodeError as e:
+                raise ValueError(f"无法解析 JSON 数组: {e}") from e
+            if isinstance(data, list):
+                return data
+        raise ValueError("响应中没有 JSON 数组")
 
+    def _parse_json_response(self, text: str) -> Dict:
+        """解析 JSON 响应：先整体解析首尾花括号之间的内容，失败再逐个 { 增量解码"""
         start = text.find("{")
         end = text.rfind("}")
-        if start >= 0 and end > start:
+        if 0 <= start < end:
+            # 常见情况：首尾花括号之间就是完整 JSON，直接整体解析
+            try:
+                data = _json_loads(text[start : end + 1])
+                if isinstance(data, dict):
+                    return data
+            except json.JSONDecodeError:
+                pass
+
+        while start >= 0:
             try:
-                return json.loads(text[start : end + 1])
+                data, _ = _JSON_DECODER.raw_decode(text, start)
+                if isinstance(data, dict):
+                    return data
             except json.JSONDecodeError:
                 pass
+            start = text.find("{", start + 1)
 
         logger.warning(f"无法解析 JSON: {text[:200]}...")
         return {}
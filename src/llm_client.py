@@ -1,28 +1,30 @@
 """LLM Client - 支持本地 Ollama 和 API"""
 
-import requests
 import json
-from typing import Optional
 
+import httpx
+import requests
+from typing import Optional, Union
 
-class LLMClient:
-    """LLM 客户端基类"""
+try:
+    from orjson import loads as _json_loads  # 可选加速
+except ImportError:
+    from json import loads as _json_loads
 
-    def extract_knowledge(self, text: str) -> dict:
-        """提取知识，返回结构化数据"""
-        raise NotImplementedError
+try:
+    import h2  # noqa: F401  httpx 的 HTTP/2 支持依赖 h2
+except ImportError:
+    _HTTP2 = False
+else:
+    _HTTP2 = True
 
+_JSON_DECODER = json.JSONDecoder()
+_ASYNC_LIMITS = httpx.Limits(max_keepalive_connections=32)
 
-class OllamaClient(LLMClient):
-    """本地 Ollama 客户端"""
 
-    def __init__(self, base_url: str = "http://localhost:11434", model: str = "llama2"):
-        self.base_url = base_url
-        self.model = model
-
-    def extract_knowledge(self, text: str) -> dict:
-        """调用本地 Ollama 提取知识"""
-        prompt = f"""从以下讲座内容中提取结构化知识：
+def _build_prompt(text: str) -> str:
+    """知识提取提示词（Ollama 与 API 共用）"""
+    return f"""从以下讲座内容中提取结构化知识：
 
 {text[:3000]}
 
@@ -40,43 +42,165 @@ class OllamaClient(LLMClient):
   "summary": "..."
 }}"""
 
+
+def _parse_knowledge(content: str, fallback_topic: str) -> dict:
+    """从模型回复中提取 JSON，失败时把原文放进 key_points"""
+    try:
+        start = content.find("{")
+        end = content.rfind("}") + 1
+        if start >= 0 and end > start:
+            return _json_loads(content[start:end])
+    except Exception:
+        pass
+
+    return {
+        "topic": fallback_topic,
+        "concepts": [],
+        "key_points": [content[:500]],
+        "summary": "",
+    }
+
+
+class _JsonSniffer:
+    """
+    流式回复的增量 JSON 探测
+
+    逐段 feed 回复文本，第一个 { 开始的对象一旦闭合即返回，调用方可提前结束流
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._start = -1
+
+    def feed(self, chunk: str) -> Optional[dict]:
+        """追加一段文本，已能解析出完整对象时返回它"""
+        self.text += chunk
+        if self._start < 0:
+            self._start = self.text.find("{")
+        # 只有新片段带来了 } 才可能闭合，避免每段都重新解析
+        if self._start < 0 or "}" not in chunk:
+            return None
+        try:
+            data, _ = _JSON_DECODER.raw_decode(self.text, self._start)
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+
+
+def _ollama_chunk(line) -> tuple:
+    """Ollama 流式 NDJSON 的一行 -> (文本片段, 是否结束)"""
+    data = _json_loads(line)
+    return data.get("response", ""), data.get("done", False)
+
+
+def _sse_chunk(line) -> tuple:
+    """OpenAI 兼容 SSE 的一行 -> (文本片段, 是否结束)"""
+    if isinstance(line, bytes):
+        line = line.decode("utf-8")
+    if not line.startswith("data:"):
+        return "", False
+    data = line[5:].strip()
+    if data == "[DONE]":
+        return "", True
+    choices = _json_loads(data).get("choices")
+    if not choices:
+        return "", False
+    return choices[0].get("delta", {}).get("content") or "", False
+
+
+def _consume(lines, parse_chunk, fallback_topic: str) -> dict:
+    """读取流式回复，JSON 对象闭合即返回；流结束仍未得到时按整段文本兜底"""
+    sniffer = _JsonSniffer()
+    for line in lines:
+        if not line:
+            continue
+        chunk, done = parse_chunk(line)
+        data = sniffer.feed(chunk)
+        if data is not None:
+            return data
+        if done:
+            break
+    return _parse_knowledge(sniffer.text, fallback_topic)
+
+
+async def _aconsume(lines, parse_chunk, fallback_topic: str) -> dict:
+    """_consume 的异步版本"""
+    sniffer = _JsonSniffer()
+    async for line in lines:
+        if not line:
+            continue
+        chunk, done = parse_chunk(line)
+        data = sniffer.feed(chunk)
+        if data is not None:
+            return data
+        if done:
+            break
+    return _parse_knowledge(sniffer.text, fallback_topic)
+
+
+def _chat_payload(model: str, text: str) -> dict:
+    """chat/completions 请求体（同步与异步 API 客户端共用）"""
+    messages = [
+        {
+            "role": "system",
+            "content": "你是一个知识提取助手。从讲座内容中提取结构化知识，以 JSON 格式返回。",
+        },
+        {
+            "role": "user",
+            "content": _build_prompt(text),
+        },
+    ]
+    return {
+        "model": model,
+        "messages": messages,
+        "temperature": 0.3,
+        "stream": True,
+    }
+
+
+def _error_result(topic: str) -> dict:
+    """请求失败时的返回结构"""
+    return {
+        "topic": topic,
+        "concepts": [],
+        "key_points": [],
+        "summary": "",
+    }
+
+
+class LLMClient:
+    """LLM 客户端基类"""
+
+    def extract_knowledge(self, text: str) -> dict:
+        """提取知识，返回结构化数据"""
+        raise NotImplementedError
+
+
+class OllamaClient(LLMClient):
+    """本地 Ollama 客户端"""
+
+    def __init__(self, base_url: str = "http://localhost:11434", model: str = "llama2"):
+        self.base_url = base_url
+        self.model = model
+
+    def extract_knowledge(self, text: str) -> dict:
+        """调用本地 Ollama 提取知识"""
+        prompt = _build_prompt(text)
+
         try:
-            response = requests.post(
+            # 流式读取，JSON 一闭合就关闭连接，不必等模型输出完
+            with requests.post(
                 f"{self.base_url}/api/generate",
-                json={"model": self.model, "prompt": prompt, "stream": False},
+                json={"model": self.model, "prompt": prompt, "stream": True},
                 timeout=120,
-            )
-            response.raise_for_status()
-            result = response.json()
-
-            # 解析返回的 JSON
-            content = result.get("response", "")
-            # 尝试提取 JSON 部分
-            try:
-                # 查找 JSON 块
-                start = content.find("{")
-                end = content.rfind("}") + 1
-                if start >= 0 and end > start:
-                    data = json.loads(content[start:end])
-                    return data
-            except Exception:
-                pass
-
-            # 如果 JSON 解析失败，返回原始内容
-            return {
-                "topic": "提取失败",
-                "concepts": [],
-                "key_points": [content[:500]],
-                "summary": "",
-            }
+                stream=True,
+            ) as response:
+                response.raise_for_status()
+                # 解析返回的 JSON，失败时返回原始内容
+                return _consume(response.iter_lines(), _ollama_chunk, "提取失败")
 
         except Exception as e:
-            return {
-                "topic": f"错误: {str(e)}",
-                "concepts": [],
-                "key_points": [],
-                "summary": "",
-            }
+            return _error_result(f"错误: {str(e)}")
 
 
 class APIClient(LLMClient):
@@ -93,68 +217,109 @@ class APIClient(LLMClient):
 
     def extract_knowledge(self, text: str) -> dict:
         """调用 API 提取知识"""
-        messages = [
-            {
-                "role": "system",
-                "content": "你是一个知识提取助手。从讲座内容中提取结构化知识，以 JSON 格式返回。",
-            },
-            {
-                "role": "user",
-                "content": f"""从以下讲座内容中提取结构化知识：
+        try:
+            with requests.post(
+                f"{self.base_url}/chat/completions",
+                headers=self.headers,
+                json=_chat_payload(self.model, text),
+                timeout=120,
+                stream=True,
+            ) as response:
+                response.raise_for_status()
+                return _consume(response.iter_lines(), _sse_chunk, "提取结果")
 
-{text[:3000]}
+        except Exception as e:
+            return _error_result(f"API 错误: {str(e)}")
 
-请提取：
-1. 核心主题（一句话概括）
-2. 关键概念（3-5个）
-3. 重要知识点（列表形式）
-4. 总结（100字以内）
 
-以 JSON 格式返回：
-{{
-  "topic": "...",
-  "concepts": ["...", "..."],
-  "key_points": ["...", "..."],
-  "summary": "..."
-}}""",
-            },
-        ]
+class AsyncLLMClient:
+    """
+    异步 LLM 客户端基类 - 接口同 LLMClient，但 extract_knowledge 是协程
 
-        try:
-            response = requests.post(
-                f"{self.base_url}/chat/completions",
-                headers=self.headers,
-                json={"model": self.model, "messages": messages, "temperature": 0.3},
+    每个实例复用一个 httpx.AsyncClient（keep-alive 连接池），首次请求时创建，
+    绑定到创建它的事件循环；用完调用 aclose()
+    """
+
+    def __init__(self, base_url: str, headers: Optional[dict] = None):
+        self.base_url = base_url.rstrip("/")
+        self._headers = headers
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self._headers,
                 timeout=120,
+                limits=_ASYNC_LIMITS,
+                http2=_HTTP2,  # 装了 h2 且为 HTTPS 时启用
             )
-            response.raise_for_status()
-            result = response.json()
-
-            content = result["choices"][0]["message"]["content"]
-
-            # 尝试解析 JSON
-            try:
-                start = content.find("{")
-                end = content.rfind("}") + 1
-                if start >= 0 and end > start:
-                    return json.loads(content[start:end])
-            except Exception:
-                pass
-
-            return {
-                "topic": "提取结果",
-                "concepts": [],
-                "key_points": [content[:500]],
-                "summary": "",
-            }
+        return self._client
+
+    async def extract_knowledge(self, text: str) -> dict:
+        """提取知识，返回结构化数据"""
+        raise NotImplementedError
+
+    async def aclose(self):
+        """关闭连接池"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class AsyncOllamaClient(AsyncLLMClient):
+    """本地 Ollama 异步客户端"""
+
+    def __init__(self, base_url: str = "http://localhost:11434", model: str = "llama2"):
+        super().__init__(base_url)
+        self.model = model
+
+    async def extract_knowledge(self, text: str) -> dict:
+        """异步调用本地 Ollama 提取知识"""
+        try:
+            async with self._get_client().stream(
+                "POST",
+                "/api/generate",
+                json={
+                    "model": self.model,
+                    "prompt": _build_prompt(text),
+                    "stream": True,
+                },
+            ) as response:
+                response.raise_for_status()
+                return await _aconsume(
+                    response.aiter_lines(), _ollama_chunk, "提取失败"
+                )
+
+        except Exception as e:
+            return _error_result(f"错误: {str(e)}")
+
+
+class AsyncAPIClient(AsyncLLMClient):
+    """API 异步客户端 (OpenAI, Kimi, etc.)"""
+
+    def __init__(self, api_key: str, base_url: str, model: str):
+        super().__init__(
+            base_url,
+            headers={
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json",
+            },
+        )
+        self.api_key = api_key
+        self.model = model
+
+    async def extract_knowledge(self, text: str) -> dict:
+        """异步调用 API 提取知识"""
+        try:
+            async with self._get_client().stream(
+                "POST", "/chat/completions", json=_chat_payload(self.model, text)
+            ) as response:
+                response.raise_for_status()
+                return await _aconsume(response.aiter_lines(), _sse_chunk, "提取结果")
 
         except Exception as e:
-            return {
-                "topic": f"API 错误: {str(e)}",
-                "concepts": [],
-                "key_points": [],
-                "summary": "",
-            }
+            return _error_result(f"API 错误: {str(e)}")
 
 
 class LLMConfig:
@@ -191,16 +356,20 @@ class LLMConfig:
 
     @classmethod
     def create_client(
-        cls, preset: str, api_key: Optional[str] = None, **kwargs
-    ) -> LLMClient:
-        """创建客户端"""
+        cls,
+        preset: str,
+        api_key: Optional[str] = None,
+        use_async: bool = False,
+        **kwargs,
+    ) -> Union[LLMClient, AsyncLLMClient]:
+        """创建客户端；use_async=True 时返回 AsyncLLMClient（extract_knowledge 为协程）"""
         if preset == "ollama":
-            return OllamaClient(**kwargs)
+            return (AsyncOllamaClient if use_async else OllamaClient)(**kwargs)
         else:
             if not api_key:
                 raise ValueError(f"{preset} 需要 API Key")
             config = cls.PRESETS.get(preset, cls.PRESETS["openai"])
-            return APIClient(
+            return (AsyncAPIClient if use_async else APIClient)(
                 api_key=api_key,
                 base_url=kwargs.get("base_url", config["base_url"]),
                 model=kwargs.get("model", config["model"]),
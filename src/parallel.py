@@ -3,17 +3,22 @@ Parallel processing - 并行处理多个文档
 """
 
 import asyncio
+import os
+from fnmatch import fnmatchcase
 from pathlib import Path
-from typing import List
+from typing import Awaitable, Callable, List
 from .workflow import Document, WorkflowEngine
 
 
 class ParallelProcessor:
     """并行文档处理器"""
 
-    def __init__(self, engine: WorkflowEngine, max_workers: int = 3):
+    def __init__(
+        self, engine: WorkflowEngine, max_workers: int = 3, bundle_size: int = 1
+    ):
         self.engine = engine
-        self.semaphore = asyncio.Semaphore(max_workers)
+        self.max_workers = max(1, max_workers)
+        self.bundle_size = max(1, bundle_size)  # 每次合并调用 LLM 的文档数
         self.results: List[Document] = []
 
     async def process_directory(
@@ -30,57 +35,109 @@ class ParallelProcessor:
             List[Document]: 处理后的文档列表
         """
         # 发现文件
-        files = list(dir_path.glob(pattern))
-        files.extend(dir_path.glob("*.txt"))
+        files = self._discover_files(dir_path, pattern)
 
         if not files:
             print(f"未找到匹配文件: {dir_path}/{pattern}")
             return []
 
         print(
-            f"发现 {len(files)} 个文件，开始并行处理 (max_workers={self.semaphore._value})"
+            f"发现 {len(files)} 个文件，开始并行处理 (max_workers={self.max_workers})"
         )
 
-        # 并行处理
-        tasks = [self._process_with_limit(f) for f in files]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        # 并行处理（按 bundle_size 分组，组内合并 LLM 调用）
+        bundles = [
+            files[i : i + self.bundle_size]
+            for i in range(0, len(files), self.bundle_size)
+        ]
+        results = await self._run_workers(bundles, self._process_bundle)
 
         # 过滤异常
         docs = []
-        for i, result in enumerate(results):
+        for bundle, result in zip(bundles, results):
             if isinstance(result, Exception):
-                print(f"处理失败 {files[i]}: {result}")
+                for f in bundle:
+                    print(f"处理失败 {f}: {result}")
             else:
-                docs.append(result)
+                docs.extend(result)
 
         print(f"完成: {len(docs)}/{len(files)} 个文件")
         return docs
 
-    async def _process_with_limit(self, file_path: Path) -> Document:
-        """带限流的单文件处理"""
-        async with self.semaphore:
-            print(f"  处理: {file_path.name}")
-            return await self.engine.process_document(file_path)
+    @staticmethod
+    def _discover_files(dir_path: Path, pattern: str) -> List[Path]:
+        """一次扫描目录，收集匹配 pattern 或 *.txt 的文件（去重、按名排序）"""
+        if not dir_path.is_dir():
+            return []
+
+        patterns = {pattern, "*.txt"}
+        with os.scandir(dir_path) as it:
+            names = sorted(
+                e.name
+                for e in it
+                if e.is_file() and any(fnmatchcase(e.name, p) for p in patterns)
+            )
+        return [dir_path / name for name in names]
+
+    async def _run_workers(
+        self, items: List, handler: Callable[..., Awaitable]
+    ) -> List:
+        """
+        固定 max_workers 个 worker 从队列取任务，同时在途的任务数有上限
+
+        结果按 items 顺序返回，失败项位置上是异常对象
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        for slot, item in enumerate(items):
+            queue.put_nowait((slot, item))
+        results: List = [None] * len(items)
+
+        async def _worker():
+            while True:
+                slot, item = await queue.get()
+                try:
+                    results[slot] = await handler(item)
+                except Exception as e:
+                    results[slot] = e
+                finally:
+                    queue.task_done()
+
+        workers = [
+            asyncio.create_task(_worker())
+            for _ in range(min(self.max_workers, len(items)))
+        ]
+        try:
+            await queue.join()
+        finally:
+            for w in workers:
+                w.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        return results
+
+    async def _process_bundle(self, bundle: List[Path]) -> List[Document]:
+        """处理一组文件（单文件时走单文档流程）"""
+        print(f"  处理: {', '.join(f.name for f in bundle)}")
+        if len(bundle) == 1:
+            return [await self.engine.process_document(bundle[0])]
+        return await self.engine.process_documents(bundle)
 
     async def process_with_progress(
         self, dir_path: Path, pattern: str = "*.srt"
     ) -> List[Document]:
         """带进度回调的并行处理 (用于 UI)"""
-        files = list(dir_path.glob(pattern))
-        files.extend(dir_path.glob("*.txt"))
+        files = self._discover_files(dir_path, pattern)
 
         total = len(files)
         completed = 0
 
         async def _process_and_track(f: Path) -> Document:
             nonlocal completed
-            async with self.semaphore:
-                doc = await self.engine.process_document(f)
-                completed += 1
-                print(f"进度: {completed}/{total} - {f.name}")
-                return doc
-
-        tasks = [_process_and_track(f) for f in files]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+            doc = await self.engine.process_document(f)
+            completed += 1
+            print(f"进度: {completed}/{total} - {f.name}")
+            return doc
+
+        results = await self._run_workers(files, _process_and_track)
 
         return [r for r in results if not isinstance(r, Exception)]
@@ -3,12 +3,19 @@ SRT Parser - 字幕解析
 """
 
 import re
+import sys
 from dataclasses import dataclass
-from typing import List
+from typing import Iterable, List
 from pathlib import Path
 
+# 预编译正则，避免每次解析都走 re 模块缓存查找
+_TIME_RE = re.compile(r"(\d{2}:\d{2}:\d{2},\d{3})\s*-->\s*(\d{2}:\d{2}:\d{2},\d{3})")
 
-@dataclass
+# 逐行解析的状态：期待序号 / 期待时间轴 / 读取文本 / 跳过残缺条目
+_IDX, _TIME, _TEXT, _SKIP = range(4)
+
+
+@dataclass(slots=True, frozen=True)
 class SubtitleEntry:
     """字幕条目"""
 
@@ -16,6 +23,25 @@ class SubtitleEntry:
     start: str  # 00:05:30,000
     end: str
     text: str
+    start_s: float = 0.0  # 解析时换算好的秒数，下游比较无需再解析字符串
+    end_s: float = 0.0
+
+
+def _to_seconds(t: str) -> float:
+    """00:05:30,000 -> 330.0（格式已由 _TIME_RE 保证）"""
+    return int(t[0:2]) * 3600 + int(t[3:5]) * 60 + int(t[6:8]) + int(t[9:12]) / 1000
+
+
+def _make_entry(index: int, start: str, end: str, text: List[str]) -> SubtitleEntry:
+    """由解析出的各部分构造条目（文本可能多行）"""
+    return SubtitleEntry(
+        index=index,
+        start=start,
+        end=end,
+        text=" ".join(text).strip(),
+        start_s=_to_seconds(start),
+        end_s=_to_seconds(end),
+    )
 
 
 class SRTParser:
@@ -23,44 +49,56 @@ class SRTParser:
 
     @staticmethod
     def parse_file(file_path: Path) -> List[SubtitleEntry]:
-        """解析 SRT 文件"""
-        content = file_path.read_text(encoding="utf-8")
-        return SRTParser.parse(content)
+        """解析 SRT 文件（逐行读取，不整体载入）"""
+        with file_path.open("r", encoding="utf-8") as f:
+            return SRTParser._parse_lines(f)
 
     @staticmethod
     def parse(content: str) -> List[SubtitleEntry]:
         """解析 SRT 内容"""
-        entries = []
-
-        # 分割条目（按空行）
-        blocks = re.split(r"\n\s*\n", content.strip())
+        return SRTParser._parse_lines(content.splitlines())
 
-        for block in blocks:
-            lines = block.strip().split("\n")
-            if len(lines) < 3:
-                continue
-
-            # 解析序号
-            try:
-                index = int(lines[0].strip())
-            except ValueError:
-                continue
-
-            # 解析时间轴
-            time_line = lines[1].strip()
-            time_match = re.match(
-                r"(\d{2}:\d{2}:\d{2},\d{3})\s*-->\s*(\d{2}:\d{2}:\d{2},\d{3})",
-                time_line,
-            )
-            if not time_match:
+    @staticmethod
+    def _parse_lines(lines: Iterable[str]) -> List[SubtitleEntry]:
+        """单遍状态机：空行结束一个条目，残缺条目整体跳过"""
+        entries = []
+        state = _IDX
+        index = 0
+        start = end = ""
+        text: List[str] = []
+
+        for line in lines:
+            stripped = line.strip()
+
+            if not stripped:
+                if state == _TEXT and text:
+                    entries.append(_make_entry(index, start, end, text))
+                    text = []
+                state = _IDX
                 continue
 
-            start, end = time_match.groups()
-
-            # 解析文本（可能多行）
-            text = " ".join(lines[2:]).strip()
-
-            entries.append(SubtitleEntry(index=index, start=start, end=end, text=text))
+            if state == _IDX:
+                # 解析序号
+                try:
+                    index = int(stripped)
+                    state = _TIME
+                except ValueError:
+                    state = _SKIP
+            elif state == _TIME:
+                # 解析时间轴
+                time_match = _TIME_RE.match(stripped)
+                if time_match:
+                    # 上一条的结束时间常与下一条的开始时间相同，驻留后共用一个对象
+                    start, end = map(sys.intern, time_match.groups())
+                    state = _TEXT
+                else:
+                    state = _SKIP
+            elif state == _TEXT:
+                # 文本可能多行
+                text.append(line.rstrip("\r\n"))
+
+        if state == _TEXT and text:
+            entries.append(_make_entry(index, start, end, text))
 
         return entries
 
@@ -3,13 +3,61 @@ Core workflow - 极简实现，无框架依赖
 """
 
 import asyncio
+import copy
+import hashlib
 import re
 import json
+import os
+import time
+from collections import OrderedDict
 from dataclasses import dataclass, field
-from typing import List, Optional, Dict, Any
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
 from pathlib import Path
 import sqlite3
 
+import httpx
+
+try:
+    import orjson  # 可选加速
+
+    _json_loads = orjson.loads
+
+    def _json_dumps(obj) -> str:
+        # orjson 直接输出 UTF-8，不转义非 ASCII 字符
+        return orjson.dumps(obj).decode("utf-8")
+
+except ImportError:
+    _json_loads = json.loads
+
+    def _json_dumps(obj) -> str:
+        return json.dumps(obj, ensure_ascii=False)
+
+
+try:
+    import h2  # noqa: F401  httpx 的 HTTP/2 支持依赖 h2
+except ImportError:
+    _HTTP2 = False
+else:
+    _HTTP2 = True
+
+# 批量处理时同一阶段的请求会一起发出，连接池要放得下
+_LLM_LIMITS = httpx.Limits(max_connections=200, max_keepalive_connections=100)
+
+# 预编译正则，避免每次调用都走 re 模块缓存查找
+_JSON_BLOB_RE = re.compile(r"\{.*\}", re.DOTALL)
+_VIDEO_MARK_RE = re.compile(r"\[需看视频画面:\s*([\d:]+-[\d:]+)\]\s*\(([^)]+)\)")
+
 
 @dataclass
 class Document:
@@ -22,7 +70,7 @@ class Document:
     metadata: Dict[str, Any] = field(default_factory=dict)
 
 
-@dataclass
+@dataclass(slots=True)
 class KnowledgePoint:
     """知识点"""
 
@@ -38,11 +86,23 @@ class ProgressTracker:
 
     def __init__(self, db_path: str = "knowledge.db"):
         self.db_path = db_path
+        # 整个生命周期复用一个连接，不再每次读写都重新打开；
+        # 允许跨线程使用（API 在线程池里调用），但同一时刻只应有一个线程操作
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        # WAL 模式下 NORMAL 不会损坏数据库，只省掉每次提交的 fsync
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute("PRAGMA temp_store=MEMORY")
         self._init_db()
 
+    def close(self):
+        """关闭数据库连接"""
+        self._conn.close()
+
     def _init_db(self):
-        conn = sqlite3.connect(self.db_path)
-        conn.executescript("""
+        # WAL 写入数据库文件，之后所有连接都生效；读写互不阻塞
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
             CREATE TABLE IF NOT EXISTS documents (
                 id INTEGER PRIMARY KEY,
                 path TEXT UNIQUE,
@@ -61,55 +121,76 @@ class ProgressTracker:
                 source_file TEXT,
                 FOREIGN KEY (doc_id) REFERENCES documents(id)
             );
+
+            CREATE INDEX IF NOT EXISTS idx_docs_status ON documents(status);
+            CREATE INDEX IF NOT EXISTS idx_docs_created ON documents(created_at DESC);
         """)
-        conn.commit()
-        conn.close()
+        self._conn.commit()
 
     def add_document(self, path: str) -> int:
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.execute(
-            "INSERT OR IGNORE INTO documents (path, status) VALUES (?, 'pending')",
-            (path,),
-        )
-        conn.commit()
-        doc_id = cursor.lastrowid or self._get_doc_id(path)
-        conn.close()
-        return doc_id
+        with self._conn:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO documents (path, status) VALUES (?, 'pending')",
+                (path,),
+            )
+        # 已存在时 INSERT 被忽略；长连接上的 lastrowid 是上一次插入的行，不能用
+        return cursor.lastrowid if cursor.rowcount else self._get_doc_id(path)
+
+    def add_documents(self, paths: List[str]):
+        """批量登记文档，一个事务一次提交"""
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO documents (path, status) VALUES (?, 'pending')",
+                [(path,) for path in paths],
+            )
 
     def _get_doc_id(self, path: str) -> int:
-        conn = sqlite3.connect(self.db_path)
-        row = conn.execute(
+        row = self._conn.execute(
             "SELECT id FROM documents WHERE path = ?", (path,)
         ).fetchone()
-        conn.close()
         return row[0] if row else 0
 
     def update_status(
         self, doc_id: int, status: str, stage: str = None, result: str = None
     ):
-        conn = sqlite3.connect(self.db_path)
-        conn.execute(
-            "UPDATE documents SET status = ?, stage = ?, result = ? WHERE id = ?",
-            (status, stage, result, doc_id),
-        )
-        conn.commit()
-        conn.close()
+        with self._conn:
+            self._conn.execute(
+                "UPDATE documents SET status = ?, stage = ?, result = ? WHERE id = ?",
+                (status, stage, result, doc_id),
+            )
+
+    def bulk_update_status(self, rows: List[Tuple[str, str, str, int]]):
+        """
+        批量更新状态，一个事务一次提交
+
+        rows 为 (status, stage, result, doc_id)；stage 为 None 时保留原阶段
+        """
+        with self._conn:
+            self._conn.executemany(
+                "UPDATE documents SET status = ?, stage = COALESCE(?, stage), result = ? WHERE id = ?",
+                rows,
+            )
 
     def save_knowledge_point(self, doc_id: int, point: KnowledgePoint):
-        conn = sqlite3.connect(self.db_path)
-        conn.execute(
-            """INSERT INTO knowledge_points (doc_id, title, content, video_markers, source_file)
-               VALUES (?, ?, ?, ?, ?)""",
-            (
-                doc_id,
-                point.title,
-                point.content,
-                json.dumps(point.video_markers, ensure_ascii=False),
-                point.source_file,
-            ),
-        )
-        conn.commit()
-        conn.close()
+        self.save_knowledge_points_batch(doc_id, [point])
+
+    def save_knowledge_points_batch(self, doc_id: int, points: List[KnowledgePoint]):
+        """一个文档的全部知识点，一个事务一次提交"""
+        with self._conn:
+            self._conn.executemany(
+                """INSERT INTO knowledge_points (doc_id, title, content, video_markers, source_file)
+                   VALUES (?, ?, ?, ?, ?)""",
+                [
+                    (
+                        doc_id,
+                        point.title,
+                        point.content,
+                        _json_dumps(point.video_markers),
+                        point.source_file,
+                    )
+                    for point in points
+                ],
+            )
 
 
 class TextCleaner:
@@ -127,34 +208,405 @@ class TextCleaner:
         (r"\n\s*\n\s*\n+", "\n\n"),  # 过多空行
     ]
 
+    # 类加载时预编译，并把逐条替换合并为尽量少的扫描：
+    # - 英文语气词依赖原文的空白做词边界，单独一遍
+    # - 中文语气词模式可匹配空串，实际效果是删掉全部空白、这几个语气字和逗号，
+    #   等价于一个字符类，一遍删完
+    # - 口头禅、开场白仍各一遍（前者删除后可能拼出后者，如 "好就是的"）；
+    #   此时文本已无空白，两者的 \s* 与逗号部分、空行与空格规整都成了空操作
+    # 这些模式都没有嵌套量词，在 stdlib re 上也是线性时间，不存在回溯爆炸；
+    # RE2 (google-re2) 在这里反而慢 4-20 倍（Python 绑定每次都要做 UTF-8 转换），
+    # 且其 \b 只认 ASCII，会改变中英混排文本的结果，故不采用
+    _EN_FILLER_RE = re.compile(NOISE_PATTERNS[0][0], re.IGNORECASE)
+    _DROP_RE = re.compile(r"[\s嗯啊哦哼唉哎,，]+")
+    _FILLER_RE = re.compile(r"对吧|那个|这个|就是|然后")
+    _OPENER_RE = re.compile(r"大家可以看到|我们来看一下|好的|那么")
+    # 去掉空白后若不含这些字/词，对应的几遍都是空操作
+    _DROP_CHARS = "嗯啊哦哼唉哎,，"
+    _PHRASES = (
+        "对吧",
+        "那个",
+        "这个",
+        "就是",
+        "然后",
+        "大家可以看到",
+        "我们来看一下",
+        "好的",
+        "那么",
+    )
+
     def clean(self, text: str) -> str:
         """清理文本 - 保留核心内容，仅去除语气词"""
-        # 先保存原始内容长度用于验证
-        original_length = len(text)
-
-        for pattern, replacement in self.NOISE_PATTERNS:
-            text = re.sub(pattern, replacement, text, flags=re.IGNORECASE)
-
-        # 清理多余空格，但保留换行结构
-        text = re.sub(r"[ \t]+", " ", text)  # 多个空格/制表符 -> 单个空格
-        text = re.sub(r" +\n", "\n", text)  # 行尾空格 -> 无
-        text = re.sub(r"\n +", "\n", text)  # 行首空格 -> 无
-
-        # 验证：如果内容被删除了超过50%，可能是过度清理
-        if len(text) < original_length * 0.3:
-            # 返回原始内容，仅做基本清理
-            text = re.sub(r"\s+", " ", text)
-
-        return text.strip()
+        return self.clean_lines((text,))
+
+    def clean_lines(self, lines: Iterable[str]) -> str:
+        """
+        分段清理，原文不必整体载入内存
+
+        lines 的每一项须以换行处为界（单行或多行块均可，例如打开的文件）。
+        英文语气词、空白、语气字和逗号都不会跨行，逐段删除；
+        口头禅和开场白可能在删除空白后跨行拼出，在拼接结果上再删
+        """
+        text = "".join(map(self._clean_line, lines))
+        # 快速路径：没有口头禅/开场白的文本到此为止（逐个子串查找，命中即停）
+        if not any(phrase in text for phrase in self._PHRASES):
+            return text
+        text = self._FILLER_RE.sub("", text)
+        text = self._OPENER_RE.sub("", text)
+
+        return text
+
+    def _clean_line(self, line: str) -> str:
+        line = self._EN_FILLER_RE.sub("", line)
+        # 空白反正要全部删除，str.split 比正则快得多
+        line = "".join(line.split())
+        if any(ch in line for ch in self._DROP_CHARS):
+            line = self._DROP_RE.sub("", line)
+        return line
 
 
 class LLMClient:
     """简单的 LLM 客户端 - 直接 httpx，无 LangChain"""
 
-    def __init__(self, api_key: str = None, base_url: str = None, model: str = None):
+    def __init__(
+        self,
+        api_key: str = None,
+        base_url: str = None,
+        model: str = None,
+        max_batch_chars: int = 3000,
+    ):
         self.api_key = api_key
         self.base_url = base_url or "https://api.moonshot.cn/v1"
         self.model = model or "moonshot-v1-8k"
+        # generate_many 合并请求中各提示的总字数上限：8k 上下文要同时容纳输入和输出
+        self.max_batch_chars = max_batch_chars
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """复用同一个 AsyncClient，保持 keep-alive，避免每次请求重新握手"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                timeout=120,
+                limits=_LLM_LIMITS,
+                http2=_HTTP2,  # 装了 h2 时多个请求复用同一条连接
+            )
+        return self._client
+
+    async def generate(self, prompt: str, temperature: float = 0.3) -> str:
+        """单次生成"""
+        response = await self._get_client().post(
+            "/chat/completions",
+            json={
+                "model": self.model,
+                "messages": [{"role": "user", "content": prompt}],
+                "temperature": temperature,
+            },
+        )
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+    async def stream_generate(
+        self, prompt: str, temperature: float = 0.3
+    ) -> AsyncIterator[str]:
+        """流式生成 - 逐段产出回复内容 (SSE)"""
+        async with self._get_client().stream(
+            "POST",
+            "/chat/completions",
+            json={
+                "model": self.model,
+                "messages": [{"role": "user", "content": prompt}],
+                "temperature": temperature,
+                "stream": True,
+            },
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                delta = _json_loads(data)["choices"][0]["delta"].get("content")
+                if delta:
+                    yield delta
+
+    async def generate_many(
+        self,
+        prompts: List[str],
+        temperature: float = 0.3,
+        acquire: Optional[Callable[[], Awaitable[None]]] = None,
+    ) -> List[str]:
+        """
+        批量生成 - 多个独立任务合并为尽量少的请求
+
+        按 max_batch_chars 把提示分成若干组（超限的提示单独请求），各组并发；
+        回复无法按任务拆分时，该组降级为逐个并发请求；请求本身失败时异常抛给调用方。
+        acquire 在每个实际发出的请求之前调用一次（供限速器取令牌）
+        """
+        groups = _split_by_budget([len(p) for p in prompts], self.max_batch_chars)
+        results = await asyncio.gather(
+            *(
+                self._generate_packed([prompts[i] for i in g], temperature, acquire)
+                for g in groups
+            )
+        )
+        return [r for group_results in results for r in group_results]
+
+    async def _generate_packed(
+        self, prompts: List[str], temperature: float, acquire=None
+    ) -> List[str]:
+        """一组提示合并为一次请求"""
+        if len(prompts) == 1:
+            return [
+                await _acquire_then(acquire, self.generate, prompts[0], temperature)
+            ]
+
+        tasks = "\n\n".join(
+            f"### 任务 {i}\n{prompt}" for i, prompt in enumerate(prompts, 1)
+        )
+        batch_prompt = f"""下面有 {len(prompts)} 个相互独立的任务，请分别完成。
+
+{tasks}
+
+按 JSON 数组输出，第 i 个元素是任务 i 的完整结果（字符串），数组长度必须为 {len(prompts)}。
+只输出 JSON 数组："""
+
+        result = await _acquire_then(acquire, self.generate, batch_prompt, temperature)
+        try:
+            answers = _json_loads(result[result.find("[") : result.rfind("]") + 1])
+        except ValueError:
+            answers = None
+        if isinstance(answers, list) and len(answers) == len(prompts):
+            return [a if isinstance(a, str) else _json_dumps(a) for a in answers]
+
+        # 回复格式不对或任务数不符，无法拆分：这一组改为逐个请求
+        return list(
+            await asyncio.gather(
+                *(
+                    _acquire_then(acquire, self.generate, p, temperature)
+                    for p in prompts
+                )
+            )
+        )
+
+    async def aclose(self):
+        """关闭连接池"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class CachingLLMClient:
+    """
+    按提示词缓存的 LLM 客户端包装
+
+    相同的 (模型, 温度, 提示词) 直接返回上次结果：先查内存 LRU，
+    再查 SQLite 落盘缓存，都未命中才调用内层客户端。失败不缓存。
+    stream_generate 命中时整段一次产出，流完整结束后缓存全文；
+    其余属性（aclose 等）透传给内层客户端。
+    """
+
+    def __init__(
+        self,
+        inner,
+        cache_path: Optional[str] = "llm_cache.sqlite",
+        max_size: int = 10_000,
+    ):
+        self.inner = inner
+        self.max_size = max_size
+        self._memory: "OrderedDict[bytes, str]" = OrderedDict()
+        # None 表示只用内存缓存
+        self._conn: Optional[sqlite3.Connection] = None
+        if cache_path:
+            self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache (key BLOB PRIMARY KEY, response TEXT)"
+            )
+            self._conn.commit()
+
+    def __getattr__(self, name):
+        if name == "stream_generate":
+            getattr(self.inner, name)  # 内层不支持流式时照常抛 AttributeError
+            return self._stream_generate
+        return getattr(self.inner, name)
+
+    def _key(self, prompt: str, temperature: float) -> bytes:
+        model = getattr(self.inner, "model", "")
+        return hashlib.blake2b(
+            f"{model}\0{temperature}\0{prompt}".encode("utf-8"), digest_size=16
+        ).digest()
+
+    def _lookup(self, key: bytes) -> Optional[str]:
+        result = self._memory.get(key)
+        if result is not None:
+            self._memory.move_to_end(key)
+            return result
+        if self._conn is not None:
+            row = self._conn.execute(
+                "SELECT response FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                self._remember(key, row[0])
+                return row[0]
+        return None
+
+    def _remember(self, key: bytes, result: str):
+        self._memory[key] = result
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def _store(self, items: List[Tuple[bytes, str]]):
+        for key, result in items:
+            self._remember(key, result)
+        if self._conn is not None:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO llm_cache (key, response) VALUES (?, ?)",
+                    items,
+                )
+
+    async def generate(self, prompt: str, temperature: float = 0.3) -> str:
+        key = self._key(prompt, temperature)
+        result = self._lookup(key)
+        if result is None:
+            result = await self.inner.generate(prompt, temperature)
+            self._store([(key, result)])
+        return result
+
+    async def _stream_generate(
+        self, prompt: str, temperature: float = 0.3
+    ) -> AsyncIterator[str]:
+        key = self._key(prompt, temperature)
+        result = self._lookup(key)
+        if result is not None:
+            yield result
+            return
+        chunks = []
+        async for chunk in self.inner.stream_generate(prompt, temperature):
+            chunks.append(chunk)
+            yield chunk
+        # 调用方中途停止读取时不会走到这里，不完整的回复不缓存
+        self._store([(key, "".join(chunks))])
+
+    async def generate_many(
+        self,
+        prompts: List[str],
+        temperature: float = 0.3,
+        acquire: Optional[Callable[[], Awaitable[None]]] = None,
+    ) -> List[str]:
+        """只把未命中缓存的提示词（去重后）交给内层客户端，命中的不发请求"""
+        keys = [self._key(p, temperature) for p in prompts]
+        found: Dict[bytes, str] = {}
+        # 未命中的 key -> 提示词，同一批内重复的提示词只请求一次
+        missing: Dict[bytes, str] = {}
+        for key, prompt in zip(keys, prompts):
+            if key in found or key in missing:
+                continue
+            result = self._lookup(key)
+            if result is None:
+                missing[key] = prompt
+            else:
+                found[key] = result
+        if missing:
+            todo = list(missing.values())
+            if hasattr(self.inner, "generate_many"):
+                kwargs = {"acquire": acquire} if acquire is not None else {}
+                fresh = await self.inner.generate_many(todo, temperature, **kwargs)
+            else:
+                fresh = await asyncio.gather(
+                    *(
+                        _acquire_then(acquire, self.inner.generate, p, temperature)
+                        for p in todo
+                    )
+                )
+            fresh_items = list(zip(missing, fresh))
+            self._store(fresh_items)
+            found.update(fresh_items)
+        return [found[key] for key in keys]
+
+    def close(self):
+        """关闭落盘缓存"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class AsyncRateLimiter:
+    """
+    异步令牌桶 - 按每分钟请求数 (QPM) 限速
+
+    桶容量为 burst，令牌按 qpm / 60 每秒匀速补充；acquire() 取走一个令牌，
+    桶空时等到下一个令牌补上为止。clock / sleep 可替换（测试用）
+    """
+
+    def __init__(
+        self,
+        qpm: float = 500,
+        burst: int = 50,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+    ):
+        self.rate = qpm / 60.0
+        self.burst = burst
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(burst)
+        self._updated = clock()
+
+    async def acquire(self):
+        while True:
+            now = self._clock()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await self._sleep((1 - self._tokens) / self.rate)
+
+
+class RateLimitedLLMClient:
+    """每个实际发出的请求先从限速器取令牌的 LLM 客户端包装，其余属性透传"""
+
+    def __init__(self, inner, limiter: AsyncRateLimiter):
+        self.inner = inner
+        self.limiter = limiter
+
+    def __getattr__(self, name):
+        if name == "stream_generate":
+            getattr(self.inner, name)  # 内层不支持流式时照常抛 AttributeError
+            return self._stream_generate
+        return getattr(self.inner, name)
+
+    async def generate(self, prompt: str, temperature: float = 0.3) -> str:
+        await self.limiter.acquire()
+        return await self.inner.generate(prompt, temperature)
+
+    async def _stream_generate(
+        self, prompt: str, temperature: float = 0.3
+    ) -> AsyncIterator[str]:
+        await self.limiter.acquire()
+        async for chunk in self.inner.stream_generate(prompt, temperature):
+            yield chunk
+
+    async def generate_many(
+        self, prompts: List[str], temperature: float = 0.3
+    ) -> List[str]:
+        if hasattr(self.inner, "generate_many"):
+            # 内层按预算拆成几个请求（拆不开时还会逐个重发），每个请求各取一个令牌；
+            # 内层的 generate_many 须接受 acquire 参数（LLMClient、CachingLLMClient）
+            return await self.inner.generate_many(
+                prompts, temperature, acquire=self.limiter.acquire
+            )
+        return list(
+            await asyncio.gather(*(self.generate(p, temperature) for p in prompts))
+        )
 
 
 class MockLLMClient:
@@ -201,25 +653,84 @@ class MockLLMClient:
             return "模拟生成的内容。"
 
 
+async def _acquire_then(acquire, generate, prompt: str, temperature: float) -> str:
+    """先取令牌（acquire 不为 None 时）再生成"""
+    if acquire is not None:
+        await acquire()
+    return await generate(prompt, temperature)
+
+
+def _iter_line_blocks(f, size: int = 65536) -> Iterator[str]:
+    """按约 size 个字符读取文件，每块截到最后一个换行处（逐行处理调用太多）"""
+    tail = ""
+    while chunk := f.read(size):
+        chunk = tail + chunk
+        cut = chunk.rfind("\n") + 1
+        if cut:
+            yield chunk[:cut]
+        tail = chunk[cut:]
+    if tail:
+        yield tail
+
+
+def _split_by_budget(sizes: List[int], budget: int) -> List[List[int]]:
+    """按原顺序把各项下标分组，每组总大小不超过 budget（单项超限时独占一组）"""
+    groups: List[List[int]] = []
+    total = 0
+    for i, size in enumerate(sizes):
+        if groups and total + size <= budget:
+            groups[-1].append(i)
+            total += size
+        else:
+            groups.append([i])
+            total = size
+    return groups
+
+
+def _discover_documents(dir_path: Path) -> List[Path]:
+    """
+    目录下待处理的字幕/文本文件，按名排序（阻塞调用，放到线程池中执行）
+
+    一次 scandir 同时筛两种后缀，不用两遍 glob
+    """
+    if not dir_path.is_dir():
+        return []
+
+    with os.scandir(dir_path) as it:
+        names = sorted(
+            e.name for e in it if e.name.endswith((".srt", ".txt")) and e.is_file()
+        )
+    return [dir_path / name for name in names]
+
+
 class WorkflowEngine:
     """工作流引擎 - 顺序执行 4 阶段"""
 
-    def __init__(self, llm_client: LLMClient, tracker: ProgressTracker):
+    # 各阶段提示中原文摘录的字数上限
+    NOISE_EXCERPT = 4000
+    STRUCTURE_EXCERPT = 3000
+    # 合并请求中每个任务的标题、分隔符等额外字数
+    _PACK_OVERHEAD = 20
+    # 合并时每个文档摘录的下限，再少就宁可拆成更多组
+    _MIN_BUNDLE_EXCERPT = 500
+
+    def __init__(
+        self, llm_client: LLMClient, tracker: ProgressTracker, max_concurrency: int = 4
+    ):
         self.llm = llm_client
         self.tracker = tracker
         self.cleaner = TextCleaner()
+        # 限制单个引擎同时在途的 LLM 请求数，避免触发服务端限流
+        self._semaphore = asyncio.Semaphore(max_concurrency)
 
     async def process_document(self, doc_path: Path) -> Document:
         """处理单个文档"""
         # 添加到追踪
         doc_id = self.tracker.add_document(str(doc_path))
 
-        # 读取文件
-        doc = Document(path=doc_path, content=doc_path.read_text(encoding="utf-8"))
-
-        # Stage 1: 清理
+        # Stage 1: 读取 + 清理
         self.tracker.update_status(doc_id, "processing", "cleaning")
-        doc.content = self.cleaner.clean(doc.content)
+        doc = Document(path=doc_path, content=await self._read_clean(doc_path))
 
         # Stage 2: 提炼干货 (LLM)
         self.tracker.update_status(doc_id, "processing", "noise_reduction")
@@ -235,28 +746,149 @@ class WorkflowEngine:
 
         # 保存结果
         self.tracker.update_status(doc_id, "done", "completed")
-        for point in doc.knowledge_points:
-            self.tracker.save_knowledge_point(doc_id, point)
+        self.tracker.save_knowledge_points_batch(doc_id, doc.knowledge_points)
 
         return doc
 
-    async def _stage_noise_reduction(self, doc: Document) -> Document:
-        """提炼干货"""
-        prompt = f"""删除以下讲座文本中的开场白、闲聊、重复强调等口水话，保留核心知识点：
+    async def process_documents(self, doc_paths: List[Path]) -> List[Document]:
+        """
+        批量处理一组文档
+
+        Stage 2/3 每个文档一个提示，同一阶段的提示合并成一次批量调用
+        （客户端支持 generate_many 时），减少请求往返；为了凑成一组，
+        各文档的摘录按客户端的 max_batch_chars 缩短。
+        单个文档失败只标记该文档 failed，其余文档照常处理并返回
+        """
+        doc_ids = [self.tracker.add_document(str(p)) for p in doc_paths]
+
+        # Stage 1: 读取 + 清理
+        self._set_stage(doc_ids, "cleaning")
+        contents = await asyncio.gather(
+            *(self._read_clean(p) for p in doc_paths), return_exceptions=True
+        )
+        ok = self._mark_failed(doc_ids, doc_paths, contents, "cleaning")
+        doc_ids = [doc_ids[i] for i in ok]
+        docs = [Document(path=doc_paths[i], content=contents[i]) for i in ok]
+
+        # Stage 2: 提炼干货 (LLM)
+        self._set_stage(doc_ids, "noise_reduction")
+        limit = self._bundle_excerpt(
+            self._noise_reduction_prompt, docs, self.NOISE_EXCERPT
+        )
+        results = await self._generate_many(
+            [self._noise_reduction_prompt(doc, limit) for doc in docs]
+        )
+        ok = self._mark_failed(
+            doc_ids, [doc.path for doc in docs], results, "noise_reduction"
+        )
+        doc_ids = [doc_ids[i] for i in ok]
+        docs = [docs[i] for i in ok]
+        for doc, i in zip(docs, ok):
+            doc.content = results[i]
 
-{doc.content[:4000]}
+        # Stage 3: 结构化 (LLM)
+        self._set_stage(doc_ids, "structuring")
+        limit = self._bundle_excerpt(
+            self._structure_prompt, docs, self.STRUCTURE_EXCERPT
+        )
+        results = await self._generate_many(
+            [self._structure_prompt(doc, limit) for doc in docs]
+        )
+        for doc, result in zip(docs, results):
+            try:
+                if isinstance(result, Exception):
+                    raise result
+                self._apply_structure(doc, result)
+            except Exception as e:
+                print(f"结构化失败: {e}")
+                self._structure_fallback(doc)
+
+        # Stage 4: 标记视频 (LLM)
+        self._set_stage(doc_ids, "video_marking")
+        for doc in docs:
+            await self._stage_video_mark(doc)
+
+        # 保存结果
+        for doc_id, doc in zip(doc_ids, docs):
+            self.tracker.save_knowledge_points_batch(doc_id, doc.knowledge_points)
+        self._set_stage(doc_ids, "completed", "done")
+
+        return docs
+
+    async def _read_clean(self, path: Path) -> str:
+        """在线程池中逐行读取并清理文件，不阻塞事件循环，也不整体载入原文"""
+
+        def _run() -> str:
+            with path.open("r", encoding="utf-8") as f:
+                return self.cleaner.clean_lines(_iter_line_blocks(f))
+
+        return await asyncio.to_thread(_run)
+
+    def _mark_failed(
+        self, doc_ids: List[int], paths: List[Path], results: List[Any], stage: str
+    ) -> List[int]:
+        """结果为异常的文档标记为 failed（一次提交），返回成功项的下标"""
+        ok = []
+        failed_rows = []
+        for i, (doc_id, path, result) in enumerate(zip(doc_ids, paths, results)):
+            if isinstance(result, Exception):
+                print(f"处理失败 {path}: {result}")
+                failed_rows.append(("failed", stage, str(result), doc_id))
+            else:
+                ok.append(i)
+        if failed_rows:
+            self.tracker.bulk_update_status(failed_rows)
+        return ok
+
+    def _set_stage(self, doc_ids: List[int], stage: str, status: str = "processing"):
+        """一批文档同时进入某阶段，状态更新合并为一次提交"""
+        self.tracker.bulk_update_status(
+            [(status, stage, None, doc_id) for doc_id in doc_ids]
+        )
+
+    async def _generate_many(self, prompts: List[str]) -> List[Any]:
+        """批量生成；客户端不支持时逐个并发，失败项以异常对象返回"""
+        if hasattr(self.llm, "generate_many"):
+            try:
+                return await self.llm.generate_many(prompts)
+            except Exception as e:
+                return [e] * len(prompts)
+
+        return await asyncio.gather(
+            *(self.llm.generate(p) for p in prompts), return_exceptions=True
+        )
+
+    def _bundle_excerpt(self, build_prompt, docs: List[Document], limit: int) -> int:
+        """
+        合并调用时每个文档的摘录字数
+
+        单个文档的完整提示已超过客户端的 max_batch_chars，不缩短就永远凑不成一组；
+        按文档数均分预算，但不低于 _MIN_BUNDLE_EXCERPT（放不下时由客户端拆成几组）
+        """
+        budget = getattr(self.llm, "max_batch_chars", None)
+        if budget is None or len(docs) < 2:
+            return limit
+        template = len(build_prompt(Document(path=Path()), 0))
+        share = budget // len(docs) - template - self._PACK_OVERHEAD
+        return min(limit, max(share, self._MIN_BUNDLE_EXCERPT))
+
+    def _noise_reduction_prompt(self, doc: Document, limit: int = NOISE_EXCERPT) -> str:
+        return f"""删除以下讲座文本中的开场白、闲聊、重复强调等口水话，保留核心知识点：
+
+{doc.content[:limit]}
 
 只输出清理后的干货内容，不要解释："""
 
-        doc.content = await self.llm.generate(prompt)
+    async def _stage_noise_reduction(self, doc: Document) -> Document:
+        """提炼干货"""
+        doc.content = await self.llm.generate(self._noise_reduction_prompt(doc))
         return doc
 
-    async def _stage_structure(self, doc: Document) -> Document:
-        """提取结构化知识"""
-        prompt = f"""分析以下讲座内容，提取结构化知识点。
+    def _structure_prompt(self, doc: Document, limit: int = STRUCTURE_EXCERPT) -> str:
+        return f"""分析以下讲座内容，提取结构化知识点。
 
 内容：
-{doc.content[:3000]}
+{doc.content[:limit]}
 
 按以下 JSON 格式输出：
 {{
@@ -270,35 +902,42 @@ class WorkflowEngine:
 
 只输出 JSON，不要其他内容："""
 
-        try:
-            result = await self.llm.generate(prompt)
-            # 提取 JSON
-            json_match = re.search(r"\{.*\}", result, re.DOTALL)
-            if json_match:
-                data = json.loads(json_match.group())
-                doc.knowledge_points = [
-                    KnowledgePoint(
-                        title=p["title"],
-                        content=p["content"],
-                        source_file=str(doc.path),
-                    )
-                    for p in data.get("points", [])
-                ]
-        except Exception as e:
-            print(f"结构化失败: {e}")
-            # 降级：单一点
+    def _apply_structure(self, doc: Document, result: str):
+        """从 LLM 返回中解析知识点"""
+        json_match = _JSON_BLOB_RE.search(result)
+        if json_match:
+            data = _json_loads(json_match.group())
+            source_file = str(doc.path)  # 只转换一次，各知识点共用同一字符串
             doc.knowledge_points = [
                 KnowledgePoint(
-                    title="内容", content=doc.content[:1000], source_file=str(doc.path)
+                    title=p["title"],
+                    content=p["content"],
+                    source_file=source_file,
                 )
+                for p in data.get("points", [])
             ]
 
+    def _structure_fallback(self, doc: Document):
+        """降级：单一点"""
+        doc.knowledge_points = [
+            KnowledgePoint(
+                title="内容", content=doc.content[:1000], source_file=str(doc.path)
+            )
+        ]
+
+    async def _stage_structure(self, doc: Document) -> Document:
+        """提取结构化知识"""
+        try:
+            result = await self.llm.generate(self._structure_prompt(doc))
+            self._apply_structure(doc, result)
+        except Exception as e:
+            print(f"结构化失败: {e}")
+            self._structure_fallback(doc)
+
         return doc
 
-    async def _stage_video_mark(self, doc: Document) -> Document:
-        """标记需看视频处"""
-        for point in doc.knowledge_points:
-            prompt = f"""分析以下知识点内容，判断是否需要配合视频画面才能理解：
+    def _video_mark_prompt(self, point: KnowledgePoint) -> str:
+        return f"""分析以下知识点内容，判断是否需要配合视频画面才能理解：
 
 知识点：{point.title}
 内容：{point.content}
@@ -311,39 +950,152 @@ class WorkflowEngine:
 
 输出修改后的内容（如无视频需求则输出原文）："""
 
-            try:
-                marked_content = await self.llm.generate(prompt)
-                point.content = marked_content
+    async def _limited_generate(self, prompt: str) -> str:
+        """受并发上限约束的单次生成"""
+        async with self._semaphore:
+            return await self.llm.generate(prompt)
 
-                # 解析视频标记
-                markers = re.findall(
-                    r"\[需看视频画面:\s*([\d:]+-[\d:]+)\]\s*\(([^)]+)\)", marked_content
-                )
-                point.video_markers = [
-                    {"time": m[0], "description": m[1]} for m in markers
-                ]
-            except Exception as e:
-                print(f"视频标记失败: {e}")
+    async def _stage_video_mark(self, doc: Document) -> Document:
+        """标记需看视频处 - 各知识点的请求并发发出"""
+        results = await asyncio.gather(
+            *(
+                self._limited_generate(self._video_mark_prompt(point))
+                for point in doc.knowledge_points
+            ),
+            return_exceptions=True,
+        )
+
+        for point, marked_content in zip(doc.knowledge_points, results):
+            if isinstance(marked_content, Exception):
+                print(f"视频标记失败: {marked_content}")
+                continue
+
+            point.content = marked_content
+
+            # 解析视频标记
+            point.video_markers = [
+                {"time": m.group(1), "description": m.group(2)}
+                for m in _VIDEO_MARK_RE.finditer(marked_content)
+            ]
 
         return doc
 
 
 class BatchProcessor:
-    """批量处理器 - asyncio 并行"""
-
-    def __init__(self, engine: WorkflowEngine, max_workers: int = 3):
-        self.engine = engine
+    """批量处理器 - asyncio 并行，并发数和每分钟请求数 (QPM) 双重限制"""
+
+    def __init__(
+        self,
+        engine: WorkflowEngine,
+        max_workers: int = 3,
+        qpm: float = 500,
+        burst: int = 50,
+    ):
+        # 同时处理的文档数上限（也限制了同时读入内存的文件数）
         self.semaphore = asyncio.Semaphore(max_workers)
+        # 限速只作用于本处理器：使用引擎的浅拷贝，不改动调用方传入的引擎
+        self.engine = copy.copy(engine)
+        if not isinstance(engine.llm, RateLimitedLLMClient):
+            self.engine.llm = RateLimitedLLMClient(
+                engine.llm, AsyncRateLimiter(qpm=qpm, burst=burst)
+            )
 
     async def process_directory(self, dir_path: Path) -> List[Document]:
         """处理目录下所有文档"""
-        # 发现文件
-        files = list(dir_path.glob("*.srt")) + list(dir_path.glob("*.txt"))
+        try:
+            # 发现文件
+            files = await asyncio.to_thread(_discover_documents, dir_path)
+
+            # 并行处理（LLM 请求另受 QPM 限速）；单个文档失败不影响其他文档
+            results = await asyncio.gather(
+                *(self._limited(self.engine.process_document, f) for f in files),
+                return_exceptions=True,
+            )
+
+            tracker = self.engine.tracker
+            failed_rows = []
+            for f, result in zip(files, results):
+                if isinstance(result, Exception):
+                    print(f"处理失败 {f}: {result}")
+                    # 失败时停留在出错的阶段
+                    failed_rows.append(
+                        ("failed", None, str(result), tracker.add_document(str(f)))
+                    )
+            if failed_rows:
+                tracker.bulk_update_status(failed_rows)
+
+            return [r for r in results if isinstance(r, Document)]
+        finally:
+            await self._close_llm()
+
+    async def process_directory_pipelined(self, dir_path: Path) -> List[Document]:
+        """
+        按阶段流水处理目录下所有文档
 
-        async def _process_one(file_path: Path):
-            async with self.semaphore:
-                return await self.engine.process_document(file_path)
+        不再每个文档各自串行走完 4 个阶段，而是所有文档一起进入下一阶段，
+        同一阶段的请求并发发出（受 max_workers 与 QPM 限制）
+        """
+        try:
+            files = await asyncio.to_thread(_discover_documents, dir_path)
+            tracker = self.engine.tracker
+
+            # Stage 1: 读取 + 清理（线程池并发）- 读不了的文件标记 failed，不影响其他文件
+            doc_ids = [tracker.add_document(str(f)) for f in files]
+            self.engine._set_stage(doc_ids, "cleaning")
+            contents = await asyncio.gather(
+                *(self._limited(self.engine._read_clean, f) for f in files),
+                return_exceptions=True,
+            )
+            ok = self.engine._mark_failed(doc_ids, files, contents, "cleaning")
+            doc_ids = [doc_ids[i] for i in ok]
+            docs = [Document(path=files[i], content=contents[i]) for i in ok]
+            self.engine._set_stage(doc_ids, "noise_reduction")
+
+            # Stage 2: 提炼干货 (LLM) - 失败的文档不进入后续阶段
+            results = await self._run_stage(self.engine._stage_noise_reduction, docs)
+            alive = []
+            status_rows = []
+            for doc_id, doc, result in zip(doc_ids, docs, results):
+                if isinstance(result, Exception):
+                    print(f"处理失败 {doc.path}: {result}")
+                    status_rows.append(
+                        ("failed", "noise_reduction", str(result), doc_id)
+                    )
+                else:
+                    status_rows.append(("processing", "structuring", None, doc_id))
+                    alive.append((doc_id, doc))
+            tracker.bulk_update_status(status_rows)
+
+            # Stage 3: 结构化 (LLM)，失败时内部已降级
+            await self._run_stage(self.engine._stage_structure, [d for _, d in alive])
+            alive_ids = [doc_id for doc_id, _ in alive]
+            self.engine._set_stage(alive_ids, "video_marking")
+
+            # Stage 4: 标记视频 (LLM)，失败时内部已降级
+            await self._run_stage(self.engine._stage_video_mark, [d for _, d in alive])
+
+            # 保存结果
+            for doc_id, doc in alive:
+                tracker.save_knowledge_points_batch(doc_id, doc.knowledge_points)
+            self.engine._set_stage(alive_ids, "completed", "done")
+
+            return [doc for _, doc in alive]
+        finally:
+            await self._close_llm()
+
+    async def _close_llm(self):
+        """一批处理结束后关闭 LLM 客户端的连接池（下次请求时会重新建立）"""
+        aclose = getattr(self.engine.llm, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+    async def _run_stage(self, stage, docs: List[Document]) -> List[Any]:
+        """对一批文档并发执行同一阶段，异常以对象形式返回"""
+        return await asyncio.gather(
+            *(self._limited(stage, doc) for doc in docs), return_exceptions=True
+        )
 
-        # 并行处理
-        tasks = [_process_one(f) for f in files]
-        return await asyncio.gather(*tasks)
+    async def _limited(self, fn, arg):
+        """受 max_workers 约束地执行单个文档的处理"""
+        async with self.semaphore:
+            return await fn(arg)
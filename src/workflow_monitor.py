@@ -4,10 +4,62 @@ Workflow Monitor - 监控 OpenCode 工作流执行
 """
 
 import re
+import time
 from dataclasses import dataclass
 from typing import List
 from datetime import datetime
 
+_QUANTIFIERS = ("?", "*", "{")
+
+
+def _split_alternatives(pattern: str) -> List[str]:
+    """按顶层的 | 拆分正则（跳过转义字符、字符类和分组内部）"""
+    alts, depth, start, i = [], 0, 0, 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            i += 1
+        elif c == "[":
+            i = pattern.index("]", i + 2)
+        elif c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+        elif c == "|" and depth == 0:
+            alts.append(pattern[start:i])
+            start = i + 1
+        i += 1
+    alts.append(pattern[start:])
+    return alts
+
+
+def _first_chars(pattern: str) -> str:
+    """
+    正则匹配时可能的首字符（小写）
+
+    只识别以字面量或 (分支|分支) 开头的写法；遇到其他开头无法确定时返回空串
+    """
+    chars = set()
+    for alt in _split_alternatives(pattern):
+        if alt[:1] == "(":
+            depth, end = 0, 0
+            for end, c in enumerate(alt):
+                depth += (c == "(") - (c == ")")
+                if depth == 0:
+                    break
+            inner = alt[1:end]
+            if inner.startswith("?:"):
+                inner = inner[2:]
+            sub = _first_chars(inner)
+            if not sub or alt[end + 1 : end + 2] in _QUANTIFIERS:
+                return ""
+            chars.update(sub)
+        elif alt[:1].isalnum() and alt[1:2] not in _QUANTIFIERS:
+            chars.add(alt[0].lower())
+        else:
+            return ""
+    return "".join(sorted(chars))
+
 
 @dataclass
 class WorkflowEvent:
@@ -53,61 +105,100 @@ class WorkflowMonitor:
         r"资源.*不足|resource.*exhausted",
     ]
 
+    # 每类模式合成一个预编译交替式，每行每类只搜索一遍
+    _UNAUTH_RE = re.compile(
+        "|".join(f"(?:{p})" for p in UNAUTHORIZED_PATTERNS), re.IGNORECASE
+    )
+    _FAIL_RE = re.compile("|".join(f"(?:{p})" for p in FAILURE_PATTERNS), re.IGNORECASE)
+    _WARN_RE = re.compile(r"warn", re.IGNORECASE)
+    # 以上所有模式可能的首字符，由模式推导；推导不出时为空串，不做前瞻
+    _EVENT_FIRST_CHARS = _first_chars(
+        "|".join(UNAUTHORIZED_PATTERNS + FAILURE_PATTERNS + ["warn"])
+    )
+    # 三类合一，在整段日志上扫描，只取出可能产生事件的行再逐行分类，
+    # 无需先 split 出全部行（各模式的 .* 不跨越换行，与逐行搜索一致）；
+    # 首字符前瞻让绝大多数位置不必逐个尝试全部分支
+    _EVENT_RE = re.compile(
+        (f"(?=[{_EVENT_FIRST_CHARS}])" if _EVENT_FIRST_CHARS else "")
+        + "(?:"
+        + "|".join(f"(?:{p})" for p in UNAUTHORIZED_PATTERNS + FAILURE_PATTERNS)
+        + "|warn)",
+        re.IGNORECASE,
+    )
+
     def __init__(self, log_file: str = "workflow.log"):
         self.log_file = log_file
         self.events: List[WorkflowEvent] = []
         self.critical_count = 0
         self.error_count = 0
         self.warning_count = 0
+        # 实时监控时按秒缓存时间戳字符串，同一秒内的事件共用
+        self._ts_sec = -1
+        self._ts_str = ""
 
     def analyze_log(self, log_content: str) -> WorkflowReport:
         """分析工作流日志"""
-        lines = log_content.split("\n")
-
-        for line in lines:
-            self._analyze_line(line)
+        # 整段日志视为同一时刻，时间戳只格式化一次
+        timestamp = datetime.now().isoformat()
+        pos = 0
+        while m := self._EVENT_RE.search(log_content, pos):
+            start = log_content.rfind("\n", 0, m.start()) + 1
+            end = log_content.find("\n", m.end())
+            if end == -1:
+                end = len(log_content)
+            self._analyze_line(log_content[start:end], timestamp)
+            pos = end + 1
 
         return self._generate_report()
 
-    def _analyze_line(self, line: str):
+    def _timestamp(self) -> str:
+        """当前时间戳（精确到秒，同一秒内不重复格式化）"""
+        sec = int(time.time())
+        if sec != self._ts_sec:
+            self._ts_sec = sec
+            self._ts_str = datetime.fromtimestamp(sec).isoformat()
+        return self._ts_str
+
+    def _analyze_line(self, line: str, timestamp: str = None):
         """分析单行日志"""
+        if timestamp is None:
+            timestamp = self._timestamp()
+
         # 检测越权行为
-        for pattern in self.UNAUTHORIZED_PATTERNS:
-            if re.search(pattern, line, re.IGNORECASE):
-                self.events.append(
-                    WorkflowEvent(
-                        timestamp=datetime.now().isoformat(),
-                        level="CRITICAL",
-                        agent="unknown",
-                        action="unauthorized_access",
-                        details=f"检测到越权行为: {line[:100]}",
-                        should_stop=True,
-                    )
+        if self._UNAUTH_RE.search(line):
+            self.events.append(
+                WorkflowEvent(
+                    timestamp=timestamp,
+                    level="CRITICAL",
+                    agent="unknown",
+                    action="unauthorized_access",
+                    details=f"检测到越权行为: {line[:100]}",
+                    should_stop=True,
                 )
-                self.critical_count += 1
-                return
+            )
+            self.critical_count += 1
+            return
 
         # 检测失败
-        for pattern in self.FAILURE_PATTERNS:
-            if re.search(pattern, line, re.IGNORECASE):
-                self.events.append(
-                    WorkflowEvent(
-                        timestamp=datetime.now().isoformat(),
-                        level="ERROR",
-                        agent="unknown",
-                        action="execution_failure",
-                        details=f"执行失败: {line[:100]}",
-                        should_stop=False,
-                    )
+        if self._FAIL_RE.search(line):
+            self.events.append(
+                WorkflowEvent(
+                    timestamp=timestamp,
+                    level="ERROR",
+                    agent="unknown",
+                    action="execution_failure",
+                    details=f"执行失败: {line[:100]}",
+                    should_stop=False,
                 )
-                self.error_count += 1
-                return
+            )
+            self.error_count += 1
+            return
 
-        # 检测警告
-        if "warning" in line.lower() or "warn" in line.lower():
+        # 检测警告（"warn" 已覆盖 "warning"）
+        if self._WARN_RE.search(line):
             self.events.append(
                 WorkflowEvent(
-                    timestamp=datetime.now().isoformat(),
+                    timestamp=timestamp,
                     level="WARNING",
                     agent="unknown",
                     action="potential_issue",
@@ -4,18 +4,33 @@ BDD Test Runner - 执行 Gherkin 场景验证
 """
 
 import asyncio
+import json
 from pathlib import Path
 
+import httpx
+
 # 导入被测组件
 import sys
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from src.workflow import KnowledgePoint, MockLLMClient, WorkflowEngine, ProgressTracker
+from src.workflow import (
+    AsyncRateLimiter,
+    BatchProcessor,
+    CachingLLMClient,
+    KnowledgePoint,
+    LLMClient,
+    MockLLMClient,
+    RateLimitedLLMClient,
+    WorkflowEngine,
+    ProgressTracker,
+)
 from src.srt_parser import SRTParser
 from src.clustering import CrossDocumentClusteringSkill
 from src.fusion import KnowledgeFusionSkill
 from src.export import TextbookExporter
+from src.workflow_monitor import WorkflowMonitor
+from src.llm_client import AsyncLLMClient, LLMClient as SyncLLMClient, LLMConfig
 
 
 class BDDTestRunner:
@@ -34,14 +49,30 @@ class BDDTestRunner:
 
         # Stage 1: Document Processing
         self.test_single_srt_processing()
+        self.test_srt_timestamps_and_malformed_entries()
+        self.test_gui_srt_parsing()
         self.test_noise_cleaning()
+        self.test_cleaner_matches_original()
         self.test_knowledge_extraction()
+        self.test_progress_tracking()
         self.test_video_marking()
+        self.test_async_llm_clients()
+        self.test_gui_extract_cache()
 
         # Stage 2: Cross-Document Processing
         self.test_parallel_processing()
+        self.test_bundled_extraction()
+        self.test_pipelined_processing()
+        self.test_llm_response_cache()
+        self.test_rate_limiting()
         self.test_duplicate_merging()
+        self.test_transitive_duplicate_grouping()
+        self.test_similar_pairs_across_lsh_boundary()
+        self.test_similarity_cache_threshold()
         self.test_course_structure()
+        self.test_fused_topic_merging()
+        self.test_topic_batch_retry()
+        self.test_json_salvage()
 
         # Stage 3: Export
         self.test_markdown_export()
@@ -50,6 +81,8 @@ class BDDTestRunner:
         # Error Handling
         self.test_empty_directory()
         self.test_corrupted_file()
+        self.test_log_monitoring()
+        self.test_status_stream()
 
         # Summary
         self.print_summary()
@@ -87,6 +120,99 @@ A derivative measures the rate of change"""
         finally:
             test_file.unlink(missing_ok=True)
 
+    def test_srt_timestamps_and_malformed_entries(self):
+        """场景: Parse timestamps to seconds and skip malformed entries"""
+        print("\n⏱️  Scenario: Parse timestamps to seconds and skip malformed entries")
+
+        # Given: 正常条目之间夹着错误序号、错误时间轴、缺正文的条目
+        content = (
+            "1\n00:05:30,000 --> 00:05:32,500\nFirst line\nsecond line\n\n"
+            "x\n00:05:33,000 --> 00:05:34,000\nbad index\n\n"
+            "3\n00:05:35 --> 00:05:36\nbad timestamp\n\n"
+            "4\n00:05:37,000 --> 00:05:38,000\n\n"
+            "5\n01:02:03,004 --> 01:02:04,000\nLast"
+        )
+        test_file = Path("/tmp/test_malformed.srt")
+        test_file.write_bytes(content.replace("\n", "\r\n").encode("utf-8"))
+
+        try:
+            # When: 解析字符串和 CRLF 文件
+            entries = SRTParser.parse(content)
+            from_file = SRTParser.parse_file(test_file)
+
+            # Then: 只保留完整条目，多行文本合并，秒数已换算
+            assert [(e.index, e.text) for e in entries] == [
+                (1, "First line second line"),
+                (5, "Last"),
+            ], f"Entries: {entries}"
+            assert (entries[0].start_s, entries[0].end_s) == (330.0, 332.5)
+            assert (entries[1].start_s, entries[1].end_s) == (3723.004, 3724.0)
+            assert from_file == entries, f"From file: {from_file}"
+
+            self.passed += 1
+            print("  ✅ PASSED")
+
+        except Exception as e:
+            self.failed += 1
+            print(f"  ❌ FAILED: {e}")
+        finally:
+            test_file.unlink(missing_ok=True)
+
+    def test_gui_srt_parsing(self):
+        """场景: Parse subtitles in the desktop GUI"""
+        print("\n🖥️  Scenario: Parse subtitles in the desktop GUI")
+
+        from main import MainWindow, SRTParser as GuiSRTParser
+
+        # Given: 只含空格的分隔行、错误序号、缺时间轴、缺正文混在一起
+        content = (
+            "1\n00:00:01,000 --> 00:00:02,000\nHello\n   \n"
+            "2\n00:00:02,000 --> 00:00:03,000\nWorld\nagain\n\n\n\n"
+            "x\n00:00:03,000 --> 00:00:04,000\nbad seq\n\n"
+            "4\nno timestamp\ntext\n\n"
+            "5\n00:00:05,000 --> 00:00:06,000\n"
+        )
+        test_file = Path("/tmp/test_gui.srt")
+        test_file.write_text(content)
+
+        try:
+            # When: 旧 parse（按 "\n\n" 切块）与新 parse、iter_file 分别解析
+            old = [
+                e
+                for block in content.split("\n\n")
+                if (e := GuiSRTParser._parse_block(block.strip("\n").split("\n")))
+            ]
+            new = GuiSRTParser.parse(content)
+            with open(test_file, encoding="utf-8") as f:
+                streamed = list(GuiSRTParser.iter_file(f))
+
+            # Then: 旧实现把空白行后的条目并进了上一条，新实现与 iter_file 一致
+            assert [e.text for e in old] == [
+                "Hello     2 00:00:02,000 --> 00:00:03,000 World again"
+            ], f"Old: {old}"
+            assert new == streamed, f"parse {new} != iter_file {streamed}"
+            assert [(e.seq, e.text) for e in new] == [
+                (1, "Hello"),
+                (2, "World again"),
+            ], f"Entries: {new}"
+            assert GuiSRTParser.parse(content.replace("\n", "\r\n")) == new
+
+            # And: 预览被截断时，字符数仍按全文统计
+            lines = [f"[{e.start}] {e.text}" for e in new]
+            window = type("W", (), {"PREVIEW_CHARS": 10})()
+            preview, total = MainWindow._preview_text(window, iter(lines))
+            assert preview == "\n".join(lines)[:10], f"Preview: {preview!r}"
+            assert total == len("\n".join(lines)), f"Total: {total}"
+
+            self.passed += 1
+            print("  ✅ PASSED")
+
+        except Exception as e:
+            self.failed += 1
+            print(f"  ❌ FAILED: {e}")
+        finally:
+            test_file.unlink(missing_ok=True)
+
     def test_noise_cleaning(self):
         """场景: Clean noise from lecture content"""
         print("\n🧹 Scenario: Clean noise from lecture content")
@@ -117,6 +243,59 @@ Right? Let's see..."""
             self.failed += 1
             print(f"  ❌ FAILED: {e}")
 
+    def test_cleaner_matches_original(self):
+        """场景: Clean text exactly like the original pattern-by-pattern cleaner"""
+        print("\n🧽 Scenario: Clean text exactly like the original cleaner")
+
+        import io
+        import re
+        from src.workflow import TextCleaner, _iter_line_blocks
+
+        def original_clean(text):
+            # 逐条应用 NOISE_PATTERNS 的原始实现，作为对照
+            original_length = len(text)
+            for pattern, replacement in TextCleaner.NOISE_PATTERNS:
+                text = re.sub(pattern, replacement, text, flags=re.IGNORECASE)
+            text = re.sub(r"[ \t]+", " ", text)
+            text = re.sub(r" +\n", "\n", text)
+            text = re.sub(r"\n +", "\n", text)
+            if len(text) < original_length * 0.3:
+                text = re.sub(r"\s+", " ", text)
+            return text.strip()
+
+        # Given: 语气词、跨行开场白、删口头禅后拼出的开场白、CRLF、无噪音文本
+        samples = [
+            "Um, so the derivative, uh, is\nlike the slope 对吧，嗯 这个 就是 斜率",
+            "大家可以\n看到 导数的定义\n我们来看\n一下 极限",
+            "好就是的，然后那\n么 链式法则",
+            "um derivative\r\n\r\n\r\n那么 slope\r\nOK, right.\r\n",
+            "Plain text without any filler words\nsecond line",
+        ]
+        cleaner = TextCleaner()
+
+        try:
+            for text in samples:
+                expected = original_clean(text)
+                # When: 整段清理、逐行清理，以及按各种块大小读取后清理
+                assert cleaner.clean(text) == expected, f"clean({text!r})"
+                lines = text.splitlines(keepends=True)
+                assert cleaner.clean_lines(lines) == expected, f"lines {text!r}"
+                for size in range(1, 12):
+                    f = io.StringIO(text, newline=None)
+                    blocks = list(_iter_line_blocks(f, size))
+                    # Then: 每块都在换行处结束，拼起来就是原文，清理结果与原实现一致
+                    assert all(b.endswith("\n") for b in blocks[:-1]), blocks
+                    assert "".join(blocks) == text.replace("\r\n", "\n")
+                    got = cleaner.clean_lines(blocks)
+                    assert got == original_clean("".join(blocks)), f"size {size}"
+
+            self.passed += 1
+            print("  ✅ PASSED")
+
+        except Exception as e:
+            self.failed += 1
+            print(f"  ❌ FAILED: {e}")
+
     def test_knowledge_extraction(self):
         """场景: Extract structured knowledge points"""
         print("\n📚 Scenario: Extract structured knowledge points")
@@ -154,6 +333,71 @@ Today we will learn about derivatives""")
 
         asyncio.run(run_test())
 
+    def test_progress_tracking(self):
+        """场景: Track document progress in SQLite"""
+        print("\n🗃️  Scenario: Track document progress in SQLite")
+
+        db = Path("/tmp/test_tracker.db")
+        tracker = ProgressTracker(str(db))
+
+        try:
+            # Given: 登记两个文档
+            first = tracker.add_document("/videos/a.srt")
+            second = tracker.add_document("/videos/b.srt")
+
+            # When: 重复登记第一个（上一次插入的是第二个）
+            again = tracker.add_document("/videos/a.srt")
+
+            # Then: 返回原来的 id，而不是上一次插入的行
+            assert first != second, f"Ids: {first}, {second}"
+            assert again == first, f"Re-add returned {again}, expected {first}"
+
+            # When: 一次保存一个文档的多个知识点
+            tracker.save_knowledge_points_batch(
+                first,
+                [
+                    KnowledgePoint("Limit", "Approaching values", [], "a.srt"),
+                    KnowledgePoint(
+                        "Derivative", "Rate of change", [{"time": "05:30"}], "a.srt"
+                    ),
+                ],
+            )
+            rows = tracker._conn.execute(
+                "SELECT doc_id, title, video_markers FROM knowledge_points ORDER BY id"
+            ).fetchall()
+
+            # Then: 全部写入，视频标记按 JSON 存储
+            assert [r[:2] for r in rows] == [(first, "Limit"), (first, "Derivative")]
+            assert json.loads(rows[1][2]) == [{"time": "05:30"}], rows[1][2]
+
+            # When: 批量更新状态，其中一行不带阶段
+            tracker.update_status(first, "processing", "extracting")
+            tracker.update_status(second, "processing", "cleaning")
+            tracker.bulk_update_status(
+                [("failed", None, "boom", first), ("done", "completed", None, second)]
+            )
+            status = dict(
+                (r[0], r[1:])
+                for r in tracker._conn.execute(
+                    "SELECT id, status, stage, result FROM documents"
+                )
+            )
+
+            # Then: 不带阶段的行保留原阶段，其余按给定值更新
+            assert status[first] == ("failed", "extracting", "boom"), status[first]
+            assert status[second] == ("done", "completed", None), status[second]
+
+            self.passed += 1
+            print("  ✅ PASSED")
+
+        except Exception as e:
+            self.failed += 1
+            print(f"  ❌ FAILED: {e}")
+        finally:
+            tracker.close()
+            for suffix in ("", "-wal", "-shm"):
+                Path(f"{db}{suffix}").unlink(missing_ok=True)
+
     def test_video_marking(self):
         """场景: Mark video references"""
         print("\n🎬 Scenario: Mark video references")
@@ -171,6 +415,167 @@ Today we will learn about derivatives""")
             self.failed += 1
             print("  ❌ FAILED: Video reference not detected")
 
+    def test_async_llm_clients(self):
+        """场景: Extract knowledge with the async LLM clients"""
+        print("\n🌐 Scenario: Extract knowledge with the async LLM clients")
+
+        knowledge = {
+            "topic": "导数",
+            "concepts": ["变化率"],
+            "key_points": [],
+            "summary": "",
+        }
+        body = json.dumps(knowledge, ensure_ascii=False)
+        paths = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            paths.append(request.url.path)
+            if request.url.path == "/api/generate":
+                # Ollama: NDJSON，JSON 分两段到达
+                lines = [
+                    json.dumps({"response": body[:5], "done": False}),
+                    json.dumps({"response": body[5:], "done": True}),
+                ]
+                return httpx.Response(200, text="\n".join(lines))
+            if request.headers.get("Authorization") != "Bearer key":
+                return httpx.Response(401)
+            # OpenAI 兼容: SSE
+            events = [
+                "data: " + json.dumps({"choices": [{"delta": {"content": part}}]})
+                for part in (body[:5], body[5:])
+            ]
+            return httpx.Response(200, text="\n\n".join(events + ["data: [DONE]"]))
+
+        def mock_transport(client):
+            client._client = httpx.AsyncClient(
+                base_url=client.base_url,
+                headers=client._headers,
+                transport=httpx.MockTransport(handler),
+            )
+            return client
+
+        async def run_test():
+            # Given: 异步客户端（与同步客户端是兄弟类，不是子类）
+            api = mock_transport(
+                LLMConfig.create_client("kimi", api_key="key", use_async=True)
+            )
+            ollama = mock_transport(LLMConfig.create_client("ollama", use_async=True))
+            bad = mock_transport(
+                LLMConfig.create_client("kimi", api_key="wrong", use_async=True)
+            )
+
+            try:
+                assert isinstance(api, AsyncLLMClient), type(api)
+                assert not isinstance(
+                    api, SyncLLMClient
+                ), "Async client is a sync subclass"
+
+                # When: 并发提取
+                results = await asyncio.gather(
+                    api.extract_knowledge("讲座"),
+                    api.extract_knowledge("讲座"),
+                    ollama.extract_knowledge("讲座"),
+                    bad.extract_knowledge("讲座"),
+                )
+
+                # Then: 流式回复拼出完整 JSON，失败返回空结构
+                assert results[:3] == [knowledge] * 3, results
+                assert results[3]["topic"].startswith("API 错误"), results[3]
+                assert paths.count("/v1/chat/completions") == 3, paths
+                assert paths.count("/api/generate") == 1, paths
+
+                self.passed += 1
+                print("  ✅ PASSED")
+
+            except Exception as e:
+                self.failed += 1
+                print(f"  ❌ FAILED: {e}")
+            finally:
+                for client in (api, ollama, bad):
+                    await client.aclose()
+
+        asyncio.run(run_test())
+
+    def test_gui_extract_cache(self):
+        """场景: Reuse extraction results in the desktop GUI"""
+        print("\n💾 Scenario: Reuse extraction results in the desktop GUI")
+
+        import threading
+        import time
+        from collections import OrderedDict
+        from main import MainWindow
+
+        class CountingClient:
+            def __init__(self):
+                self.calls = []
+
+            async def extract_knowledge(self, text):
+                self.calls.append(text)
+                if text == "empty":
+                    return {"topic": "", "concepts": [], "key_points": []}
+                return {"topic": text, "concepts": [{"name": text}], "key_points": []}
+
+        class Root:
+            def after(self, ms, func, *args):
+                time.sleep(ms / 1000)
+                func(*args)
+
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, daemon=True).start()
+
+        # Given: 不创建 Tk 窗口，只装配提取流程用到的属性，缓存上限 2 条
+        window = MainWindow.__new__(MainWindow)
+        window.EXTRACT_CACHE_SIZE = 2
+        window._extract_cache = OrderedDict()
+        window._extract_future = None
+        window._loop = loop
+        window.root = Root()
+        window.status = type("Label", (), {"config": lambda self, text: None})()
+        window.current_file = "lecture.srt"
+        window.llm_client = client = CountingClient()
+        shown = []
+        window._show_result = shown.append
+        source = {"text": ""}
+        window._widget_text = lambda widget: source["text"]
+        window.source_text = None
+
+        def extract(text):
+            source["text"] = text
+            window._extract()
+            if window._extract_future is not None:
+                window._extract_future.result(timeout=5)
+
+        try:
+            # When: 同一内容提取两次，空结果提取两次，再让缓存超出上限
+            extract("limits")
+            extract("limits")
+            extract("empty")
+            extract("empty")
+            extract("series")
+            extract("vectors")
+            extract("limits")
+
+            # Then: 命中缓存不再请求 LLM，空结果不缓存，最久未用的条目被淘汰
+            assert client.calls == [
+                "limits",
+                "empty",
+                "empty",
+                "series",
+                "vectors",
+                "limits",
+            ], f"Calls: {client.calls}"
+            assert shown[1] is shown[0], "Cached result not reused"
+            assert len(window._extract_cache) == 2, len(window._extract_cache)
+
+            self.passed += 1
+            print("  ✅ PASSED")
+
+        except Exception as e:
+            self.failed += 1
+            print(f"  ❌ FAILED: {e}")
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+
     def test_parallel_processing(self):
         """场景: Process multiple documents in parallel"""
         print("\n⚡ Scenario: Process multiple documents in parallel")
@@ -202,6 +607,266 @@ Lecture {i} content""")
 
             shutil.rmtree(test_dir, ignore_errors=True)
 
+    def test_bundled_extraction(self):
+        """场景: Bundle several documents into one request per stage"""
+        print("\n📦 Scenario: Bundle several documents into one request per stage")
+
+        class PackingLLM(LLMClient):
+            """只记录请求、不联网的 LLMClient，合并请求按任务数回复 JSON 数组"""
+
+            def __init__(self):
+                super().__init__(api_key="test")
+                self.prompts = []
+
+            async def generate(self, prompt: str, temperature: float = 0.3) -> str:
+                self.prompts.append(prompt)
+                if "个相互独立的任务" not in prompt:
+                    return prompt  # 视频标记：原样返回
+                n = int(prompt.split("下面有 ", 1)[1].split(" ", 1)[0])
+                if "提取结构化知识点" in prompt:
+                    answer = '{"points": [{"title": "导数", "content": "变化率"}]}'
+                else:
+                    answer = "清理后的内容"
+                return json.dumps([answer] * n, ensure_ascii=False)
+
+        async def run_test():
+            # Given: 两个单独即超出合并预算的长文档
+            llm = PackingLLM()
+            tracker = ProgressTracker("/tmp/test_bundle.db")
+            engine = WorkflowEngine(llm, tracker)
+            files = [Path(f"/tmp/test_bundle_{i}.txt") for i in range(2)]
+            for f in files:
+                f.write_text("导数描述函数的变化率" * 400, encoding="utf-8")
+
+            try:
+                # When: 合并处理
+                docs = await engine.process_documents(files)
+
+                # Then: 降噪、结构化各只发一次合并请求
+                packed = [p for p in llm.prompts if "个相互独立的任务" in p]
+                assert len(packed) == 2, f"Packed requests: {len(packed)}"
+                assert all(len(p) <= 3200 for p in packed), "Packed prompt too long"
+                assert len(llm.prompts) == 2 + len(
+                    docs
+                ), f"Requests: {len(llm.prompts)}"
+                assert [d.knowledge_points[0].title for d in docs] == ["导数", "导数"]
+
+                self.passed += 1
+                print("  ✅ PASSED")
+
+            except Exception as e:
+                self.failed += 1
+                print(f"  ❌ FAILED: {e}")
+            finally:
+                tracker.close()
+                for f in files:
+                    f.unlink(missing_ok=True)
+                Path("/tmp/test_bundle.db").unlink(missing_ok=True)
+
+        asyncio.run(run_test())
+
+    def test_pipelined_processing(self):
+        """场景: Process a directory stage by stage"""
+        print("\n🚰 Scenario: Process a directory stage by stage")
+
+        async def run_test():
+            # Given: 两个正常文件和一个无法按 UTF-8 解码的文件
+            test_dir = Path("/tmp/test_pipelined")
+            test_dir.mkdir(exist_ok=True)
+            for name in ("a.srt", "b.srt"):
+                (test_dir / name).write_text(
+                    "1\n00:00:01,000 --> 00:00:05,000\n导数的定义\n", encoding="utf-8"
+                )
+            (test_dir / "c.srt").write_bytes(b"\xff\xfe\xfa")
+            db = "/tmp/test_pipelined.db"
+            tracker = ProgressTracker(db)
+            processor = BatchProcessor(WorkflowEngine(MockLLMClient(), tracker))
+
+            try:
+                # When: 按阶段流水处理
+                docs = await processor.process_directory_pipelined(test_dir)
+
+                # Then: 坏文件标记失败，其余文件照常完成
+                assert [d.path.name for d in docs] == ["a.srt", "b.srt"], docs
+                rows = dict(
+                    (Path(path).name, (status, stage))
+                    for path, status, stage in tracker._conn.execute(
+                        "SELECT path, status, stage FROM documents"
+                    )
+                )
+                assert rows["c.srt"] == ("failed", "cleaning"), rows
+                assert rows["a.srt"] == ("done", "completed"), rows
+                assert rows["b.srt"] == ("done", "completed"), rows
+
+                self.passed += 1
+                print("  ✅ PASSED")
+
+            except Exception as e:
+                self.failed += 1
+                print(f"  ❌ FAILED: {e}")
+            finally:
+                import shutil
+
+                tracker.close()
+                shutil.rmtree(test_dir, ignore_errors=True)
+                for suffix in ("", "-wal", "-shm"):
+                    Path(f"{db}{suffix}").unlink(missing_ok=True)
+
+        asyncio.run(run_test())
+
+    def test_llm_response_cache(self):
+        """场景: Reuse cached LLM responses"""
+        print("\n💾 Scenario: Reuse cached LLM responses")
+
+        class CountingLLM:
+            """按提示词回显的客户端，记录真正发出的请求"""
+
+            model = "counting"
+
+            def __init__(self):
+                self.requests = []
+
+            async def generate(self, prompt: str, temperature: float = 0.3) -> str:
+                self.requests.append(prompt)
+                return f"re:{prompt}"
+
+            async def generate_many(self, prompts, temperature: float = 0.3):
+                self.requests.append(list(prompts))
+                return [f"re:{p}" for p in prompts]
+
+            async def stream_generate(self, prompt: str, temperature: float = 0.3):
+                self.requests.append(prompt)
+                for ch in f"re:{prompt}":
+                    yield ch
+
+        async def collect(stream) -> str:
+            return "".join([chunk async for chunk in stream])
+
+        async def run_test():
+            db = Path("/tmp/test_llm_cache.sqlite")
+            inner = CountingLLM()
+            cache = CachingLLMClient(inner, cache_path=str(db), max_size=2)
+
+            try:
+                # Given: 已请求过 a、b
+                await cache.generate("a")
+                await cache.generate("b")
+
+                # When: 批量请求中夹杂命中项和重复项
+                results = await cache.generate_many(["a", "c", "c", "b"])
+
+                # Then: 只有未命中且去重后的提示词交给内层
+                assert results == ["re:a", "re:c", "re:c", "re:b"], results
+                assert inner.requests == ["a", "b", ["c"]], inner.requests
+
+                # Then: 内存 LRU 只留最近 2 条
+                assert len(cache._memory) == 2, f"LRU size: {len(cache._memory)}"
+
+                # Then: 流式结果完整读完后缓存，再次请求直接整段产出
+                assert await collect(cache.stream_generate("s")) == "re:s"
+                assert await collect(cache.stream_generate("s")) == "re:s"
+                assert inner.requests.count("s") == 1, inner.requests
+                cache.close()
+
+                # Then: 新实例从 SQLite 读到全部旧结果，不再请求
+                inner = CountingLLM()
+                cache = CachingLLMClient(inner, cache_path=str(db))
+                for prompt in ["a", "b", "c", "s"]:
+                    assert await cache.generate(prompt) == f"re:{prompt}"
+                assert inner.requests == [], inner.requests
+
+                self.passed += 1
+                print("  ✅ PASSED")
+
+            except Exception as e:
+                self.failed += 1
+                print(f"  ❌ FAILED: {e}")
+            finally:
+                cache.close()
+                for suffix in ("", "-wal", "-shm"):
+                    Path(f"{db}{suffix}").unlink(missing_ok=True)
+
+        asyncio.run(run_test())
+
+    def test_rate_limiting(self):
+        """场景: Limit LLM requests per minute"""
+        print("\n⏱️ Scenario: Limit LLM requests per minute")
+
+        class FakeClock:
+            """sleep 只推进时间，不真正等待"""
+
+            def __init__(self):
+                self.now = 0.0
+                self.sleeps = []
+
+            def __call__(self) -> float:
+                return self.now
+
+            async def sleep(self, seconds: float):
+                self.sleeps.append(round(seconds, 6))
+                self.now += seconds
+
+        class UnpackableLLM(LLMClient):
+            """合并请求的回复无法拆分，迫使客户端逐个重发"""
+
+            def __init__(self):
+                super().__init__(api_key="test", max_batch_chars=10)
+                self.requests = 0
+
+            async def generate(self, prompt: str, temperature: float = 0.3) -> str:
+                self.requests += 1
+                return "无法拆分"
+
+            async def stream_generate(self, prompt: str, temperature: float = 0.3):
+                self.requests += 1
+                yield "流式"
+
+        async def run_test():
+            try:
+                # Given: 每分钟 60 次（每秒补 1 个令牌），桶容量 3
+                clock = FakeClock()
+                limiter = AsyncRateLimiter(
+                    qpm=60, burst=3, clock=clock, sleep=clock.sleep
+                )
+
+                # When/Then: 前 3 次立即通过，第 4 次等 1 秒
+                for _ in range(4):
+                    await limiter.acquire()
+                assert clock.sleeps == [1.0], f"Sleeps: {clock.sleeps}"
+
+                # When/Then: 空闲 10 秒只补满到 3 个
+                clock.now += 10
+                for _ in range(4):
+                    await limiter.acquire()
+                assert clock.sleeps == [1.0, 1.0], f"Sleeps: {clock.sleeps}"
+
+                # Given: 足够的令牌，时间不再流逝
+                clock = FakeClock()
+                limiter = AsyncRateLimiter(
+                    qpm=60, burst=100, clock=clock, sleep=clock.sleep
+                )
+                inner = UnpackableLLM()
+                llm = RateLimitedLLMClient(inner, limiter)
+
+                # When: 3 个提示分成 [a, b] 与 [长提示] 两组，第一组回复拆不开再逐个重发
+                await llm.generate_many(["aaaa", "bbbb", "c" * 20])
+                chunks = [c async for c in llm.stream_generate("s")]
+
+                # Then: 实际发出的每个请求（含流式）各占一个令牌
+                assert chunks == ["流式"], chunks
+                assert inner.requests == 5, f"Requests: {inner.requests}"
+                used = 100 - limiter._tokens
+                assert used == inner.requests, f"Tokens used: {used}"
+
+                self.passed += 1
+                print("  ✅ PASSED")
+
+            except Exception as e:
+                self.failed += 1
+                print(f"  ❌ FAILED: {e}")
+
+        asyncio.run(run_test())
+
     def test_duplicate_merging(self):
         """场景: Detect and merge duplicate knowledge points"""
         print("\n🔍 Scenario: Detect and merge duplicate knowledge points")
@@ -234,6 +899,120 @@ Lecture {i} content""")
 
         asyncio.run(run_test())
 
+    def test_transitive_duplicate_grouping(self):
+        """场景: Group chained near-duplicates together"""
+        print("\n🔗 Scenario: Group chained near-duplicates together")
+
+        # Given: A~B、B~C 相似，但 A 与 C 未达到阈值
+        skill = KnowledgeFusionSkill(MockLLMClient(), similarity_threshold=0.8)
+        points = [
+            KnowledgePoint("Derivative rules", "Power rule and product rule", [], "a"),
+            KnowledgePoint(
+                "Derivative rules basics",
+                "Power rule and product rule basics",
+                [],
+                "b",
+            ),
+            KnowledgePoint(
+                "Derivative rules basics intro",
+                "Power rule and product rule basics intro",
+                [],
+                "c",
+            ),
+            KnowledgePoint("Limit", "Approaching values", [], "d"),
+        ]
+
+        try:
+            # When: 预筛选候选组
+            groups = skill._find_similar_candidates(points)
+
+            # Then: 三者传递归为一组，无关点不入组
+            assert groups == [[0, 1, 2]], f"Unexpected groups: {groups}"
+
+            self.passed += 1
+            print("  ✅ PASSED")
+
+        except Exception as e:
+            self.failed += 1
+            print(f"  ❌ FAILED: {e}")
+
+    def test_similar_pairs_across_lsh_boundary(self):
+        """场景: Find planted duplicates on both sides of the LSH cutoff"""
+        print("\n🎯 Scenario: Find planted duplicates on both sides of the LSH cutoff")
+
+        import random
+        from src import fusion
+
+        # Given: 250 个随机知识点，埋入 3 对标题相同、内容每 3 个字符改 1 个的近重复
+        # （字符 3-gram 几乎全被打散，LSH 难以分到同一桶）
+        rng = random.Random(7)
+        word = lambda k: "".join(
+            rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(k)
+        )
+        points = [KnowledgePoint(word(12), word(150), [], "s") for _ in range(250)]
+        planted = [[5, 150], [190, 210], [199, 249]]
+        for i, j in planted:
+            content = "".join(
+                "#" if k % 3 == 2 else ch for k, ch in enumerate(points[i].content)
+            )
+            points[j] = KnowledgePoint(points[i].title, content, [], "s")
+
+        try:
+            # When: 分别在 200 个点以下和以上预筛选
+            default = KnowledgeFusionSkill(MockLLMClient(), similarity_threshold=0.6)
+            exact = KnowledgeFusionSkill(
+                MockLLMClient(), similarity_threshold=0.6, lsh_min_points=None
+            )
+            below = default._find_similar_candidates(points[:199])
+            above = exact._find_similar_candidates(points)
+
+            # Then: 精确比较时边界两侧埋入的对都能找到
+            assert below == [[5, 150]], f"Below cutoff: {below}"
+            assert above == planted, f"Above cutoff: {above}"
+            if fusion._process is not None:
+                # 装有 rapidfuzz 时默认就走精确的 cdist，不受 LSH 截断影响
+                found = default._find_similar_candidates(points)
+                assert found == planted, f"Default with rapidfuzz: {found}"
+
+            self.passed += 1
+            print("  ✅ PASSED")
+
+        except Exception as e:
+            self.failed += 1
+            print(f"  ❌ FAILED: {e}")
+
+    def test_similarity_cache_threshold(self):
+        """场景: Recompute cached similarity after the threshold changes"""
+        print("\n🗂️  Scenario: Recompute cached similarity after the threshold changes")
+
+        # Given: 长度差距大的一对，在高阈值下会被长度上界直接判 0.0
+        skill = KnowledgeFusionSkill(MockLLMClient(), similarity_threshold=0.95)
+        a = KnowledgePoint("Chain rule", "Differentiate the outer function", [], "a")
+        b = KnowledgePoint(
+            "Chain rule", "Differentiate the outer function " + "x" * 60, [], "b"
+        )
+        # 与 a 标题和前 200 字符相同、只有尾部不同
+        c = KnowledgePoint("Chain rule", a.content + " " * 200 + "tail", [], "c")
+
+        try:
+            # When: 先按高阈值打分，再降低阈值重新打分
+            rejected = skill._calculate_similarity(a, b)
+            skill.similarity_threshold = 0.3
+            rescored = skill._calculate_similarity(a, b)
+
+            # Then: 上界拒绝的 0.0 不会在新阈值下被复用，内容不同的点不共用缓存
+            assert rejected == 0.0, f"Expected bound rejection, got {rejected}"
+            assert rescored == skill._compute_similarity(a, b) > 0.3, rescored
+            skill._calculate_similarity(a, c)
+            assert len(skill._sim_cache) == 3, f"Cache keys: {len(skill._sim_cache)}"
+
+            self.passed += 1
+            print("  ✅ PASSED")
+
+        except Exception as e:
+            self.failed += 1
+            print(f"  ❌ FAILED: {e}")
+
     def test_course_structure(self):
         """场景: Generate course structure from topics"""
         print("\n📖 Scenario: Generate course structure from topics")
@@ -266,6 +1045,181 @@ Lecture {i} content""")
 
         asyncio.run(run_test())
 
+    def test_fused_topic_merging(self):
+        """场景: Merge similar topics from the single-request clustering"""
+        print("\n🧩 Scenario: Merge similar topics from the single-request clustering")
+
+        titles = ["导数定义", "导数的定义", "极限", "积分", "级数", "微分方程"]
+        fused = {
+            "topics": [
+                {
+                    "id": f"topic_{i}",
+                    "title": title,
+                    "point_indices": [i],
+                    "keywords": ["导数", "定义"] if i < 2 else [title],
+                }
+                for i, title in enumerate(titles)
+            ],
+            "course_name": "微积分",
+            "chapters": [
+                {"order": i + 1, "title": title, "topic_ids": [f"topic_{i}"]}
+                for i, title in enumerate(titles)
+            ],
+        }
+        merged = {
+            "merged_topics": [
+                {"id": "topic_d", "title": "导数定义", "original_indices": [0, 1]}
+            ]
+        }
+        chapters = {
+            "course_name": "微积分",
+            "chapters": [
+                {"order": 1, "title": "导数", "topic_ids": ["topic_d"]},
+                {"order": 2, "title": "其他", "topic_ids": ["topic_2", "topic_3"]},
+            ],
+        }
+
+        class FusedLLM:
+            """一次请求返回主题 + 章节的模拟客户端"""
+
+            def __init__(self):
+                self.prompts = []
+
+            async def generate(self, prompt: str, temperature: float = 0.3) -> str:
+                self.prompts.append(prompt)
+                if "point_indices" in prompt:
+                    return json.dumps(fused, ensure_ascii=False)
+                if "合并" in prompt:
+                    return json.dumps(merged, ensure_ascii=False)
+                return json.dumps(chapters, ensure_ascii=False)
+
+        async def run_test():
+            # Given: 一批装得下的知识点，融合请求返回了两个相似主题
+            llm = FusedLLM()
+            skill = CrossDocumentClusteringSkill(llm)
+            points = [KnowledgePoint(t, t, [], "file1.srt") for t in titles]
+
+            try:
+                # When: 聚类
+                structure = await skill.cluster(points)
+
+                # Then: 相似主题被合并，章节按合并后的主题重建
+                assert len(llm.prompts) == 3, f"Requests: {len(llm.prompts)}"
+                topic_ids = [t.id for t in structure.topics]
+                assert "topic_d" in topic_ids, f"Topics: {topic_ids}"
+                assert "topic_0" not in topic_ids, f"Topics: {topic_ids}"
+                first = structure.chapters[0]
+                assert first["point_count"] == 2, f"Chapter: {first}"
+
+                self.passed += 1
+                print("  ✅ PASSED")
+
+            except Exception as e:
+                self.failed += 1
+                print(f"  ❌ FAILED: {e}")
+
+        asyncio.run(run_test())
+
+    def test_topic_batch_retry(self):
+        """场景: Retry each topic-identification batch on transient errors"""
+        print(
+            "\n🔁 Scenario: Retry each topic-identification batch on transient errors"
+        )
+
+        class FlakyLLM:
+            """每个提示第一次请求都连接失败；带 generate_many 但不应被用到"""
+
+            def __init__(self):
+                self.attempts = {}
+                self.many_calls = 0
+
+            async def generate(self, prompt: str, temperature: float = 0.3) -> str:
+                self.attempts[prompt] = self.attempts.get(prompt, 0) + 1
+                if self.attempts[prompt] == 1:
+                    raise httpx.ConnectError("connection reset")
+                if "point_indices" in prompt:
+                    return '{"topics": [{"id": "t", "title": "主题", "point_indices": [0, 1]}]}'
+                return '{"course_name": "课程", "chapters": [{"order": 1, "title": "章", "topic_ids": ["t"]}]}'
+
+            async def generate_many(self, prompts, temperature: float = 0.3):
+                self.many_calls += 1
+                raise AssertionError("topic batches should not be packed")
+
+        async def run_test():
+            # Given: 4 个知识点分成 2 批
+            llm = FlakyLLM()
+            skill = CrossDocumentClusteringSkill(llm, max_points_per_batch=2)
+            points = [
+                KnowledgePoint(f"知识点{i}", f"内容{i}", [], "file1.srt")
+                for i in range(4)
+            ]
+
+            try:
+                # When: 聚类
+                structure = await skill.cluster(points)
+
+                # Then: 每批各自重试一次后成功，没有走合并请求
+                topic_prompts = [p for p in llm.attempts if "point_indices" in p]
+                assert len(topic_prompts) == 2, f"Batches: {len(topic_prompts)}"
+                assert all(llm.attempts[p] == 2 for p in topic_prompts), llm.attempts
+                assert llm.many_calls == 0, f"generate_many calls: {llm.many_calls}"
+                assert len(structure.topics) == 2, f"Topics: {structure.topics}"
+
+                self.passed += 1
+                print("  ✅ PASSED")
+
+            except Exception as e:
+                self.failed += 1
+                print(f"  ❌ FAILED: {e}")
+
+        asyncio.run(run_test())
+
+    def test_json_salvage(self):
+        """场景: Salvage the JSON object from a chatty LLM reply"""
+        print("\n🧩 Scenario: Salvage the JSON object from a chatty LLM reply")
+
+        from src.clustering import _match_brace
+
+        # Given: 字符串里带花括号和转义引号、代码块包裹、前置说明、第一个 { 不是 JSON
+        replies = [
+            (
+                '{"title": "set {a, b}", "note": "say \\"}\\" ok"}',
+                {"title": "set {a, b}", "note": 'say "}" ok'},
+            ),
+            (
+                '```json\n{"points": [{"title": "Limit"}]}\n```',
+                {"points": [{"title": "Limit"}]},
+            ),
+            ('Here is the result:\n{"a": {"b": 2}}\nHope this helps!', {"a": {"b": 2}}),
+            ('Use the {x} notation first. {"a": 1} and {"b": 2}', {"a": 1}),
+        ]
+        parsers = [
+            CrossDocumentClusteringSkill(MockLLMClient())._parse_json_response,
+            KnowledgeFusionSkill(MockLLMClient())._parse_json_response,
+        ]
+
+        try:
+            # When / Then: 括号匹配跳过字符串内的花括号，停在对象末尾
+            text = replies[0][0]
+            assert _match_brace(text, 0) == len(text) - 1, _match_brace(text, 0)
+            text = replies[2][0]
+            start = text.find("{")
+            assert text[start : _match_brace(text, start) + 1] == '{"a": {"b": 2}}'
+            assert _match_brace('{"a": "}"', 0) == -1, "Unclosed object matched"
+
+            # When / Then: 两个解析器都取出第一个完整对象，没有对象时返回空字典
+            for parse in parsers:
+                for text, expected in replies:
+                    assert parse(text) == expected, f"{parse.__qualname__}: {text!r}"
+                assert parse("No JSON here {") == {}, parse.__qualname__
+
+            self.passed += 1
+            print("  ✅ PASSED")
+
+        except Exception as e:
+            self.failed += 1
+            print(f"  ❌ FAILED: {e}")
+
     def test_markdown_export(self):
         """场景: Generate Markdown textbook"""
         print("\n📝 Scenario: Generate Markdown textbook")
@@ -401,6 +1355,107 @@ Lecture {i} content""")
         finally:
             test_file.unlink(missing_ok=True)
 
+    def test_log_monitoring(self):
+        """场景: Classify workflow log lines"""
+        print("\n🔍 Scenario: Classify workflow log lines")
+
+        # Given: 混合级别的日志（大小写不一，一行同时命中多类）
+        log = "\n".join(
+            [
+                "[INFO] Starting agent",
+                "[Warning] Type mismatch detected",
+                "[ERROR] Failed to connect to API",
+                "[WARN] 读取配置中的密码 timeout",
+                "[info] done",
+            ]
+        )
+
+        try:
+            # When: 分析日志
+            monitor = WorkflowMonitor()
+            report = monitor.analyze_log(log)
+
+            # Then: 每行只按最高级别计一次，事件按行序排列
+            levels = [e.level for e in monitor.events]
+            assert levels == ["WARNING", "ERROR", "CRITICAL"], f"Levels: {levels}"
+            assert report.should_halt, "Unauthorized access should halt"
+
+            self.passed += 1
+            print("  ✅ PASSED")
+
+        except Exception as e:
+            self.failed += 1
+            print(f"  ❌ FAILED: {e}")
+
+    def test_status_stream(self):
+        """场景: Push status over SSE when the database changes"""
+        print("\n📡 Scenario: Push status over SSE when the database changes")
+
+        import os
+        import threading
+        import time
+        from fastapi.testclient import TestClient
+
+        # 服务按工作目录查找 web/ 并创建 uploads/，在临时目录里导入
+        workdir = Path("/tmp/test_api")
+        (workdir / "web").mkdir(parents=True, exist_ok=True)
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            from src import api
+        finally:
+            os.chdir(cwd)
+
+        db = workdir / "test_api.db"
+        saved = (api.DB_PATH, api._db, api.STATUS_CHECK_INTERVAL, api.STATUS_STREAM_TTL)
+        api.DB_PATH, api._db = str(db), None
+        api.STATUS_CHECK_INTERVAL, api.STATUS_STREAM_TTL = 0.05, 1.0
+        tracker = ProgressTracker(str(db))
+
+        try:
+            # Given: 一个待处理文档，推送开始后处理进程提交完成状态
+            doc_id = tracker.add_document("/videos/a.srt")
+            timer = threading.Timer(
+                0.3, tracker.update_status, (doc_id, "done", "completed")
+            )
+
+            # When: 订阅状态推送直到服务端结束连接
+            started = time.monotonic()
+            timer.start()
+            with TestClient(api.app) as client:
+                body = client.get("/api/status/stream").text
+            elapsed = time.monotonic() - started
+            timer.join()
+
+            events = [
+                json.loads(line[len("data: ") :])
+                for line in body.splitlines()
+                if line.startswith("data: ")
+            ]
+
+            # Then: 连接时推送一次，提交后再推送一次，空闲时不重复推送，到时自动结束
+            assert [(e["pending"], e["done"]) for e in events] == [
+                (1, 0),
+                (0, 1),
+            ], f"Events: {events}"
+            assert elapsed < 3, f"Stream did not end: {elapsed:.1f}s"
+
+            self.passed += 1
+            print("  ✅ PASSED")
+
+        except Exception as e:
+            self.failed += 1
+            print(f"  ❌ FAILED: {e}")
+        finally:
+            tracker.close()
+            if api._db is not None:
+                api._db.close()
+            api.DB_PATH, api._db, api.STATUS_CHECK_INTERVAL, api.STATUS_STREAM_TTL = (
+                saved
+            )
+            for suffix in ("", "-wal", "-shm"):
+                Path(f"{db}{suffix}").unlink(missing_ok=True)
+
     def print_summary(self):
         """打印汇总"""
         print("\n" + "=" * 60)
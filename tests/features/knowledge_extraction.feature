@@ -28,6 +28,22 @@ Feature: Video Knowledge Extraction Pipeline
     And the knowledge point should have a title
     And the knowledge point should have content
 
+  Scenario: Parse timestamps to seconds and skip malformed entries
+    Given I have a subtitle file with a bad index, a bad timestamp and an entry without text
+    And one valid entry has two lines of text
+    When I parse it from a string and from a CRLF file
+    Then only the two valid entries should be returned
+    And the multi-line text should be joined with a space
+    And start_s and end_s should hold the timestamps in seconds
+
+  Scenario: Parse subtitles in the desktop GUI
+    Given I have a subtitle file with whitespace-only separator lines and malformed blocks
+    When I parse it with the GUI parser both from a string and from the open file
+    Then both should return the same entries
+    And a whitespace-only line should end the previous entry
+    And blocks without a sequence number, timestamp or text should be skipped
+    And a truncated preview should still report the full character count
+
   Scenario: Clean noise from lecture content
     Given I have a document with filler words:
       """
@@ -41,6 +57,14 @@ Feature: Video Knowledge Extraction Pipeline
     And the output should not contain "you know"
     And the core content should be preserved
 
+  Scenario: Clean text exactly like the original cleaner
+    Given I have texts with English fillers, verbal tics and opener phrases
+    And some opener phrases are split across a line break or formed by removing a tic
+    And some texts use CRLF line endings or contain no filler at all
+    When I clean each text whole, line by line and in line-aligned blocks of every size
+    Then every result should equal the original pattern-by-pattern cleaner
+    And every block but the last should end at a newline
+
   Scenario: Extract structured knowledge points
     Given I have cleaned lecture content about "derivatives"
     When I run the knowledge extraction stage
@@ -49,6 +73,16 @@ Feature: Video Knowledge Extraction Pipeline
     And each point should have a "content" field
     And the content should contain relevant information about derivatives
 
+  Scenario: Track document progress in SQLite
+    Given I have registered the documents "a.srt" and "b.srt"
+    When I register "a.srt" again
+    Then I should get the original id of "a.srt"
+    When I save two knowledge points for "a.srt" in one batch
+    Then both points should be stored with their video markers as JSON
+    When I bulk update the status of both documents and one row has no stage
+    Then that document should keep its previous stage
+    And the other document should get the given stage
+
   Scenario: Mark video references
     Given I have a knowledge point about "geometric interpretation"
     And the original subtitle mentioned "see this graph"
@@ -57,6 +91,23 @@ Feature: Video Knowledge Extraction Pipeline
     And the marker should have a timestamp
     And the marker should describe the visual content
 
+  Scenario: Extract knowledge with the async LLM clients
+    Given I have async Ollama and API clients created with use_async
+    When I extract knowledge from several texts concurrently
+    Then each streamed reply should be parsed into the full knowledge JSON
+    And a rejected API key should return an empty "API 错误" result
+    And the async clients should not be subclasses of the sync clients
+
+  Scenario: Reuse extraction results in the desktop GUI
+    Given the desktop GUI keeps at most 2 extraction results
+    When I extract the same text twice
+    Then the LLM should be asked only once
+    And the cached result should be shown again
+    When the LLM returns an empty result
+    Then that result should not be cached
+    When more texts than the cache holds are extracted
+    Then the least recently used result should be evicted
+
   # ==========================================
   # Stage 2: Cross-Document Processing
   # ==========================================
@@ -72,6 +123,36 @@ Feature: Video Knowledge Extraction Pipeline
     And the processing should complete within 60 seconds
     And I should get knowledge points from all files
 
+  Scenario: Bundle several documents into one request per stage
+    Given I have 2 long documents that each exceed the client's batch budget on their own
+    When I process them together as one bundle
+    Then the noise reduction stage should send a single packed request
+    And the structuring stage should send a single packed request
+    And each document should get its own knowledge points
+
+  Scenario: Process a directory stage by stage
+    Given I have a directory with 2 valid SRT files and 1 file that is not valid UTF-8
+    When I run batch processing with the --pipelined option
+    Then the 2 valid files should be processed
+    And the invalid file should be marked failed at the "cleaning" stage
+    And the valid files should be marked done
+
+  Scenario: Reuse cached LLM responses
+    Given the LLM client is wrapped in a response cache backed by SQLite
+    And the prompts "a" and "b" have already been answered
+    When I request "a", "c", "c" and "b" in one batch
+    Then only "c" should be sent to the LLM, once
+    And a streamed reply should be cached once the stream completes
+    And a new cache on the same file should answer all prompts without requests
+
+  Scenario: Limit LLM requests per minute
+    Given a rate limiter allowing 60 requests per minute with a burst of 3
+    When I make 4 requests at once
+    Then the first 3 should pass immediately
+    And the 4th should wait 1 second for a new token
+    And an idle period should refill the bucket only up to the burst size
+    And every request actually sent, including packed, retried and streamed ones, should take one token
+
   Scenario: Detect and merge duplicate knowledge points
     Given I have knowledge points from multiple files:
       | title               | content                           | source    |
@@ -84,6 +165,34 @@ Feature: Video Knowledge Extraction Pipeline
     And "Limit Concept" should remain separate
     And the merged point should contain information from both sources
 
+  Scenario: Group chained near-duplicates together
+    Given I have knowledge points where A is similar to B and B is similar to C:
+      | title                         | content                                  | source |
+      | Derivative rules              | Power rule and product rule              | a      |
+      | Derivative rules basics       | Power rule and product rule basics       | b      |
+      | Derivative rules basics intro | Power rule and product rule basics intro | c      |
+      | Limit                         | Approaching values                       | d      |
+    And A and C are below the similarity threshold of 0.8
+    When I look for duplicate candidates
+    Then "Derivative rules", "Derivative rules basics" and "Derivative rules basics intro" should form one group
+    And "Limit" should not be in any group
+
+  Scenario: Find planted duplicates on both sides of the LSH cutoff
+    Given I have 250 random knowledge points with 3 planted near-duplicate pairs
+    And the pairs share a title but almost no character 3-grams
+    And one pair lies below index 200 and two straddle or lie above it
+    When I look for duplicate candidates in the first 199 points and in all 250
+    Then the pair below the cutoff should be found with the default settings
+    And all planted pairs should be found when LSH is disabled
+    And all planted pairs should be found by default when rapidfuzz is installed
+
+  Scenario: Recompute cached similarity after the threshold changes
+    Given two knowledge points whose length bound is below a threshold of 0.95
+    When I score them, lower the threshold to 0.3 and score them again
+    Then the first score should be the 0.0 bound rejection
+    And the second score should be the fully computed similarity
+    And points that only differ after 200 characters should get separate cache entries
+
   Scenario: Generate course structure from topics
     Given I have the following knowledge points:
       | title                  | category    |
@@ -98,6 +207,30 @@ Feature: Video Knowledge Extraction Pipeline
     And "Foundation" should come before "Methods"
     And "Applications" should be the last chapter
 
+  Scenario: Merge similar topics from the single-request clustering
+    Given I have 6 knowledge points that fit in one clustering batch
+    And the clustering request returns topics and chapters together
+    And two of the returned topics share the keywords "导数" and "定义"
+    When I run the clustering stage
+    Then the two similar topics should be merged into one
+    And the chapters should be rebuilt from the merged topics
+    And the merged chapter should contain the points of both topics
+
+  Scenario: Retry each topic-identification batch on transient errors
+    Given I have 4 knowledge points split into 2 clustering batches
+    And the LLM fails the first request for every prompt with a connection error
+    When I run the clustering stage
+    Then each batch should be retried once and succeed
+    And the batches should not be packed into a generate_many request
+
+  Scenario: Salvage the JSON object from a chatty LLM reply
+    Given I have LLM replies with braces inside strings, a fenced code block, leading prose
+    And a reply whose first "{" does not start a JSON object
+    When I parse them with the clustering and fusion JSON parsers
+    Then both should return the first complete JSON object of each reply
+    And brace matching should ignore braces inside strings
+    And a reply without a JSON object should give an empty dict
+
   # ==========================================
   # Stage 3: Textbook Generation
   # ==========================================
@@ -148,6 +281,29 @@ Feature: Video Knowledge Extraction Pipeline
     And the processing should continue with other files
     And the corrupted file should be skipped
 
+  Scenario: Classify workflow log lines
+    Given I have a workflow log with mixed-case levels:
+      """
+      [INFO] Starting agent
+      [Warning] Type mismatch detected
+      [ERROR] Failed to connect to API
+      [WARN] 读取配置中的密码 timeout
+      [info] done
+      """
+    When I analyze the log with the workflow monitor
+    Then I should get events with levels "WARNING", "ERROR" and "CRITICAL" in line order
+    And a line matching several categories should be counted once at its highest level
+    And the report should recommend halting the workflow
+
+  Scenario: Push status over SSE when the database changes
+    Given I have one pending document in the progress database
+    And the status stream ends after 1 second
+    When I subscribe to "/api/status/stream" and the document is marked done meanwhile
+    Then I should receive the pending status when connecting
+    And I should receive the done status after the commit
+    And no status should be repeated while nothing changes
+    And the server should end the stream on its own
+
   Scenario: Handle API rate limiting
     Given the API is rate limited
     When I process documents